@@ -7,20 +7,56 @@ WexTweaks - Универсальный оптимизатор Windows
 
 import os
 import sys
-import ctypes
-import shutil
+import atexit
 import time
 import json
-import platform
-import subprocess
+import importlib
+import contextlib
 import datetime
-import psutil
-import winreg
-import tempfile
-import glob
-from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+import heapq
+import math
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
 import re
+import threading
+from array import array
+from functools import partial
+
+
+class _LazyModule:
+    """Модуль, который импортируется при первом обращении к его атрибутам"""
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+IS_WINDOWS = sys.platform == "win32"
+
+# Тяжёлые модули нужны не в каждом запуске - меню не ждёт их загрузки
+asyncio = _LazyModule("asyncio")
+futures = _LazyModule("concurrent.futures")
+psutil = _LazyModule("psutil")
+ctypes = _LazyModule("ctypes")
+subprocess = _LazyModule("subprocess")
+shutil = _LazyModule("shutil")
+tempfile = _LazyModule("tempfile")
+platform = _LazyModule("platform")
+hashlib = _LazyModule("hashlib")
+fnmatch = _LazyModule("fnmatch")
+argparse = _LazyModule("argparse")
+# Только для монитора, замеров, сети, DNS и схемы питания
+csv = _LazyModule("csv")
+random = _LazyModule("random")
+socket = _LazyModule("socket")
+socketserver = _LazyModule("socketserver")
+struct = _LazyModule("struct")
+uuid = _LazyModule("uuid")
 
 # Проверка и импорт colorama
 try:
@@ -32,94 +68,3948 @@ except ImportError:
     print("Установите colorama: pip install colorama")
     COLORAMA_AVAILABLE = False
 
-if COLORAMA_AVAILABLE:
-    class Colors:
-        RED = Fore.RED
-        GREEN = Fore.GREEN
-        YELLOW = Fore.YELLOW
-        BLUE = Fore.BLUE
-        MAGENTA = Fore.MAGENTA
-        CYAN = Fore.CYAN
-        WHITE = Fore.WHITE
-        RESET = Fore.RESET
-else:
-    class Colors:
-        RED = ''
-        GREEN = ''
-        YELLOW = ''
-        BLUE = ''
-        MAGENTA = ''
-        CYAN = ''
-        WHITE = ''
-        RESET = ''
+if COLORAMA_AVAILABLE:
+    class Colors:
+        RED = Fore.RED
+        GREEN = Fore.GREEN
+        YELLOW = Fore.YELLOW
+        BLUE = Fore.BLUE
+        MAGENTA = Fore.MAGENTA
+        CYAN = Fore.CYAN
+        WHITE = Fore.WHITE
+        RESET = Fore.RESET
+else:
+    class Colors:
+        RED = ''
+        GREEN = ''
+        YELLOW = ''
+        BLUE = ''
+        MAGENTA = ''
+        CYAN = ''
+        WHITE = ''
+        RESET = ''
+
+# ========== РЕЕСТР ==========
+
+# Типы значений реестра (числа совпадают с константами winreg)
+REG_TYPES = {
+    "REG_SZ": 1,
+    "REG_EXPAND_SZ": 2,
+    "REG_BINARY": 3,
+    "REG_DWORD": 4,
+    "REG_MULTI_SZ": 7,
+    "REG_QWORD": 11,
+}
+
+# Сокращения разделов, которые понимает reg.exe
+REG_HIVES = {
+    "HKCU": "HKEY_CURRENT_USER",
+    "HKLM": "HKEY_LOCAL_MACHINE",
+    "HKCR": "HKEY_CLASSES_ROOT",
+    "HKU": "HKEY_USERS",
+    "HKCC": "HKEY_CURRENT_CONFIG",
+}
+
+SERVICES_KEY = r"SYSTEM\CurrentControlSet\Services"
+SERVICE_DISABLED = 4
+
+_REG_TOKEN_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+class RegTweak(NamedTuple):
+    """Одно значение реестра: раздел, ключ, имя, тип и данные"""
+    hive: str
+    key: str
+    value: str
+    type: str
+    data: object
+
+
+def _split_command(command: str) -> List[str]:
+    """Разбиение командной строки в стиле cmd.exe (кавычки без экранирования)"""
+    return [m.group(1) if m.group(1) is not None else m.group(2)
+            for m in _REG_TOKEN_RE.finditer(command)]
+
+
+def _convert_reg_data(reg_type: str, raw: Optional[str]):
+    """Приведение строки из /d к типу значения реестра"""
+    raw = raw if raw is not None else ""
+    if reg_type in ("REG_DWORD", "REG_QWORD"):
+        if not raw:
+            return 0
+        return int(raw, 16) if raw.lower().startswith("0x") else int(raw)
+    if reg_type == "REG_BINARY":
+        if len(raw) % 2:
+            raw = "0" + raw
+        return bytes.fromhex(raw)
+    if reg_type == "REG_MULTI_SZ":
+        return raw.split("\\0") if raw else []
+    return raw
+
+
+def parse_reg_add(command: str) -> Optional[RegTweak]:
+    """Разбор команды 'reg add' в RegTweak (None - если это не запись значения)"""
+    tokens = _split_command(command)
+    if len(tokens) < 3 or tokens[0].lower() != "reg" or tokens[1].lower() != "add":
+        return None
+    
+    hive, _, key = tokens[2].partition("\\")
+    hive = REG_HIVES.get(hive.upper(), hive.upper())
+    if hive not in REG_HIVES.values():
+        return None
+    
+    value = None
+    reg_type = "REG_SZ"
+    raw = None
+    i = 3
+    while i < len(tokens):
+        option = tokens[i].lower()
+        if option in ("/v", "/t", "/d") and i + 1 < len(tokens):
+            arg = tokens[i + 1]
+            if option == "/v":
+                value = arg
+            elif option == "/t":
+                reg_type = arg.upper()
+            else:
+                raw = arg
+            i += 2
+            continue
+        if option == "/ve":
+            value = ""
+        elif option != "/f":
+            # /s, /reg:32 и прочие редкие ключи оставляем reg.exe
+            return None
+        i += 1
+    
+    if value is None or reg_type not in REG_TYPES:
+        return None
+    try:
+        data = _convert_reg_data(reg_type, raw)
+    except ValueError:
+        return None
+    return RegTweak(hive, key, value, reg_type, data)
+
+
+def reg_value_key(tweak: RegTweak) -> Tuple[str, str, str]:
+    """Ключ значения реестра без учёта регистра"""
+    return (tweak.hive, tweak.key.lower(), tweak.value.lower())
+
+
+def group_by_key(tweaks: List[RegTweak]) -> "OrderedDict[Tuple[str, str], List[RegTweak]]":
+    """Группировка значений по ключу с сохранением порядка (ключи без учёта регистра)"""
+    groups = OrderedDict()
+    for tweak in tweaks:
+        groups.setdefault((tweak.hive, tweak.key.lower()), []).append(tweak)
+    return groups
+
+
+class RegistryBackend:
+    """Базовый интерфейс доступа к реестру"""
+    name = "base"
+    
+    def create_key(self, hive: str, key: str):
+        """Открыть ключ на запись (создать, если его нет)"""
+        raise NotImplementedError
+    
+    def open_key(self, hive: str, key: str):
+        """Открыть ключ на чтение (None, если его нет)"""
+        raise NotImplementedError
+    
+    def set_value(self, handle, value: str, reg_type: str, data):
+        raise NotImplementedError
+    
+    def query_value(self, handle, value: str) -> Optional[Tuple[object, str]]:
+        """Прочитать значение: (данные, тип) или None, если его нет"""
+        raise NotImplementedError
+    
+    def delete_value(self, handle, value: str):
+        """Удалить значение (ключ открыт через create_key), отсутствующее - не ошибка"""
+        raise NotImplementedError
+    
+    def close_key(self, handle):
+        pass
+
+
+class WinRegistryBackend(RegistryBackend):
+    """Прямая работа с реестром Windows через winreg"""
+    name = "winreg"
+    
+    def __init__(self):
+        # winreg есть только в Windows - загружаем его вместе с бэкендом
+        winreg = self._winreg = importlib.import_module("winreg")
+        # reg.exe пишет в 64-битное представление реестра - делаем так же
+        self._view = getattr(winreg, "KEY_WOW64_64KEY", 0)
+        self._type_names = {number: name for name, number in REG_TYPES.items()}
+    
+    def create_key(self, hive: str, key: str):
+        winreg = self._winreg
+        return winreg.CreateKeyEx(getattr(winreg, hive), key, 0,
+                                  winreg.KEY_SET_VALUE | winreg.KEY_QUERY_VALUE | self._view)
+    
+    def open_key(self, hive: str, key: str):
+        try:
+            return self._winreg.OpenKeyEx(getattr(self._winreg, hive), key, 0, self._winreg.KEY_READ | self._view)
+        except FileNotFoundError:
+            return None
+    
+    def set_value(self, handle, value: str, reg_type: str, data):
+        # Редкие типы (REG_NONE, REG_LINK...) query_value возвращает номером - пишем их обратно так же
+        type_id = REG_TYPES[reg_type] if reg_type in REG_TYPES else int(reg_type)
+        self._winreg.SetValueEx(handle, value, 0, type_id, data)
+    
+    def query_value(self, handle, value: str) -> Optional[Tuple[object, str]]:
+        try:
+            data, type_id = self._winreg.QueryValueEx(handle, value)
+        except FileNotFoundError:
+            return None
+        return data, self._type_names.get(type_id, str(type_id))
+    
+    def delete_value(self, handle, value: str):
+        try:
+            self._winreg.DeleteValue(handle, value)
+        except FileNotFoundError:
+            pass
+    
+    def close_key(self, handle):
+        handle.Close()
+
+
+class MemoryRegistryBackend(RegistryBackend):
+    """Реестр в памяти - для тестов и запуска вне Windows"""
+    name = "memory"
+    
+    def __init__(self):
+        self.keys: Dict[Tuple[str, str], Dict[str, Tuple[object, str]]] = {}
+        self.opened = 0
+        self.writes = 0
+    
+    def create_key(self, hive: str, key: str):
+        self.opened += 1
+        return self.keys.setdefault((hive, key.lower()), {})
+    
+    def open_key(self, hive: str, key: str):
+        self.opened += 1
+        return self.keys.get((hive, key.lower()))
+    
+    def set_value(self, handle, value: str, reg_type: str, data):
+        self.writes += 1
+        handle[value.lower()] = (data, reg_type)
+    
+    def query_value(self, handle, value: str) -> Optional[Tuple[object, str]]:
+        return handle.get(value.lower())
+    
+    def delete_value(self, handle, value: str):
+        self.writes += 1
+        handle.pop(value.lower(), None)
+
+
+def create_registry_backend() -> RegistryBackend:
+    """Выбор бэкенда реестра для текущей платформы"""
+    if IS_WINDOWS:
+        return WinRegistryBackend()
+    return MemoryRegistryBackend()
+
+
+def apply_registry_tweaks(backend: RegistryBackend,
+                          tweaks: List[RegTweak]) -> List[Tuple[RegTweak, Optional[str]]]:
+    """Запись значений: каждый ключ открывается один раз. Возвращает (tweak, ошибка или None)"""
+    results = []
+    for (hive, _), group in group_by_key(tweaks).items():
+        try:
+            handle = backend.create_key(hive, group[0].key)
+        except OSError as e:
+            results.extend((tweak, str(e)) for tweak in group)
+            continue
+        try:
+            for tweak in group:
+                try:
+                    backend.set_value(handle, tweak.value, tweak.type, tweak.data)
+                    results.append((tweak, None))
+                except (OSError, TypeError, ValueError, KeyError) as e:
+                    results.append((tweak, str(e)))
+        finally:
+            backend.close_key(handle)
+    return results
+
+
+def read_registry_values(backend: RegistryBackend,
+                         tweaks: List[RegTweak]) -> List[Optional[Tuple[object, str]]]:
+    """Пакетное чтение текущих значений: каждый ключ открывается один раз"""
+    current = {}
+    for (hive, _), group in group_by_key(tweaks).items():
+        try:
+            handle = backend.open_key(hive, group[0].key)
+        except OSError:
+            handle = None
+        if handle is None:
+            continue
+        try:
+            for tweak in group:
+                try:
+                    current[reg_value_key(tweak)] = backend.query_value(handle, tweak.value)
+                except OSError:
+                    pass
+        finally:
+            backend.close_key(handle)
+    return [current.get(reg_value_key(tweak)) for tweak in tweaks]
+
+
+def service_start_tweak(service: str) -> RegTweak:
+    """Тип запуска службы в реестре (Start = 4 - служба отключена)"""
+    return RegTweak("HKEY_LOCAL_MACHINE", SERVICES_KEY + "\\" + service, "Start", "REG_DWORD", SERVICE_DISABLED)
+
+
+def delete_registry_values(backend: RegistryBackend,
+                           tweaks: List[RegTweak]) -> List[Tuple[RegTweak, Optional[str]]]:
+    """Удаление значений: каждый ключ открывается один раз. Нет ключа - нечего удалять"""
+    results = []
+    for (hive, _), group in group_by_key(tweaks).items():
+        try:
+            handle = backend.open_key(hive, group[0].key)
+            if handle is not None:
+                # Ключ есть - переоткрываем на запись (create_key не создаст лишнего)
+                backend.close_key(handle)
+                handle = backend.create_key(hive, group[0].key)
+        except OSError as e:
+            results.extend((tweak, str(e)) for tweak in group)
+            continue
+        if handle is None:
+            results.extend((tweak, None) for tweak in group)
+            continue
+        try:
+            for tweak in group:
+                try:
+                    backend.delete_value(handle, tweak.value)
+                    results.append((tweak, None))
+                except OSError as e:
+                    results.append((tweak, str(e)))
+        finally:
+            backend.close_key(handle)
+    return results
+
+
+BACKUP_FORMAT = "wextweaks-registry"
+BACKUP_VERSION = 1
+
+
+class RegistryBackup:
+    """Снимок значений реестра, которые затрагивает план: прежние данные или отметка, что значения не было"""
+    
+    def __init__(self, values: List[RegTweak], meta: Optional[Dict] = None):
+        # type и data равны None - значения до оптимизации не было, при восстановлении оно удаляется
+        self.values = values
+        self.meta = meta or {}
+    
+    def __len__(self) -> int:
+        return len(self.values)
+    
+    @classmethod
+    def capture(cls, backend: RegistryBackend, tweaks: List[RegTweak], **meta) -> "RegistryBackup":
+        """Пакетное чтение текущих значений (каждое значение - один раз)"""
+        unique = list(OrderedDict((reg_value_key(t), t) for t in tweaks).values())
+        values = []
+        for tweak, current in zip(unique, read_registry_values(backend, unique)):
+            data, reg_type = current if current is not None else (None, None)
+            values.append(RegTweak(tweak.hive, tweak.key, tweak.value, reg_type, data))
+        return cls(values, meta)
+    
+    def restore(self, backend: RegistryBackend) -> List[Tuple[RegTweak, Optional[str]]]:
+        """Возврат прежних данных и удаление значений, которых раньше не было"""
+        present = [t for t in self.values if t.type is not None]
+        absent = [t for t in self.values if t.type is None]
+        return apply_registry_tweaks(backend, present) + delete_registry_values(backend, absent)
+    
+    @staticmethod
+    def _encode(data):
+        return data.hex() if isinstance(data, bytes) else data
+    
+    def encode_keys(self) -> List:
+        """Компактный формат: значения сгруппированы по ключам, [имя, тип, данные]"""
+        keys = []
+        for (hive, _), group in group_by_key(self.values).items():
+            keys.append([hive, group[0].key, [[t.value, t.type, self._encode(t.data)] for t in group]])
+        return keys
+    
+    @staticmethod
+    def decode_keys(keys: List) -> List[RegTweak]:
+        values = []
+        for hive, key, items in keys:
+            for value, reg_type, data in items:
+                # Двоичные данные и значения редких типов (тип записан номером) хранятся в hex
+                if data is not None and (reg_type == "REG_BINARY" or str(reg_type).isdigit()):
+                    data = bytes.fromhex(data)
+                values.append(RegTweak(hive, key, value, reg_type, data))
+        return values
+    
+    def as_dict(self) -> Dict:
+        return {"format": BACKUP_FORMAT, "version": BACKUP_VERSION, "meta": self.meta, "keys": self.encode_keys()}
+    
+    def save(self, path: str):
+        tmp = path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+    
+    @classmethod
+    def load(cls, path: str) -> "RegistryBackup":
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+        if raw.get("format") != BACKUP_FORMAT or raw.get("version") != BACKUP_VERSION:
+            raise ValueError(f"{path}: неизвестный формат бэкапа {raw.get('format')} v{raw.get('version')}")
+        return cls(cls.decode_keys(raw["keys"]), raw.get("meta"))
+
+
+# ========== СВЕДЕНИЯ О СИСТЕМЕ ==========
+
+CURRENT_VERSION_KEY = r"SOFTWARE\Microsoft\Windows NT\CurrentVersion"
+FACTS_CACHE_FILE = "wextweaks_facts.json"
+
+
+def os_build() -> str:
+    """Сборка ОС без обращения к реестру (для проверки кэша сведений)"""
+    getwindowsversion = getattr(sys, "getwindowsversion", None)
+    if getwindowsversion is not None:
+        return str(getwindowsversion().build)
+    return platform.release()
+
+
+def _stub_current_version(registry: RegistryBackend):
+    """Значения ключа CurrentVersion для запуска вне Windows"""
+    apply_registry_tweaks(registry, [
+        RegTweak("HKEY_LOCAL_MACHINE", CURRENT_VERSION_KEY, name, "REG_SZ", value)
+        for name, value in (("ProductName", "Windows 10 Pro"), ("CurrentBuildNumber", "19045"),
+                            ("EditionID", "Professional"))])
+
+
+class SystemFacts:
+    """Сведения о системе: собираются при первом обращении и хранятся на диске,
+    пока не сменились время загрузки или сборка ОС"""
+    
+    VERSION = 1
+    
+    def __init__(self, registry: RegistryBackend, cache_file: Optional[str] = FACTS_CACHE_FILE):
+        self.registry = registry
+        self.cache_file = cache_file
+        self.probes = 0  # сколько раз опрашивалась система (для бенчмарка)
+        self._facts: Optional[Dict] = None
+        self._current_version: Optional[Dict[str, object]] = None
+    
+    @staticmethod
+    def cache_key() -> List:
+        return [int(psutil.boot_time()), os_build()]
+    
+    def current_version(self) -> Dict[str, object]:
+        """ProductName, CurrentBuildNumber и EditionID - одним открытием ключа CurrentVersion"""
+        if self._current_version is None:
+            names = ("ProductName", "CurrentBuildNumber", "EditionID")
+            values = read_registry_values(self.registry, [
+                RegTweak("HKEY_LOCAL_MACHINE", CURRENT_VERSION_KEY, name, "REG_SZ", None) for name in names])
+            self._current_version = {name: value[0] for name, value in zip(names, values) if value is not None}
+        return self._current_version
+    
+    def probe(self) -> Dict:
+        """Опрос системы: реестр, platform и psutil"""
+        self.probes += 1
+        current = self.current_version()
+        product_name = current.get("ProductName")
+        build_number = current.get("CurrentBuildNumber")
+        
+        # Определяем версию
+        if product_name is None:
+            os_version = f"Windows {platform.release()}"
+        elif "Windows 11" in product_name:
+            os_version = f"Windows 11 (Build {build_number})"
+        elif "Windows 10" in product_name:
+            os_version = f"Windows 10 (Build {build_number})"
+        else:
+            os_version = product_name
+        
+        return {
+            'os_version': os_version,
+            'os': platform.system(),
+            'version': platform.version(),
+            'release': platform.release(),
+            'architecture': platform.architecture()[0],
+            'processor': platform.processor(),
+            'ram_gb': round(psutil.virtual_memory().total / (1024**3), 1),
+            'cpu_cores': psutil.cpu_count(logical=False),
+            'cpu_threads': psutil.cpu_count(logical=True),
+            'windows_edition': current.get("EditionID", "Unknown"),
+        }
+    
+    @property
+    def facts(self) -> Dict:
+        if self._facts is None:
+            key = self.cache_key()
+            self._facts = self._load(key)
+            if self._facts is None:
+                self._facts = self.probe()
+                self._save(key)
+        return self._facts
+    
+    def get(self, name: str):
+        return self.facts.get(name)
+    
+    def _load(self, key: List) -> Optional[Dict]:
+        if not self.cache_file:
+            return None
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != self.VERSION or data.get("key") != key:
+            return None
+        return data.get("facts")
+    
+    def _save(self, key: List):
+        if not self.cache_file:
+            return
+        try:
+            with open(self.cache_file, "w", encoding="utf-8") as f:
+                json.dump({"version": self.VERSION, "key": key, "facts": self._facts}, f, ensure_ascii=False)
+        except OSError:
+            pass
+
+
+# ========== КАТАЛОГ ТВИКОВ ==========
+
+CATALOG_FILE = "wextweaks_tweaks.json"
+PLAN_CACHE_FILE = "wextweaks_plan_cache.json"
+
+# Этапы полной оптимизации, чьи твики описаны в каталоге
+FULL_STAGES = ("gaming", "network", "services", "clean", "system")
+
+_OP_KINDS = ("reg", "cmd", "service")
+_OP_FIELDS = {"id", "desc", "os", "disk", "after", "check", "maintenance",
+              "reg", "value", "type", "data", "cmd", "service"}
+
+# Этапы полной оптимизации и их названия в отчёте о времени
+FULL_STAGE_NAMES = (
+    ("gaming", "Игровой режим и Game DVR"),
+    ("power", "Настройки питания"),
+    ("network", "Сетевые настройки"),
+    ("services", "Отключение служб"),
+    ("clean", "Очистка системы"),
+    ("system", "Системные настройки"),
+)
+
+
+_PROFILE_FIELDS = {"desc", "include", "exclude", "set", "tasks"}
+_PROFILE_OVERRIDES = {"data", "desc"}  # что профиль может поменять в твике
+PROFILE_TASKS = ("power", "clean.files")  # задачи вне каталога, которые профиль может включить
+
+
+class CatalogError(ValueError):
+    """Ошибка в каталоге твиков"""
+
+
+class PlanOp(NamedTuple):
+    """Операция скомпилированного плана"""
+    id: str
+    stage: str
+    kind: str  # reg / cmd / service
+    desc: str
+    target: object  # RegTweak, строка команды или имя службы
+    after: Tuple[str, ...] = ()  # id операций, которые должны выполниться раньше
+    check: Optional[Tuple[str, str]] = None  # (команда-проба, regex) - признак, что команда уже применена
+    maintenance: bool = False  # разовое обслуживание (сброс, очистка), а не настройка
+
+
+def resource_path(name: str) -> str:
+    """Путь к файлу рядом со скриптом (или внутри EXE PyInstaller)"""
+    base = getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base, name)
+
+
+def _op_kind(entry: Dict) -> str:
+    kinds = [kind for kind in _OP_KINDS if kind in entry]
+    if len(kinds) != 1:
+        raise CatalogError(f"{entry.get('id')}: нужен ровно один из ключей {_OP_KINDS}")
+    return kinds[0]
+
+
+def _reg_tweak(entry: Dict) -> RegTweak:
+    hive, _, key = entry["reg"].partition("\\")
+    hive = REG_HIVES.get(hive.upper(), hive.upper())
+    if hive not in REG_HIVES.values() or not key:
+        raise CatalogError(f"{entry['id']}: неизвестный раздел реестра {entry['reg']}")
+    reg_type = entry.get("type", "REG_DWORD")
+    if reg_type not in REG_TYPES:
+        raise CatalogError(f"{entry['id']}: неизвестный тип {reg_type}")
+    try:
+        data = _convert_reg_data(reg_type, str(entry.get("data", "")))
+    except ValueError:
+        raise CatalogError(f"{entry['id']}: неверные данные {entry.get('data')!r} для {reg_type}")
+    return RegTweak(hive, key, entry["value"], reg_type, data)
+
+
+def make_plan_op(stage: str, entry: Dict) -> PlanOp:
+    """Построение операции плана из записи каталога"""
+    kind = _op_kind(entry)
+    if kind == "reg":
+        target = _reg_tweak(entry)
+    else:
+        target = entry[kind]
+    check = entry.get("check")
+    if check is not None:
+        try:
+            check = (check["probe"], check["match"])
+            re.compile(check[1])
+        except (KeyError, TypeError, re.error):
+            raise CatalogError(f"{entry['id']}: check должен содержать probe и корректный match")
+    return PlanOp(entry["id"], stage, kind, entry.get("desc", entry["id"]), target,
+                  tuple(entry.get("after", ())), check,
+                  bool(entry.get("maintenance", False)))
+
+
+def op_key(op: PlanOp) -> Tuple:
+    """Ключ дедупликации: одно и то же значение/команда/служба в плане встречается один раз"""
+    if op.kind == "reg":
+        return ("reg",) + reg_value_key(op.target)
+    if op.kind == "cmd":
+        return ("cmd", " ".join(op.target.lower().split()))
+    return ("service", op.target.lower())
+
+
+def _matches_facts(entry: Dict, facts: Dict) -> bool:
+    """Фильтры записи: os - подстрока версии Windows (с '!' - отрицание), disk - ssd/hdd"""
+    os_filter = entry.get("os")
+    if os_filter:
+        negate = os_filter.startswith("!")
+        if (os_filter.lstrip("!") in facts.get("os", "")) == negate:
+            return False
+    disk = entry.get("disk")
+    if disk and facts.get("disk") != disk:
+        return False
+    return True
+
+
+class TweakCatalog:
+    """Декларативный каталог твиков и компиляция его в план с кэшем на диске"""
+    
+    def __init__(self, path: str, cache_file: str = PLAN_CACHE_FILE):
+        self.path = path
+        self.cache_file = cache_file
+        with open(path, "rb") as f:
+            self._raw = f.read()
+        self.hash = hashlib.sha256(self._raw).hexdigest()[:16]
+        self._stages = None
+        self._profiles = None
+        self._cache = None
+    
+    @property
+    def stages(self) -> Dict[str, List[Dict]]:
+        """Этапы каталога (JSON разбирается и проверяется один раз)"""
+        if self._stages is None:
+            try:
+                data = json.loads(self._raw.decode("utf-8"))
+            except ValueError as e:
+                raise CatalogError(f"{self.path}: {e}")
+            self._stages = data.get("stages", {})
+            self._profiles = data.get("profiles", {})
+            self.validate()
+        return self._stages
+    
+    @property
+    def profiles(self) -> Dict[str, Dict]:
+        """Профили: набор твиков из разных этапов с изменёнными параметрами"""
+        self.stages
+        return self._profiles
+    
+    def validate(self):
+        """Проверка схемы: уникальные id, известные поля, корректные данные реестра"""
+        seen = set()
+        after = []
+        for stage, entries in self._stages.items():
+            for entry in entries:
+                op_id = entry.get("id")
+                if not op_id or op_id in seen:
+                    raise CatalogError(f"{stage}: пустой или повторный id {op_id!r}")
+                seen.add(op_id)
+                unknown = set(entry) - _OP_FIELDS
+                if unknown:
+                    raise CatalogError(f"{op_id}: неизвестные поля {sorted(unknown)}")
+                make_plan_op(stage, entry)
+                after.extend((op_id, dep) for dep in entry.get("after", ()))
+        for op_id, dep in after:
+            if dep not in seen:
+                raise CatalogError(f"{op_id}: after ссылается на неизвестный id {dep}")
+        for name, profile in self._profiles.items():
+            self._validate_profile(name, profile, seen)
+    
+    def _validate_profile(self, name: str, profile: Dict, ids: set):
+        unknown = set(profile) - _PROFILE_FIELDS
+        if unknown:
+            raise CatalogError(f"профиль {name}: неизвестные поля {sorted(unknown)}")
+        if not profile.get("include"):
+            raise CatalogError(f"профиль {name}: пустой include")
+        for pattern in list(profile["include"]) + list(profile.get("exclude", ())):
+            if not any(fnmatch.fnmatchcase(op_id, pattern) for op_id in ids):
+                raise CatalogError(f"профиль {name}: {pattern} не совпадает ни с одним твиком")
+        entries = self.profile_entries(profile)
+        for _, entry in entries:
+            # Тип диска определяется запуском команд - план профиля от него не зависит
+            if entry.get("disk"):
+                raise CatalogError(f"профиль {name}: {entry['id']} зависит от типа диска")
+        selected = {entry["id"] for _, entry in entries}
+        for op_id, fields in profile.get("set", {}).items():
+            if op_id not in selected:
+                raise CatalogError(f"профиль {name}: set для твика {op_id}, которого нет в профиле")
+            if not set(fields) <= _PROFILE_OVERRIDES:
+                raise CatalogError(f"профиль {name}: в {op_id} можно менять только {sorted(_PROFILE_OVERRIDES)}")
+        unknown = set(profile.get("tasks", ())) - set(PROFILE_TASKS)
+        if unknown:
+            raise CatalogError(f"профиль {name}: неизвестные задачи {sorted(unknown)}")
+    
+    def profile_entries(self, profile: Dict) -> List[Tuple[str, Dict]]:
+        """Твики профиля в порядке каталога, с параметрами из set"""
+        include = profile["include"]
+        exclude = profile.get("exclude", ())
+        overrides = profile.get("set", {})
+        selected = []
+        for stage, entries in self._stages.items():
+            for entry in entries:
+                op_id = entry["id"]
+                if not any(fnmatch.fnmatchcase(op_id, p) for p in include):
+                    continue
+                if any(fnmatch.fnmatchcase(op_id, p) for p in exclude):
+                    continue
+                if op_id in overrides:
+                    entry = dict(entry, **overrides[op_id])
+                    make_plan_op(stage, entry)
+                selected.append((stage, entry))
+        return selected
+    
+    def compile(self, stages: Tuple[str, ...], facts: Dict) -> List[PlanOp]:
+        """План для этапов: фильтры по фактам системы, без повторов, в порядке каталога"""
+        def entries():
+            for stage in stages:
+                if stage not in self.stages:
+                    raise CatalogError(f"Неизвестный этап: {stage}")
+            return [(stage, entry) for stage in stages for entry in self.stages[stage]]
+        return self._compile(",".join(stages), facts, entries)
+    
+    def compile_profile(self, name: str, facts: Dict) -> Tuple[List[PlanOp], Tuple[str, ...]]:
+        """План профиля (только его твики, с его параметрами) и задачи вне каталога, которые он включает.
+        Кэшируется как и планы этапов"""
+        def entries():
+            if name not in self.profiles:
+                raise CatalogError(f"Неизвестный профиль: {name}")
+            return self.profile_entries(self.profiles[name])
+        ops = self._compile("profile:" + name, facts, entries)
+        
+        tasks_key = "|".join([self.hash, "tasks", name])
+        if tasks_key not in self._cache:
+            self._cache[tasks_key] = list(self.profiles[name].get("tasks", ()))
+            self._save_cache()
+        return ops, tuple(self._cache[tasks_key])
+    
+    def _compile(self, what: str, facts: Dict, entries: Callable[[], List[Tuple[str, Dict]]]) -> List[PlanOp]:
+        """Компиляция с кэшем на диске: при попадании в кэш каталог не разбирается"""
+        key = "|".join([self.hash, json.dumps(facts, sort_keys=True, ensure_ascii=False), what])
+        cache = self._load_cache()
+        if key in cache:
+            return [make_plan_op(stage, entry) for stage, entry in cache[key]]
+        
+        selected = []
+        ops = {}
+        for stage, entry in entries():
+            if not _matches_facts(entry, facts):
+                continue
+            op = make_plan_op(stage, entry)
+            previous = ops.get(op_key(op))
+            if previous is None:
+                ops[op_key(op)] = op
+                selected.append((stage, entry))
+            elif op.kind == "reg" and previous.target[3:] != op.target[3:]:
+                raise CatalogError(f"{op.id} противоречит {previous.id}")
+        
+        cache[key] = selected
+        self._save_cache()
+        return [make_plan_op(stage, entry) for stage, entry in selected]
+    
+    def _load_cache(self) -> Dict:
+        if self._cache is None:
+            self._cache = {}
+            try:
+                with open(self.cache_file, "r", encoding="utf-8") as f:
+                    self._cache = json.load(f)
+            except (OSError, ValueError):
+                pass
+        return self._cache
+    
+    def _save_cache(self):
+        # Планы от прежних версий каталога больше не нужны
+        self._cache = {k: v for k, v in self._cache.items() if k.startswith(self.hash + "|")}
+        try:
+            with open(self.cache_file, "w", encoding="utf-8") as f:
+                json.dump(self._cache, f, ensure_ascii=False)
+        except OSError:
+            pass
+
+
+# ========== ВЫПОЛНЕНИЕ КОМАНД ==========
+
+DEFAULT_WORKERS = 4
+COMMAND_TIMEOUT = 30
+BATCH_TASKS = {"reg": "registry", "service": "services"}  # вид операции -> одна задача на этап
+
+
+class CommandResult(NamedTuple):
+    """Результат внешней команды"""
+    returncode: int
+    stdout: str
+    stderr: str
+    duration: float = 0.0
+    spawn_s: float = 0.0  # запуск процесса, без времени его работы
+    output_bytes: int = 0
+
+
+class RunResult(NamedTuple):
+    """Результат команды из пачки run_many"""
+    command: str
+    returncode: Optional[int]  # None - процесс не завершился сам или не был запущен
+    stdout: str
+    stderr: str
+    duration: float
+    timed_out: bool = False
+    error: Optional[str] = None
+    spawn_s: float = 0.0
+    output_bytes: int = 0
+    
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+
+class AsyncCommandRunner:
+    """Пачка команд на asyncio: не больше concurrency процессов сразу, вывод построчно
+    по мере поступления, таймаут на каждую команду и общий срок на всю пачку"""
+    
+    def __init__(self, concurrency: int = DEFAULT_WORKERS, timeout: float = COMMAND_TIMEOUT,
+                 deadline: Optional[float] = None, on_output: Optional[Callable[[str, str, str], None]] = None,
+                 encoding: str = 'cp866', cwd: Optional[str] = None):
+        self.concurrency = max(1, int(concurrency))
+        self.timeout = timeout
+        self.deadline = deadline  # секунд на всю пачку
+        self.on_output = on_output  # (команда, "stdout"/"stderr", строка)
+        self.encoding = encoding
+        self.cwd = cwd
+    
+    def run_many(self, commands: List[str]) -> List[RunResult]:
+        """Синхронный вход: результаты в порядке команд"""
+        return asyncio.run(self.run_many_async(commands))
+    
+    async def run_many_async(self, commands: List[str]) -> List[RunResult]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + self.deadline if self.deadline is not None else None
+        return list(await asyncio.gather(*(self._run_limited(command, semaphore, deadline_at)
+                                           for command in commands)))
+    
+    async def _run_limited(self, command: str, semaphore: "asyncio.Semaphore",
+                           deadline_at: Optional[float]) -> RunResult:
+        async with semaphore:
+            timeout = self.timeout
+            if deadline_at is not None:
+                timeout = min(timeout, deadline_at - asyncio.get_running_loop().time())
+                if timeout <= 0:
+                    return RunResult(command, None, "", "", 0.0, True, "общий срок пачки истёк до запуска")
+            return await self._run(command, timeout)
+    
+    async def _read(self, command: str, stream: "asyncio.StreamReader", name: str, chunks: List[str]) -> int:
+        size = 0
+        async for line in stream:
+            size += len(line)
+            text = line.decode(self.encoding, errors='replace')
+            chunks.append(text)
+            if self.on_output:
+                self.on_output(command, name, text.rstrip("\r\n"))
+        return size
+    
+    async def _run(self, command: str, timeout: float) -> RunResult:
+        start = time.perf_counter()
+        try:
+            process = await asyncio.create_subprocess_shell(
+                command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                cwd=self.cwd, limit=1 << 20)
+        except OSError as e:
+            return RunResult(command, None, "", "", time.perf_counter() - start, False, str(e))
+        spawn_s = time.perf_counter() - start
+        
+        stdout, stderr = [], []
+        timed_out = False
+        try:
+            out_bytes, err_bytes, _ = await asyncio.wait_for(asyncio.gather(
+                self._read(command, process.stdout, "stdout", stdout),
+                self._read(command, process.stderr, "stderr", stderr),
+                process.wait()), timeout)
+            output_bytes = out_bytes + err_bytes
+        except asyncio.TimeoutError:
+            timed_out = True
+            output_bytes = sum(len(chunk) for chunk in stdout + stderr)
+            # Дочерние процессы оболочки держат каналы вывода - завершаем всё дерево
+            with contextlib.suppress(psutil.Error):
+                for child in psutil.Process(process.pid).children(recursive=True):
+                    with contextlib.suppress(psutil.Error):
+                        child.kill()
+            with contextlib.suppress(ProcessLookupError):
+                process.kill()
+            await process.wait()
+        return RunResult(command, None if timed_out else process.returncode, "".join(stdout), "".join(stderr),
+                         time.perf_counter() - start, timed_out, spawn_s=spawn_s, output_bytes=output_bytes)
+
+
+class CommandExecutor:
+    """Запуск внешних команд через оболочку"""
+    
+    def run_many(self, commands: List[str], concurrency: int = DEFAULT_WORKERS, timeout: float = COMMAND_TIMEOUT,
+                 deadline: Optional[float] = None,
+                 on_output: Optional[Callable[[str, str, str], None]] = None) -> List[RunResult]:
+        """Параллельный запуск пачки команд (см. AsyncCommandRunner)"""
+        # Для EXE файлов - избегаем проблем с путями PyInstaller
+        runner = AsyncCommandRunner(concurrency, timeout, deadline, on_output,
+                                    cwd=os.environ.get('SystemRoot', 'C:\\Windows'))  # Рабочий каталог System32
+        return runner.run_many(commands)
+    
+    def run(self, command: str, timeout: float = COMMAND_TIMEOUT,
+            on_output: Optional[Callable[[str, str, str], None]] = None) -> CommandResult:
+        """Одна команда - тонкая обёртка над run_many"""
+        result = self.run_many([command], 1, timeout, on_output=on_output)[0]
+        if result.timed_out:
+            raise subprocess.TimeoutExpired(command, timeout)
+        if result.error:
+            raise OSError(result.error)
+        return CommandResult(result.returncode, result.stdout, result.stderr,
+                             result.duration, result.spawn_s, result.output_bytes)
+
+
+class FakeExecutor(CommandExecutor):
+    """Имитация команд с задержкой - для тестов и бенчмарков вне Windows"""
+    
+    def __init__(self, latency: float = 0.05, latencies: Optional[Dict[str, float]] = None,
+                 outputs: Optional[Dict[str, CommandResult]] = None):
+        self.latency = latency
+        self.latencies = latencies or {}  # префикс команды -> задержка
+        self.outputs = outputs or {}  # префикс команды -> результат
+        self.calls: List[str] = []
+        self._lock = threading.Lock()
+    
+    def _lookup(self, table: Dict, command: str, default):
+        for prefix, value in table.items():
+            if command.startswith(prefix):
+                return value
+        return default
+    
+    def run(self, command: str, timeout: float = COMMAND_TIMEOUT,
+            on_output: Optional[Callable[[str, str, str], None]] = None) -> CommandResult:
+        with self._lock:
+            self.calls.append(command)
+        delay = self._lookup(self.latencies, command, self.latency)
+        if delay > timeout:
+            time.sleep(max(timeout, 0))
+            raise subprocess.TimeoutExpired(command, timeout)
+        time.sleep(delay)
+        result = self._lookup(self.outputs, command, CommandResult(0, "", ""))
+        result = result._replace(duration=delay, output_bytes=len(result.stdout) + len(result.stderr))
+        if on_output:
+            for line in result.stdout.splitlines():
+                on_output(command, "stdout", line)
+        return result
+    
+    def run_many(self, commands: List[str], concurrency: int = DEFAULT_WORKERS, timeout: float = COMMAND_TIMEOUT,
+                 deadline: Optional[float] = None,
+                 on_output: Optional[Callable[[str, str, str], None]] = None) -> List[RunResult]:
+        deadline_at = time.perf_counter() + deadline if deadline is not None else None
+        
+        def run_one(command: str) -> RunResult:
+            start = time.perf_counter()
+            limit = timeout if deadline_at is None else min(timeout, deadline_at - start)
+            if limit <= 0:
+                return RunResult(command, None, "", "", 0.0, True, "общий срок пачки истёк до запуска")
+            try:
+                result = self.run(command, limit, on_output)
+            except subprocess.TimeoutExpired:
+                return RunResult(command, None, "", "", time.perf_counter() - start, True)
+            return RunResult(command, result.returncode, result.stdout, result.stderr, time.perf_counter() - start,
+                             output_bytes=result.output_bytes)
+        
+        with futures.ThreadPoolExecutor(max_workers=max(1, int(concurrency))) as pool:
+            return list(pool.map(run_one, commands))
+
+
+class Task(NamedTuple):
+    """Задача планировщика: выполняется после всех задач из deps"""
+    id: str
+    stage: str
+    func: Callable[[], object]
+    deps: Tuple[str, ...] = ()
+
+
+def op_task_id(op: PlanOp) -> str:
+    """Задача, в которую попадает операция плана (реестр и службы этапа - одной пачкой)"""
+    return f"{op.stage}.{BATCH_TASKS[op.kind]}" if op.kind in BATCH_TASKS else op.id
+
+
+_task_context = threading.local()
+
+
+def current_task() -> Optional[Task]:
+    """Задача планировщика, которую выполняет текущий поток"""
+    return getattr(_task_context, "task", None)
+
+
+def report_failures(count: int = 1):
+    """Учёт неудачных операций в отчёте задачи, которую выполняет текущий поток"""
+    task, report = current_task(), getattr(_task_context, "report", None)
+    if count and task is not None and report is not None:
+        report.fail(task.id, count)
+
+
+class ScheduleReport:
+    """Результаты и время выполнения задач по этапам"""
+    
+    def __init__(self):
+        self.results: Dict[str, object] = {}
+        self.errors: Dict[str, str] = {}
+        self.timings: Dict[str, Tuple[str, float, float]] = {}
+        self.skipped: Dict[str, int] = {}  # этап -> операций, уже находящихся в нужном состоянии
+        self.failed: Dict[str, int] = {}  # задача -> операций, завершившихся ошибкой
+        self.started = time.perf_counter()
+        self.finished = self.started
+        self._lock = threading.Lock()
+    
+    def record(self, task: Task, start: float, end: float, result=None, error: Optional[str] = None):
+        with self._lock:
+            self.timings[task.id] = (task.stage, start, end)
+            if error is None:
+                self.results[task.id] = result
+            else:
+                self.errors[task.id] = error
+            self.finished = max(self.finished, end)
+    
+    def fail(self, task_id: str, count: int = 1):
+        with self._lock:
+            self.failed[task_id] = self.failed.get(task_id, 0) + count
+    
+    def failures(self, stage: Optional[str] = None) -> int:
+        """Число неудачных операций (упавшая задача считается одной)"""
+        failed = list(self.failed.items()) + [(task_id, 1) for task_id in self.errors]
+        return sum(count for task_id, count in failed
+                   if stage is None or self.timings[task_id][0] == stage)
+    
+    def success(self, stage: Optional[str] = None) -> int:
+        """Число успешных операций (задача реестра возвращает количество значений)"""
+        return sum(int(result) for task_id, result in self.results.items()
+                   if result and (stage is None or self.timings[task_id][0] == stage))
+    
+    def done(self, stage: Optional[str] = None) -> int:
+        """Успешные операции вместе с пропущенными как уже применённые"""
+        skipped = sum(count for name, count in self.skipped.items() if stage is None or name == stage)
+        return self.success(stage) + skipped
+    
+    def stage_times(self) -> Dict[str, float]:
+        """Время этапа от старта первой его задачи до конца последней"""
+        spans = {}
+        for stage, start, end in self.timings.values():
+            first, last = spans.get(stage, (start, end))
+            spans[stage] = (min(first, start), max(last, end))
+        return {stage: end - start for stage, (start, end) in spans.items()}
+    
+    @property
+    def wall_time(self) -> float:
+        return self.finished - self.started
+
+
+class TaskScheduler:
+    """Выполнение независимых задач на ограниченном пуле потоков с учётом зависимостей"""
+    
+    def __init__(self, workers: int = DEFAULT_WORKERS):
+        self.workers = max(1, int(workers))
+    
+    @staticmethod
+    def check_order(tasks: List[Task]) -> Dict[str, List[str]]:
+        """Проверка зависимостей (неизвестные id, циклы); возвращает зависимые задачи"""
+        ids = {task.id for task in tasks}
+        dependents = {task.id: [] for task in tasks}
+        waiting = {}
+        for task in tasks:
+            unknown = set(task.deps) - ids
+            if unknown:
+                raise ValueError(f"{task.id}: неизвестные зависимости {sorted(unknown)}")
+            waiting[task.id] = len(set(task.deps))
+            for dep in set(task.deps):
+                dependents[dep].append(task.id)
+        
+        ready = [task_id for task_id, count in waiting.items() if not count]
+        visited = 0
+        while ready:
+            task_id = ready.pop()
+            visited += 1
+            for dependent in dependents[task_id]:
+                waiting[dependent] -= 1
+                if not waiting[dependent]:
+                    ready.append(dependent)
+        if visited != len(tasks):
+            raise ValueError("Циклическая зависимость между задачами")
+        return dependents
+    
+    def _run_task(self, task: Task, report: ScheduleReport):
+        _task_context.task, _task_context.report = task, report
+        start = time.perf_counter()
+        try:
+            result = task.func()
+        except Exception as e:
+            report.record(task, start, time.perf_counter(), error=str(e))
+        else:
+            report.record(task, start, time.perf_counter(), result=result)
+        finally:
+            _task_context.task, _task_context.report = None, None
+    
+    def run(self, tasks: List[Task]) -> ScheduleReport:
+        dependents = self.check_order(tasks)
+        by_id = {task.id: task for task in tasks}
+        waiting = {task.id: set(task.deps) for task in tasks}
+        report = ScheduleReport()
+        
+        with futures.ThreadPoolExecutor(max_workers=self.workers) as pool:
+            running = {}
+            
+            def submit(task_id):
+                running[pool.submit(self._run_task, by_id[task_id], report)] = task_id
+            
+            # Задачи без зависимостей - сразу, в порядке плана
+            for task in tasks:
+                if not waiting[task.id]:
+                    submit(task.id)
+            
+            while running:
+                done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    task_id = running.pop(future)
+                    for dependent in dependents[task_id]:
+                        waiting[dependent].discard(task_id)
+                        if not waiting[dependent]:
+                            submit(dependent)
+        return report
+
+
+# ========== ЖУРНАЛ ==========
+
+JOURNAL_FILE = "wextweaks_journal.jsonl"
+JOURNAL_BATCH = 16  # отметок о выполненных задачах в буфере до записи на диск
+
+
+class JournalState(NamedTuple):
+    """Что записано в журнале прогона"""
+    stages: List[str]
+    done_ops: List[str]
+    done_tasks: List[str]
+    registry: List[RegTweak]  # прежние значения (первая запись о каждом значении)
+    power_scheme: Optional[str]
+    finished: bool
+    preset: Optional[str] = None  # профиль прерванного прогона (None - полная оптимизация)
+
+
+class ApplyJournal:
+    """Журнал упреждающей записи: прежние значения попадают на диск до изменения.
+    
+    Файл только дописывается. На каждую задачу - одна запись и один fsync,
+    отметки о завершённых задачах копятся и уходят на диск вместе со следующей записью.
+    """
+    
+    def __init__(self, path: str = JOURNAL_FILE, batch: int = JOURNAL_BATCH, durable: bool = True):
+        self.path = path
+        self.batch = batch
+        self.durable = durable
+        self.syncs = 0
+        self._file = None
+        self._pending: List[str] = []
+        self._lock = threading.Lock()
+    
+    def begin(self, stages: Tuple[str, ...], resume: bool = False, preset: Optional[str] = None):
+        """Начало прогона (resume - продолжение прерванного, журнал дописывается)"""
+        self._file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+        record = {"t": "resume" if resume else "begin", "stages": list(stages),
+                  "time": datetime.datetime.now().isoformat()}
+        if preset:
+            record["preset"] = preset
+        self._append(record, sync=True)
+    
+    def write_ahead(self, task_id: str, values: List[RegTweak], power_scheme: Optional[str] = None):
+        """Прежние значения перед выполнением задачи - на диске к моменту возврата"""
+        record = {"t": "before", "task": task_id, "keys": RegistryBackup(values).encode_keys()}
+        if power_scheme:
+            record["power"] = power_scheme
+        self._append(record, sync=True)
+    
+    def commit(self, task_id: str, op_ids: List[str]):
+        """Задача выполнена (при обрыве до fsync она просто выполнится ещё раз)"""
+        self._append({"t": "done", "task": task_id, "ops": op_ids}, sync=False)
+    
+    def finish(self, status: str = "end"):
+        """Прогон завершён (end) или откачен (rollback) - продолжать больше нечего"""
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._append({"t": status, "time": datetime.datetime.now().isoformat()}, sync=True)
+    
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._sync()
+            self._file.close()
+            self._file = None
+    
+    def _append(self, record: Dict, sync: bool):
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._pending.append(line)
+            if sync or len(self._pending) >= self.batch:
+                self._sync()
+    
+    def _sync(self):
+        if not self._pending:
+            return
+        self._file.write("".join(self._pending))
+        self._file.flush()
+        if self.durable:
+            os.fsync(self._file.fileno())
+        self._pending = []
+        self.syncs += 1
+    
+    @staticmethod
+    def read(path: str) -> Optional[JournalState]:
+        """Разбор журнала; оборванная последняя строка пропускается"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return None
+        stages, done_ops, done_tasks = [], [], []
+        registry = OrderedDict()
+        power_scheme = None
+        preset = None
+        finished = False
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            kind = record.get("t")
+            if kind == "begin":
+                stages = record["stages"]
+                preset = record.get("preset")
+            elif kind == "before":
+                for tweak in RegistryBackup.decode_keys(record["keys"]):
+                    registry.setdefault(reg_value_key(tweak), tweak)
+                power_scheme = power_scheme or record.get("power")
+            elif kind == "done":
+                done_tasks.append(record["task"])
+                done_ops.extend(record["ops"])
+            finished = kind in ("end", "rollback")
+        if not stages and not registry:
+            return None
+        return JournalState(stages, done_ops, done_tasks, list(registry.values()), power_scheme, finished, preset)
+
+
+# ========== ПРОФИЛЬ ==========
+
+class OpTiming(NamedTuple):
+    """Время одной операции прогона (секунды от начала профиля)"""
+    name: str
+    stage: str
+    kind: str  # cmd, registry, services, clean, probe
+    start: float
+    end: float
+    spawn_s: float = 0.0
+    returncode: Optional[int] = None
+    output_bytes: int = 0
+    thread: int = 0
+    
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class RunProfile:
+    """Профиль прогона: начало и конец каждой операции, запуск процесса, код возврата, объём вывода"""
+    
+    def __init__(self):
+        self.records: List[OpTiming] = []
+        self.origin = time.perf_counter()
+        self.started_at = datetime.datetime.now()
+        self._lock = threading.Lock()
+    
+    def record(self, name: str, kind: str, start: float, end: float, spawn_s: float = 0.0,
+               returncode: Optional[int] = None, output_bytes: int = 0, stage: Optional[str] = None):
+        """start и end - значения time.perf_counter(); этап по умолчанию - этап текущей задачи планировщика"""
+        if stage is None:
+            task = current_task()
+            stage = task.stage if task is not None else ""
+        timing = OpTiming(name, stage, kind, start - self.origin, end - self.origin, spawn_s,
+                          returncode, output_bytes, threading.get_ident())
+        with self._lock:
+            self.records.append(timing)
+    
+    @contextlib.contextmanager
+    def measure(self, name: str, kind: str, stage: Optional[str] = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, kind, start, time.perf_counter(), stage=stage)
+    
+    def slowest(self, top: int = 3) -> Dict[str, List[OpTiming]]:
+        """Этап -> самые долгие операции"""
+        by_stage = OrderedDict()
+        for timing in sorted(self.records, key=lambda t: t.start):
+            by_stage.setdefault(timing.stage, []).append(timing)
+        return {stage: heapq.nlargest(top, items, key=lambda t: t.duration) for stage, items in by_stage.items()}
+    
+    def summary(self, top: int = 3) -> List[str]:
+        """Строки таблицы самых долгих операций по этапам"""
+        lines = [f"{'Этап':<10} {'Операция':<40} {'Время, с':>9} {'Запуск, с':>9} {'Код':>4} {'Вывод, Б':>9}"]
+        for stage, items in self.slowest(top).items():
+            for t in items:
+                code = "" if t.returncode is None else t.returncode
+                lines.append(f"{stage or '-':<10} {t.name[:40]:<40} {t.duration:>9.3f} {t.spawn_s:>9.3f} "
+                             f"{code!s:>4} {t.output_bytes:>9}")
+        return lines
+    
+    def as_dict(self) -> Dict:
+        operations = []
+        for t in sorted(self.records, key=lambda t: t.start):
+            item = t._asdict()
+            item.update(start=round(t.start, 6), end=round(t.end, 6), duration=round(t.duration, 6),
+                        spawn_s=round(t.spawn_s, 6))
+            operations.append(item)
+        return {"started_at": self.started_at.isoformat(), "operations": operations}
+    
+    def save_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, ensure_ascii=False, indent=2)
+    
+    def save_chrome_trace(self, path: str):
+        """Файл для chrome://tracing и Perfetto: операции - события "X" на дорожках потоков"""
+        threads = {}
+        events = []
+        for t in self.records:
+            tid = threads.setdefault(t.thread, len(threads) + 1)
+            events.append({
+                "name": t.name, "cat": t.stage or t.kind, "ph": "X", "pid": 1, "tid": tid,
+                "ts": round(t.start * 1e6), "dur": round(t.duration * 1e6),
+                "args": {"stage": t.stage, "kind": t.kind, "spawn_ms": round(t.spawn_s * 1000, 3),
+                         "returncode": t.returncode, "output_bytes": t.output_bytes},
+            })
+        events.extend({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": f"Поток {tid}"}}
+                      for tid in threads.values())
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+# ========== ЛОГ ==========
+
+LOG_ICONS = {
+    "success": "✅",
+    "error": "❌",
+    "warning": "⚠️",
+    "info": "ℹ️",
+    "gaming": "🎮"
+}
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+LOG_FLUSH_INTERVAL = 0.5  # секунд между записями на диск
+LOG_BATCH_LINES = 256  # столько строк в буфере - пишем не дожидаясь интервала
+
+
+class LogWriter:
+    """Запись лога в фоновом потоке: строки копятся в памяти, файл открывается один раз,
+    при превышении max_bytes - ротация (wextweaks.log -> wextweaks.log.1 -> ...)"""
+    
+    def __init__(self, path: str, max_bytes: int = LOG_MAX_BYTES, backups: int = LOG_BACKUPS,
+                 json_lines: bool = False, flush_interval: float = LOG_FLUSH_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.json_lines = json_lines  # одна JSON-запись на строку, с полями операции (время и т.п.)
+        self.flush_interval = flush_interval
+        self._buffer: List[str] = []
+        self._cond = threading.Condition()
+        self._queued = 0
+        self._written = 0
+        self._flush_requested = False
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+    
+    def format(self, level: str, message: str, timestamp: float, fields: Dict) -> str:
+        if self.json_lines:
+            record = {"ts": datetime.datetime.fromtimestamp(timestamp).isoformat(timespec="milliseconds"),
+                      "level": level, "msg": message}
+            record.update(fields)
+            return json.dumps(record, ensure_ascii=False, default=str)
+        clock = datetime.datetime.fromtimestamp(timestamp).strftime("%H:%M:%S")
+        return f"[{clock}] {LOG_ICONS.get(level, '•')} {message}"
+    
+    def write(self, level: str, message: str, **fields):
+        """Постановка строки в очередь - без обращения к диску"""
+        line = self.format(level, message, time.time(), fields)
+        with self._cond:
+            if self._closed:
+                self._write_lines([line])
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="wextweaks-log", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            self._buffer.append(line)
+            self._queued += 1
+            if len(self._buffer) >= LOG_BATCH_LINES:
+                self._cond.notify_all()
+    
+    def flush(self, timeout: float = 5.0):
+        """Дождаться записи всего, что уже в очереди"""
+        with self._cond:
+            target = self._queued
+            if self._thread is None or self._written >= target:
+                return
+            self._flush_requested = True
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._written >= target, timeout)
+    
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(5.0)
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._buffer or self._closed)
+                # Копим строки, пока не истечёт интервал или не наберётся пачка
+                self._cond.wait_for(lambda: self._closed or self._flush_requested
+                                    or len(self._buffer) >= LOG_BATCH_LINES, self.flush_interval)
+                lines, self._buffer = self._buffer, []
+                self._flush_requested = False
+                closed = self._closed
+            self._write_lines(lines)
+            with self._cond:
+                self._written += len(lines)
+                self._cond.notify_all()
+            if closed:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+    
+    def _write_lines(self, lines: List[str]):
+        if not lines:
+            return
+        data = ("\n".join(lines) + "\n").encode("utf-8", errors="replace")
+        try:
+            if self._file is None:
+                self._file = open(self.path, "ab")
+            self._file.write(data)
+            self._file.flush()
+            if self.max_bytes and self._file.tell() >= self.max_bytes:
+                self._rotate()
+        except OSError:
+            pass
+    
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "wb")
+
+
+# ========== СЛУЖБЫ ==========
+
+SERVICE_STOPPED = 1
+SERVICE_STOP_PENDING = 3
+SERVICE_RUNNING = 4
+SERVICE_STOP_TIMEOUT = 30  # общий на всю пачку служб
+SERVICE_POLL_INTERVAL = 0.1
+
+
+class ServiceResult(NamedTuple):
+    """Итог отключения одной службы"""
+    name: str
+    found: bool
+    stopped: bool
+    disabled: bool
+    error: Optional[str] = None
+    
+    @property
+    def ok(self) -> bool:
+        return self.found and (self.stopped or self.disabled)
+
+
+class ServiceBackend:
+    """Базовый интерфейс диспетчера служб (SCM)"""
+    name = "base"
+    
+    def query_all(self) -> Dict[str, int]:
+        """Все службы одним перечислением: имя в нижнем регистре -> состояние"""
+        raise NotImplementedError
+    
+    def stop(self, service: str) -> Optional[str]:
+        """Запрос остановки без ожидания; текст ошибки или None"""
+        raise NotImplementedError
+    
+    def disable(self, service: str) -> Optional[str]:
+        """Тип запуска "отключена"; текст ошибки или None"""
+        raise NotImplementedError
+    
+    def state(self, service: str) -> int:
+        raise NotImplementedError
+    
+    def close(self):
+        pass
+
+
+def _service_structs() -> Tuple[type, type]:
+    """Структуры SCM - строятся вместе с бэкендом, чтобы ctypes не грузился при импорте"""
+    class ServiceStatusProcess(ctypes.Structure):
+        # SERVICE_STATUS_PROCESS; первые 7 полей совпадают с SERVICE_STATUS
+        _fields_ = [(name, ctypes.c_uint32) for name in (
+            "service_type", "current_state", "controls_accepted", "win32_exit_code",
+            "service_exit_code", "check_point", "wait_hint", "process_id", "service_flags")]
+    
+    class EnumServiceStatusProcess(ctypes.Structure):
+        _fields_ = [("service_name", ctypes.c_wchar_p), ("display_name", ctypes.c_wchar_p),
+                    ("status", ServiceStatusProcess)]
+    
+    return ServiceStatusProcess, EnumServiceStatusProcess
+
+
+class WinServiceBackend(ServiceBackend):
+    """Диспетчер служб Windows через advapi32: один дескриптор SCM на пачку, без sc.exe и net.exe"""
+    name = "scm"
+    
+    SC_MANAGER_ACCESS = 0x0001 | 0x0004  # CONNECT | ENUMERATE_SERVICE
+    SERVICE_ACCESS = 0x0002 | 0x0004 | 0x0020  # CHANGE_CONFIG | QUERY_STATUS | STOP
+    SERVICE_WIN32 = 0x30
+    SERVICE_STATE_ALL = 3
+    SERVICE_CONTROL_STOP = 1
+    SERVICE_NO_CHANGE = 0xFFFFFFFF
+    ERROR_MORE_DATA = 234
+    ERROR_SERVICE_NOT_ACTIVE = 1062
+    
+    def __init__(self):
+        self._Status, self._Entry = _service_structs()
+        u32, handle, text = ctypes.c_uint32, ctypes.c_void_p, ctypes.c_wchar_p
+        api = self._api = ctypes.WinDLL("advapi32", use_last_error=True)
+        api.OpenSCManagerW.restype = handle
+        api.OpenSCManagerW.argtypes = [text, text, u32]
+        api.OpenServiceW.restype = handle
+        api.OpenServiceW.argtypes = [handle, text, u32]
+        api.CloseServiceHandle.argtypes = [handle]
+        api.ControlService.argtypes = [handle, u32, handle]
+        api.QueryServiceStatus.argtypes = [handle, handle]
+        api.ChangeServiceConfigW.argtypes = [handle, u32, u32, u32, text, text, handle, text, text, text, text]
+        api.EnumServicesStatusExW.argtypes = [handle, ctypes.c_int, u32, u32, handle, u32,
+                                              ctypes.POINTER(u32), ctypes.POINTER(u32), ctypes.POINTER(u32), text]
+        self._scm = None
+        self._handles: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def _manager(self) -> int:
+        # Дескриптор SCM открывается при первом обращении и живёт до close()
+        with self._lock:
+            if not self._scm:
+                self._scm = self._api.OpenSCManagerW(None, None, self.SC_MANAGER_ACCESS)
+                if not self._scm:
+                    raise ctypes.WinError(ctypes.get_last_error())
+            return self._scm
+    
+    def _service(self, service: str) -> int:
+        scm = self._manager()
+        with self._lock:
+            handle = self._handles.get(service.lower())
+            if not handle:
+                handle = self._api.OpenServiceW(scm, service, self.SERVICE_ACCESS)
+                if not handle:
+                    raise ctypes.WinError(ctypes.get_last_error())
+                self._handles[service.lower()] = handle
+            return handle
+    
+    def query_all(self) -> Dict[str, int]:
+        scm = self._manager()
+        needed, count, resume = ctypes.c_uint32(), ctypes.c_uint32(), ctypes.c_uint32()
+        buf = ctypes.create_string_buffer(64 * 1024)
+        states = {}
+        while True:
+            ok = self._api.EnumServicesStatusExW(scm, 0, self.SERVICE_WIN32, self.SERVICE_STATE_ALL,
+                                                 ctypes.addressof(buf), len(buf), ctypes.byref(needed),
+                                                 ctypes.byref(count), ctypes.byref(resume), None)
+            error = ctypes.get_last_error()
+            if not ok and error != self.ERROR_MORE_DATA:
+                raise ctypes.WinError(error)
+            entries = ctypes.cast(buf, ctypes.POINTER(self._Entry))
+            for i in range(count.value):
+                states[entries[i].service_name.lower()] = entries[i].status.current_state
+            if ok:
+                return states
+            # Не поместилось - продолжаем с resume, при нужде увеличив буфер
+            if needed.value > len(buf):
+                buf = ctypes.create_string_buffer(needed.value)
+    
+    def stop(self, service: str) -> Optional[str]:
+        status = self._Status()
+        try:
+            if self._api.ControlService(self._service(service), self.SERVICE_CONTROL_STOP, ctypes.addressof(status)):
+                return None
+        except OSError as e:
+            return str(e)
+        error = ctypes.get_last_error()
+        return None if error == self.ERROR_SERVICE_NOT_ACTIVE else str(ctypes.WinError(error))
+    
+    def disable(self, service: str) -> Optional[str]:
+        try:
+            if self._api.ChangeServiceConfigW(self._service(service), self.SERVICE_NO_CHANGE, SERVICE_DISABLED,
+                                              self.SERVICE_NO_CHANGE, None, None, None, None, None, None, None):
+                return None
+        except OSError as e:
+            return str(e)
+        return str(ctypes.WinError(ctypes.get_last_error()))
+    
+    def state(self, service: str) -> int:
+        status = self._Status()
+        if not self._api.QueryServiceStatus(self._service(service), ctypes.addressof(status)):
+            raise ctypes.WinError(ctypes.get_last_error())
+        return status.current_state
+    
+    def close(self):
+        with self._lock:
+            for handle in self._handles.values():
+                self._api.CloseServiceHandle(handle)
+            self._handles.clear()
+            if self._scm:
+                self._api.CloseServiceHandle(self._scm)
+                self._scm = None
+
+
+class SimulatedServiceBackend(ServiceBackend):
+    """Имитация диспетчера служб: остановка службы длится stop_latency секунд - для тестов и вне Windows"""
+    name = "simulated"
+    
+    def __init__(self, running: Tuple[str, ...] = (), stop_latency: float = 0.5,
+                 latencies: Optional[Dict[str, float]] = None):
+        self.states = {name.lower(): SERVICE_RUNNING for name in running}
+        self.start_types = {name.lower(): 2 for name in running}  # 2 - автоматически
+        self.stop_latency = stop_latency
+        self.latencies = {name.lower(): delay for name, delay in (latencies or {}).items()}
+        self.calls: List[str] = []
+        self._stop_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+    
+    def _update(self, key: str):
+        stop_at = self._stop_at.get(key)
+        if stop_at is not None and time.perf_counter() >= stop_at:
+            self.states[key] = SERVICE_STOPPED
+            del self._stop_at[key]
+    
+    def query_all(self) -> Dict[str, int]:
+        with self._lock:
+            self.calls.append("enum")
+            for key in list(self._stop_at):
+                self._update(key)
+            return dict(self.states)
+    
+    def stop(self, service: str) -> Optional[str]:
+        key = service.lower()
+        with self._lock:
+            self.calls.append(f"stop {service}")
+            if key not in self.states:
+                return f"{service}: служба не найдена"
+            if self.states[key] == SERVICE_RUNNING:
+                self.states[key] = SERVICE_STOP_PENDING
+                self._stop_at[key] = time.perf_counter() + self.latencies.get(key, self.stop_latency)
+        return None
+    
+    def disable(self, service: str) -> Optional[str]:
+        key = service.lower()
+        with self._lock:
+            self.calls.append(f"disable {service}")
+            if key not in self.states:
+                return f"{service}: служба не найдена"
+            self.start_types[key] = SERVICE_DISABLED
+        return None
+    
+    def state(self, service: str) -> int:
+        key = service.lower()
+        with self._lock:
+            self.calls.append(f"query {service}")
+            self._update(key)
+            return self.states.get(key, SERVICE_STOPPED)
+
+
+def create_service_backend() -> ServiceBackend:
+    """Выбор бэкенда служб для текущей платформы"""
+    if IS_WINDOWS:
+        return WinServiceBackend()
+    return SimulatedServiceBackend()
+
+
+def stop_and_disable_services(backend: ServiceBackend, services: List[str],
+                              timeout: float = SERVICE_STOP_TIMEOUT, workers: int = DEFAULT_WORKERS,
+                              poll: float = SERVICE_POLL_INTERVAL) -> List[ServiceResult]:
+    """Пачка служб: одно перечисление, запросы остановки параллельно,
+    ожидание остановки - с общим таймаутом на всю пачку"""
+    states = backend.query_all()
+    present = [service for service in services if service.lower() in states]
+    
+    def request(service: str) -> Tuple[Optional[str], Optional[str]]:
+        stop_error = None
+        if states[service.lower()] != SERVICE_STOPPED:
+            stop_error = backend.stop(service)
+        return stop_error, backend.disable(service)
+    
+    errors = {}
+    if present:
+        with futures.ThreadPoolExecutor(max_workers=max(1, min(workers, len(present)))) as pool:
+            errors = dict(zip(present, pool.map(request, present)))
+    
+    # Запросы отправлены - ждём остановки всех сразу, а не каждой по очереди
+    pending = {service for service in present
+               if states[service.lower()] != SERVICE_STOPPED and errors[service][0] is None}
+    deadline = time.perf_counter() + timeout
+    while pending:
+        pending = {service for service in pending if backend.state(service) != SERVICE_STOPPED}
+        if not pending or time.perf_counter() >= deadline:
+            break
+        time.sleep(poll)
+    
+    results = []
+    for service in services:
+        if service not in errors:
+            results.append(ServiceResult(service, False, False, False))
+            continue
+        stop_error, disable_error = errors[service]
+        if service in pending:
+            stop_error = f"не остановилась за {timeout} с"
+        results.append(ServiceResult(service, True, stop_error is None, disable_error is None,
+                                     stop_error or disable_error))
+    return results
+
+
+# ========== ПРОЦЕССЫ ==========
+
+WATCH_INTERVAL = 1.0  # секунд между сравнениями списков процессов
+# Исполняемые файлы игр (ключ games в конфигурации)
+DEFAULT_GAMES = ("cs2.exe", "csgo.exe", "valorant-win64-shipping.exe", "fortniteclient-win64-shipping.exe",
+                 "r5apex.exe", "cod.exe", "dota2.exe", "gta5.exe", "overwatch.exe", "rainbowsix.exe")
+# Фоновые программы, которым на время игры понижается приоритет (ключ background_processes)
+DEFAULT_BACKGROUND = ("onedrive.exe", "searchapp.exe", "searchindexer.exe", "teams.exe", "ms-teams.exe",
+                      "skype.exe", "dropbox.exe", "googledrivefs.exe", "epicgameslauncher.exe")
+# Игровая сессия: что делать с фоновой программой - suspend (приостановить) или lower (ключ session_processes).
+# Мессенджеры и лаунчеры только понижаются: они нужны для голосового чата и онлайн-функций игр
+SESSION_POLICY = {"onedrive.exe": "suspend", "dropbox.exe": "suspend", "googledrivefs.exe": "suspend",
+                  "searchapp.exe": "suspend", "searchindexer.exe": "lower", "teams.exe": "lower",
+                  "ms-teams.exe": "lower", "skype.exe": "lower", "epicgameslauncher.exe": "lower"}
+SESSION_FILE = "wextweaks_session.json"  # приостановленные PID - чтобы возобновить их после сбоя
+
+
+class ProcessUsage(NamedTuple):
+    rss: int  # рабочий набор, байт
+    cpu_time: float  # процессорное время с запуска, с
+    age: float  # время с запуска, с
+
+
+class ProcessBackend:
+    """Базовый интерфейс таблицы процессов: список PID, приоритет и привязка к ядрам.
+    Приоритет - значение платформы (класс приоритета Windows или nice), level() переводит уровни в него"""
+    name = "base"
+    
+    def pids(self) -> Set[int]:
+        raise NotImplementedError
+    
+    def process_name(self, pid: int) -> Optional[str]:
+        """Имя исполняемого файла в нижнем регистре; None - процесса уже нет"""
+        raise NotImplementedError
+    
+    def priority(self, pid: int) -> Optional[int]:
+        raise NotImplementedError
+    
+    def set_priority(self, pid: int, value: int) -> Optional[str]:
+        """Текст ошибки или None"""
+        raise NotImplementedError
+    
+    def affinity(self, pid: int) -> Optional[List[int]]:
+        raise NotImplementedError
+    
+    def set_affinity(self, pid: int, cpus: List[int]) -> Optional[str]:
+        raise NotImplementedError
+    
+    def level(self, name: str) -> int:
+        """idle, below_normal, normal или high"""
+        raise NotImplementedError
+    
+    def cpu_count(self) -> int:
+        raise NotImplementedError
+    
+    def suspend(self, pid: int) -> Optional[str]:
+        raise NotImplementedError
+    
+    def resume(self, pid: int) -> Optional[str]:
+        raise NotImplementedError
+    
+    def trim(self, pid: int) -> Optional[str]:
+        """Выгрузить рабочий набор: страницы уходят в резервный список и файл подкачки.
+        Где это не поддерживается, ничего не делает и возвращает None"""
+        raise NotImplementedError
+    
+    def usage(self, pid: int) -> Optional[ProcessUsage]:
+        raise NotImplementedError
+
+
+class PsutilProcessBackend(ProcessBackend):
+    """Настоящие процессы через psutil"""
+    name = "psutil"
+    _CLASSES = {"idle": "IDLE_PRIORITY_CLASS", "below_normal": "BELOW_NORMAL_PRIORITY_CLASS",
+                "normal": "NORMAL_PRIORITY_CLASS", "high": "HIGH_PRIORITY_CLASS"}
+    _NICE = {"idle": 19, "below_normal": 10, "normal": 0, "high": -10}
+    PROCESS_SET_QUOTA = 0x0100
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    
+    def __init__(self):
+        self._kernel = None
+    
+    def pids(self) -> Set[int]:
+        return set(psutil.pids())
+    
+    def process_name(self, pid: int) -> Optional[str]:
+        try:
+            return psutil.Process(pid).name().lower()
+        except psutil.Error:
+            return None
+    
+    def priority(self, pid: int) -> Optional[int]:
+        try:
+            return psutil.Process(pid).nice()
+        except psutil.Error:
+            return None
+    
+    def set_priority(self, pid: int, value: int) -> Optional[str]:
+        try:
+            psutil.Process(pid).nice(value)
+        except psutil.Error as e:
+            return f"{pid}: {e}"
+        return None
+    
+    def affinity(self, pid: int) -> Optional[List[int]]:
+        try:
+            return psutil.Process(pid).cpu_affinity()
+        except (psutil.Error, AttributeError):  # AttributeError - привязки к ядрам нет (macOS)
+            return None
+    
+    def set_affinity(self, pid: int, cpus: List[int]) -> Optional[str]:
+        try:
+            psutil.Process(pid).cpu_affinity(cpus)
+        except (psutil.Error, AttributeError) as e:
+            return f"{pid}: {e}"
+        return None
+    
+    def level(self, name: str) -> int:
+        if IS_WINDOWS:
+            return getattr(psutil, self._CLASSES[name])
+        return self._NICE[name]
+    
+    def cpu_count(self) -> int:
+        return psutil.cpu_count() or 1
+    
+    def suspend(self, pid: int) -> Optional[str]:
+        try:
+            psutil.Process(pid).suspend()
+        except psutil.Error as e:
+            return f"{pid}: {e}"
+        return None
+    
+    def resume(self, pid: int) -> Optional[str]:
+        try:
+            psutil.Process(pid).resume()
+        except psutil.Error as e:
+            return f"{pid}: {e}"
+        return None
+    
+    def trim(self, pid: int) -> Optional[str]:
+        if not IS_WINDOWS:
+            return None  # выгрузки рабочего набора вне Windows нет - это не ошибка, просто нечего делать
+        if self._kernel is None:
+            kernel = ctypes.WinDLL("kernel32", use_last_error=True)
+            kernel.OpenProcess.restype = ctypes.c_void_p
+            kernel.OpenProcess.argtypes = [ctypes.c_uint32, ctypes.c_int, ctypes.c_uint32]
+            kernel.K32EmptyWorkingSet.argtypes = [ctypes.c_void_p]
+            kernel.CloseHandle.argtypes = [ctypes.c_void_p]
+            self._kernel = kernel
+        handle = self._kernel.OpenProcess(self.PROCESS_SET_QUOTA | self.PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return f"{pid}: {ctypes.WinError(ctypes.get_last_error())}"
+        try:
+            if not self._kernel.K32EmptyWorkingSet(handle):
+                return f"{pid}: {ctypes.WinError(ctypes.get_last_error())}"
+        finally:
+            self._kernel.CloseHandle(handle)
+        return None
+    
+    def usage(self, pid: int) -> Optional[ProcessUsage]:
+        try:
+            process = psutil.Process(pid)
+            with process.oneshot():
+                times = process.cpu_times()
+                return ProcessUsage(process.memory_info().rss, times.user + times.system,
+                                    time.time() - process.create_time())
+        except psutil.Error:
+            return None
+
+
+class FakeProcessBackend(ProcessBackend):
+    """Таблица процессов в памяти - для тестов и вне Windows; spawn/kill имитируют запуск и выход.
+    Процесс расходует cpu_rate секунды CPU в секунду, пока не приостановлен; trim оставляет пятую часть памяти"""
+    name = "fake"
+    LEVELS = {"idle": 64, "below_normal": 16384, "normal": 32, "high": 128}  # классы приоритета Windows
+    
+    def __init__(self, names: Tuple[str, ...] = (), cpus: int = 8):
+        self.cpus = cpus
+        self.table: Dict[int, Dict] = {}
+        self.calls: List[str] = []
+        self._next_pid = 1000
+        self._lock = threading.Lock()
+        for name in names:
+            self.spawn(name)
+    
+    def spawn(self, name: str, rss: int = 64 * 1024 * 1024, cpu_rate: float = 0.02, age: float = 0.0) -> int:
+        now = time.perf_counter()
+        with self._lock:
+            self._next_pid += 4
+            self.table[self._next_pid] = {"name": name.lower(), "priority": self.LEVELS["normal"],
+                                          "affinity": list(range(self.cpus)), "suspended": False,
+                                          "rss": rss, "cpu_rate": cpu_rate, "cpu": cpu_rate * age,
+                                          "created": now - age, "stamp": now}
+            return self._next_pid
+    
+    def kill(self, pid: int):
+        with self._lock:
+            self.table.pop(pid, None)
+    
+    def _get(self, pid: int, field: str, call: str):
+        with self._lock:
+            self.calls.append(f"{call} {pid}")
+            entry = self.table.get(pid)
+            return None if entry is None else entry[field]
+    
+    def _set(self, pid: int, field: str, value, call: str) -> Optional[str]:
+        with self._lock:
+            self.calls.append(f"{call} {pid}")
+            if pid not in self.table:
+                return f"{pid}: процесс не найден"
+            self.table[pid][field] = value
+        return None
+    
+    def pids(self) -> Set[int]:
+        with self._lock:
+            self.calls.append("pids")
+            return set(self.table)
+    
+    def process_name(self, pid: int) -> Optional[str]:
+        return self._get(pid, "name", "name")
+    
+    def priority(self, pid: int) -> Optional[int]:
+        return self._get(pid, "priority", "priority")
+    
+    def set_priority(self, pid: int, value: int) -> Optional[str]:
+        return self._set(pid, "priority", value, "set_priority")
+    
+    def affinity(self, pid: int) -> Optional[List[int]]:
+        cpus = self._get(pid, "affinity", "affinity")
+        return None if cpus is None else list(cpus)
+    
+    def set_affinity(self, pid: int, cpus: List[int]) -> Optional[str]:
+        return self._set(pid, "affinity", list(cpus), "set_affinity")
+    
+    def level(self, name: str) -> int:
+        return self.LEVELS[name]
+    
+    def cpu_count(self) -> int:
+        return self.cpus
+    
+    def suspend(self, pid: int) -> Optional[str]:
+        self.usage(pid)  # учесть CPU до остановки
+        return self._set(pid, "suspended", True, "suspend")
+    
+    def resume(self, pid: int) -> Optional[str]:
+        self.usage(pid)
+        return self._set(pid, "suspended", False, "resume")
+    
+    def trim(self, pid: int) -> Optional[str]:
+        with self._lock:
+            self.calls.append(f"trim {pid}")
+            entry = self.table.get(pid)
+            if entry is None:
+                return f"{pid}: процесс не найден"
+            entry["rss"] //= 5
+        return None
+    
+    def usage(self, pid: int) -> Optional[ProcessUsage]:
+        now = time.perf_counter()
+        with self._lock:
+            entry = self.table.get(pid)
+            if entry is None:
+                return None
+            if not entry["suspended"]:
+                entry["cpu"] += entry["cpu_rate"] * (now - entry["stamp"])
+            entry["stamp"] = now
+            return ProcessUsage(entry["rss"], entry["cpu"], now - entry["created"])
+
+
+class WatchEvent(NamedTuple):
+    """Действие слежения: start/exit игры, lower/suspend - фоновый процесс, restore - возврат настроек"""
+    kind: str
+    pid: int
+    name: str
+    error: Optional[str] = None
+
+
+class GameWatcher:
+    """Слежение за играми по разнице множеств PID: имя запрашивается только у новых процессов.
+    Пока идёт игра - у неё высокий приоритет и свои ядра, фоновые программы понижены и прижаты
+    к первым reserve_cores ядрам; после выхода последней игры всё возвращается как было"""
+    
+    def __init__(self, backend: ProcessBackend, games: Tuple[str, ...] = DEFAULT_GAMES,
+                 background: Tuple[str, ...] = DEFAULT_BACKGROUND, interval: float = WATCH_INTERVAL,
+                 reserve_cores: int = 1):
+        self.backend = backend
+        self.games = {name.lower() for name in games}
+        self.background = {name.lower() for name in background}
+        self.interval = interval
+        cpus = list(range(backend.cpu_count()))
+        # На 1-2 ядрах делить нечего - меняется только приоритет
+        if len(cpus) > reserve_cores + 1 and reserve_cores > 0:
+            self.game_cpus, self.background_cpus = cpus[reserve_cores:], cpus[:reserve_cores]
+        else:
+            self.game_cpus = self.background_cpus = None
+        self.names: Dict[int, str] = {}  # все известные PID -> имя ("" - имя не получено)
+        self.running: Dict[int, str] = {}  # PID запущенных игр
+        self.saved: Dict[int, Tuple[Optional[int], Optional[List[int]]]] = {}  # прежние приоритет и ядра
+        self.events: List[WatchEvent] = []
+        self.ticks = 0
+        self.cpu_time = 0.0
+        self.wall_time = 0.0
+    
+    @property
+    def overhead_percent(self) -> float:
+        return 100.0 * self.cpu_time / self.wall_time if self.wall_time else 0.0
+    
+    def _change(self, pid: int, name: str, kind: str, level: str, cpus: Optional[List[int]]) -> WatchEvent:
+        if pid not in self.saved:
+            self.saved[pid] = (self.backend.priority(pid), self.backend.affinity(pid) if cpus is not None else None)
+        error = self.backend.set_priority(pid, self.backend.level(level))
+        if cpus is not None:
+            error = self.backend.set_affinity(pid, cpus) or error
+        return WatchEvent(kind, pid, name, error)
+    
+    def _lower_background(self) -> List[WatchEvent]:
+        return [self._change(pid, name, "lower", "below_normal", self.background_cpus)
+                for pid, name in self.names.items() if name in self.background and pid not in self.saved]
+    
+    def restore(self) -> List[WatchEvent]:
+        """Вернуть приоритет и ядра всем изменённым процессам, которые ещё живы"""
+        events = []
+        for pid, (priority, cpus) in self.saved.items():
+            error = None
+            if priority is not None:
+                error = self.backend.set_priority(pid, priority)
+            if cpus is not None:
+                error = self.backend.set_affinity(pid, cpus) or error
+            events.append(WatchEvent("restore", pid, self.names.get(pid, ""), error))
+        self.saved.clear()
+        return events
+    
+    def tick(self) -> List[WatchEvent]:
+        """Одно сравнение списка процессов с прошлым"""
+        cpu_start = time.process_time()
+        pids = self.backend.pids()
+        events = []
+        for pid in self.names.keys() - pids:
+            name = self.names.pop(pid)
+            self.saved.pop(pid, None)  # процесс завершился - возвращать нечего
+            if self.running.pop(pid, None) is not None:
+                events.append(WatchEvent("exit", pid, name))
+        if events and not self.running:
+            events.extend(self.restore())
+        for pid in pids - self.names.keys():
+            name = self.names[pid] = self.backend.process_name(pid) or ""
+            if name in self.games:
+                if not self.running:
+                    events.extend(self._lower_background())
+                self.running[pid] = name
+                events.append(self._change(pid, name, "start", "high", self.game_cpus))
+            elif name in self.background and self.running:
+                events.append(self._change(pid, name, "lower", "below_normal", self.background_cpus))
+        self.events.extend(events)
+        self.ticks += 1
+        self.cpu_time += time.process_time() - cpu_start
+        return events
+    
+    def run(self, duration: Optional[float] = None, on_event: Optional[Callable[[WatchEvent], None]] = None,
+            stop: Optional[threading.Event] = None):
+        """Слежение до stop, истечения duration или Ctrl+C; на выходе всё возвращается"""
+        stop = stop or threading.Event()
+        start = next_tick = time.perf_counter()
+        try:
+            while not stop.is_set():
+                for event in self.tick():
+                    if on_event is not None:
+                        on_event(event)
+                next_tick += self.interval
+                if duration is not None and next_tick - start > duration:
+                    break
+                stop.wait(max(0.0, next_tick - time.perf_counter()))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            events = self.restore()
+            self.events.extend(events)
+            for event in events:
+                if on_event is not None:
+                    on_event(event)
+            self.wall_time += time.perf_counter() - start
+
+
+class SessionStats:
+    """Что освободила игровая сессия: память при выгрузке рабочих наборов и CPU фоновых программ"""
+    
+    def __init__(self):
+        self.lowered = 0
+        self.suspended = 0
+        self.memory_freed = 0  # байт
+        self.cpu_saved = 0.0  # секунд CPU относительно среднего расхода программы до сессии
+        self.cpu_used = 0.0  # сколько фоновые программы всё же потратили за сессию
+        self.session_time = 0.0
+    
+    def as_dict(self) -> Dict:
+        return {"lowered": self.lowered, "suspended": self.suspended,
+                "memory_freed_mb": round(self.memory_freed / MB, 1), "cpu_saved_s": round(self.cpu_saved, 2),
+                "cpu_used_s": round(self.cpu_used, 2), "session_s": round(self.session_time, 1),
+                "cpu_saved_percent": round(100 * self.cpu_saved / self.session_time, 2) if self.session_time else 0.0}
+
+
+class GameSession(GameWatcher):
+    """Игровая сессия: фоновые программы из policy на время игры приостанавливаются (suspend) или понижаются
+    (lower), их рабочие наборы выгружаются; после игры всё возобновляется. Освобождённое считается по psutil:
+    память - разница рабочего набора до и после выгрузки, CPU - средний расход программы с запуска
+    на длительность сессии минус потраченное за сессию"""
+    
+    def __init__(self, backend: ProcessBackend, games: Tuple[str, ...] = DEFAULT_GAMES,
+                 policy: Optional[Dict[str, str]] = None, interval: float = WATCH_INTERVAL,
+                 reserve_cores: int = 1, state_file: Optional[str] = SESSION_FILE):
+        policy = {name.lower(): action for name, action in (policy or SESSION_POLICY).items()}
+        super().__init__(backend, games, tuple(policy), interval, reserve_cores)
+        self.policy = policy
+        self.state_file = state_file
+        self.stats = SessionStats()
+        self.suspended: Dict[int, str] = {}
+        self.baseline: Dict[int, ProcessUsage] = {}
+    
+    def _change(self, pid: int, name: str, kind: str, level: str, cpus: Optional[List[int]]) -> WatchEvent:
+        if kind != "lower":
+            return super()._change(pid, name, kind, level, cpus)
+        before = self.backend.usage(pid)
+        if self.policy.get(name) == "suspend":
+            self.saved.setdefault(pid, (None, None))  # приоритет не меняется - возвращать нечего, кроме resume
+            error = self.backend.suspend(pid)
+            if error is None:
+                kind = "suspend"
+                self.suspended[pid] = name
+                self.stats.suspended += 1
+                self.save_state()
+        else:
+            error = super()._change(pid, name, kind, level, cpus).error
+            self.stats.lowered += error is None
+        error = self.backend.trim(pid) or error
+        after = self.backend.usage(pid)
+        if before is not None and after is not None:
+            self.stats.memory_freed += max(0, before.rss - after.rss)
+            self.baseline[pid] = after
+        return WatchEvent(kind, pid, name, error)
+    
+    def _account(self):
+        """CPU фоновых программ за сессию против их среднего расхода до неё"""
+        session_time = 0.0
+        for pid, start in self.baseline.items():
+            now = self.backend.usage(pid)
+            if now is None or start.age <= 0:
+                continue  # программа завершилась - без её конечного времени сравнивать не с чем
+            elapsed = now.age - start.age
+            used = now.cpu_time - start.cpu_time
+            self.stats.cpu_used += used
+            self.stats.cpu_saved += max(0.0, start.cpu_time / start.age * elapsed - used)
+            session_time = max(session_time, elapsed)
+        self.stats.session_time += session_time
+        self.baseline.clear()
+    
+    def restore(self) -> List[WatchEvent]:
+        self._account()
+        errors = {pid: self.backend.resume(pid) for pid in self.suspended if pid in self.saved}
+        self.suspended.clear()
+        self.save_state()
+        return [event._replace(error=errors.get(event.pid) or event.error) for event in super().restore()]
+    
+    def save_state(self):
+        if not self.state_file:
+            return
+        if not self.suspended:
+            with contextlib.suppress(OSError):
+                os.remove(self.state_file)
+            return
+        with open(self.state_file, "w", encoding="utf-8") as f:
+            json.dump({"suspended": {str(pid): name for pid, name in self.suspended.items()}}, f)
+    
+    @staticmethod
+    def resume_leftovers(backend: ProcessBackend, state_file: str = SESSION_FILE) -> int:
+        """Возобновить процессы, оставшиеся приостановленными после аварийного завершения"""
+        try:
+            with open(state_file, "r", encoding="utf-8") as f:
+                suspended = json.load(f).get("suspended", {})
+        except (OSError, ValueError):
+            return 0
+        resumed = 0
+        for pid, name in suspended.items():
+            # PID мог достаться другому процессу - возобновляем, только если имя то же
+            if backend.process_name(int(pid)) == name and backend.resume(int(pid)) is None:
+                resumed += 1
+        with contextlib.suppress(OSError):
+            os.remove(state_file)
+        return resumed
+
+
+# ========== ПИТАНИЕ ==========
+
+POWER_SCHEME_BALANCED = "381b4222-f694-41f0-9685-ff5bb260df2e"
+POWER_SCHEME_HIGH = "8c5e7fda-e8bf-4a96-9a85-a6e23a8c635c"
+POWER_SCHEME_WEX = "5e7ba1d0-7a5e-4f1b-9c3d-2b8e6a4f0c17"  # своя схема - встроенные не меняются
+SUB_PROCESSOR = "54533251-82be-4824-96c1-47b60b740d00"
+PROCTHROTTLEMIN = "893dee8e-2bef-41e0-89c6-b55d0929964c"  # минимальное состояние процессора, %
+PERFEPP = "36687f9e-e3a5-4dbf-b1dc-15eb381c6863"  # предпочтение энергосбережения процессора, %
+
+
+class PowerSetting(NamedTuple):
+    subgroup: str
+    setting: str
+    ac: int  # от сети
+    dc: int  # от батареи
+    desc: str
+
+
+class PowerPlan(NamedTuple):
+    """Схема питания целиком: создаётся копией base, если её нет; hibernate=None - гибернацию не трогать"""
+    scheme: str
+    base: str
+    name: str
+    description: str
+    settings: Tuple[PowerSetting, ...]
+    hibernate: Optional[bool] = None
+
+
+GAMING_POWER_PLAN = PowerPlan(
+    POWER_SCHEME_WEX, POWER_SCHEME_HIGH, "WexTweaks Gaming", "Максимальная производительность для игр", (
+        PowerSetting(SUB_PROCESSOR, PROCTHROTTLEMIN, 100, 100, "CPU не ниже 100%"),
+        PowerSetting(SUB_PROCESSOR, PERFEPP, 0, 0, "Энергосбережение CPU выключено"),
+    ), hibernate=False)
+
+
+class PowerBackend:
+    """Базовый интерфейс управления питанием"""
+    name = "base"
+    
+    def schemes(self) -> List[str]:
+        raise NotImplementedError
+    
+    def active(self) -> Optional[str]:
+        raise NotImplementedError
+    
+    def set_active(self, scheme: str) -> Optional[str]:
+        """Текст ошибки или None"""
+        raise NotImplementedError
+    
+    def apply(self, plan: PowerPlan) -> Optional[str]:
+        """Схема целиком одной пачкой: создание, имя, все значения, активация, гибернация"""
+        raise NotImplementedError
+    
+    def set_hibernate(self, enabled: bool) -> Optional[str]:
+        """Включение или выключение гибернации; текст ошибки или None"""
+        raise NotImplementedError
+    
+    def read(self, scheme: str, subgroup: str, setting: str) -> Optional[Tuple[int, int]]:
+        """Значения (от сети, от батареи); None - схемы или параметра нет"""
+        raise NotImplementedError
+
+
+def verify_power_plan(backend: PowerBackend, plan: PowerPlan) -> List[str]:
+    """Расхождения с планом по данным системы: активная схема и каждое значение"""
+    problems = []
+    active = backend.active()
+    if active != plan.scheme:
+        problems.append(f"активна схема {active}, а не {plan.scheme}")
+    for item in plan.settings:
+        values = backend.read(plan.scheme, item.subgroup, item.setting)
+        if values != (item.ac, item.dc):
+            problems.append(f"{item.desc}: {values} вместо {(item.ac, item.dc)}")
+    return problems
+
+
+def _power_structs() -> Tuple[type, type, type]:
+    """GUID, LUID и TOKEN_PRIVILEGES - строятся вместе с бэкендом, чтобы ctypes не грузился при импорте"""
+    class Guid(ctypes.Structure):
+        _fields_ = [("data1", ctypes.c_uint32), ("data2", ctypes.c_uint16), ("data3", ctypes.c_uint16),
+                    ("data4", ctypes.c_ubyte * 8)]
+        
+        @classmethod
+        def parse(cls, text: str) -> "Guid":
+            return cls.from_buffer_copy(uuid.UUID(text).bytes_le)
+        
+        def __str__(self) -> str:
+            return str(uuid.UUID(bytes_le=bytes(self)))
+    
+    class Luid(ctypes.Structure):
+        _fields_ = [("low", ctypes.c_uint32), ("high", ctypes.c_int32)]
+    
+    class TokenPrivileges(ctypes.Structure):
+        _fields_ = [("count", ctypes.c_uint32), ("luid", Luid), ("attributes", ctypes.c_uint32)]
+    
+    return Guid, Luid, TokenPrivileges
+
+
+class WinPowerBackend(PowerBackend):
+    """powrprof.dll напрямую: без powercfg и запуска процессов"""
+    name = "powrprof"
+    ACCESS_SCHEME = 16
+    ERROR_NO_MORE_ITEMS = 259
+    SYSTEM_RESERVE_HIBER_FILE = 10
+    TOKEN_ADJUST_PRIVILEGES = 0x20
+    TOKEN_QUERY = 0x8
+    SE_PRIVILEGE_ENABLED = 2
+    
+    def __init__(self):
+        self._Guid, self._Luid, self._TokenPrivileges = _power_structs()
+        u32, handle, guid = ctypes.c_uint32, ctypes.c_void_p, ctypes.POINTER(self._Guid)
+        api = self._api = ctypes.WinDLL("powrprof", use_last_error=True)
+        api.PowerEnumerate.argtypes = [handle, guid, guid, u32, u32, ctypes.c_void_p, ctypes.POINTER(u32)]
+        api.PowerGetActiveScheme.argtypes = [handle, ctypes.POINTER(guid)]
+        api.PowerSetActiveScheme.argtypes = [handle, guid]
+        api.PowerDuplicateScheme.argtypes = [handle, guid, ctypes.POINTER(guid)]
+        for name in ("PowerWriteFriendlyName", "PowerWriteDescription"):
+            getattr(api, name).argtypes = [handle, guid, guid, guid, ctypes.c_char_p, u32]
+        for name in ("PowerWriteACValueIndex", "PowerWriteDCValueIndex"):
+            getattr(api, name).argtypes = [handle, guid, guid, guid, u32]
+        for name in ("PowerReadACValueIndex", "PowerReadDCValueIndex"):
+            getattr(api, name).argtypes = [handle, guid, guid, guid, ctypes.POINTER(u32)]
+        api.CallNtPowerInformation.argtypes = [ctypes.c_int, ctypes.c_void_p, u32, ctypes.c_void_p, u32]
+        api.CallNtPowerInformation.restype = ctypes.c_long
+        self._kernel = ctypes.WinDLL("kernel32", use_last_error=True)
+        self._kernel.LocalFree.argtypes = [handle]
+        self._kernel.GetCurrentProcess.restype = handle
+        self._kernel.CloseHandle.argtypes = [handle]
+    
+    @staticmethod
+    def _error(call: str, code: int) -> Optional[str]:
+        return f"{call}: {ctypes.WinError(code)}" if code else None
+    
+    def schemes(self) -> List[str]:
+        result, index = [], 0
+        while True:
+            guid, size = self._Guid(), ctypes.c_uint32(ctypes.sizeof(self._Guid))
+            code = self._api.PowerEnumerate(None, None, None, self.ACCESS_SCHEME, index,
+                                            ctypes.byref(guid), ctypes.byref(size))
+            if code:
+                return result
+            result.append(str(guid))
+            index += 1
+    
+    def active(self) -> Optional[str]:
+        pointer = ctypes.POINTER(self._Guid)()
+        if self._api.PowerGetActiveScheme(None, ctypes.byref(pointer)):
+            return None
+        try:
+            return str(pointer.contents)
+        finally:
+            self._kernel.LocalFree(pointer)
+    
+    def set_active(self, scheme: str) -> Optional[str]:
+        return self._error("PowerSetActiveScheme", self._api.PowerSetActiveScheme(None, self._Guid.parse(scheme)))
+    
+    def set_hibernate(self, enabled: bool) -> Optional[str]:
+        """То же, что powercfg -h on/off: нужна привилегия создания файла подкачки"""
+        advapi = ctypes.WinDLL("advapi32", use_last_error=True)
+        advapi.OpenProcessToken.argtypes = [ctypes.c_void_p, ctypes.c_uint32, ctypes.POINTER(ctypes.c_void_p)]
+        advapi.AdjustTokenPrivileges.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_uint32,
+                                                 ctypes.c_void_p, ctypes.c_void_p]
+        token = ctypes.c_void_p()
+        if not advapi.OpenProcessToken(self._kernel.GetCurrentProcess(),
+                                       self.TOKEN_ADJUST_PRIVILEGES | self.TOKEN_QUERY, ctypes.byref(token)):
+            return f"OpenProcessToken: {ctypes.WinError(ctypes.get_last_error())}"
+        try:
+            privileges = self._TokenPrivileges(1, self._Luid(), self.SE_PRIVILEGE_ENABLED)
+            advapi.LookupPrivilegeValueW(None, "SeCreatePagefilePrivilege", ctypes.byref(privileges.luid))
+            advapi.AdjustTokenPrivileges(token, False, ctypes.byref(privileges), 0, None, None)
+        finally:
+            self._kernel.CloseHandle(token)
+        flag = ctypes.c_ubyte(1 if enabled else 0)
+        status = self._api.CallNtPowerInformation(self.SYSTEM_RESERVE_HIBER_FILE, ctypes.byref(flag), 1, None, 0)
+        return f"CallNtPowerInformation: NTSTATUS 0x{status & 0xFFFFFFFF:08x}" if status else None
+    
+    def apply(self, plan: PowerPlan) -> Optional[str]:
+        scheme = self._Guid.parse(plan.scheme)
+        existing = self.schemes()
+        if plan.scheme not in existing:
+            # Готовый указатель на наш GUID: копия получает его, а не случайный
+            base = plan.base if plan.base in existing else POWER_SCHEME_BALANCED
+            target = ctypes.pointer(self._Guid.parse(plan.scheme))
+            error = self._error("PowerDuplicateScheme",
+                                self._api.PowerDuplicateScheme(None, self._Guid.parse(base), ctypes.byref(target)))
+            if error:
+                return error
+        for call, text in (("PowerWriteFriendlyName", plan.name), ("PowerWriteDescription", plan.description)):
+            data = (text + "\0").encode("utf-16-le")
+            error = self._error(call, getattr(self._api, call)(None, scheme, None, None, data, len(data)))
+            if error:
+                return error
+        for item in plan.settings:
+            subgroup, setting = self._Guid.parse(item.subgroup), self._Guid.parse(item.setting)
+            for call, value in (("PowerWriteACValueIndex", item.ac), ("PowerWriteDCValueIndex", item.dc)):
+                error = self._error(call, getattr(self._api, call)(None, scheme, subgroup, setting, value))
+                if error:
+                    return f"{item.desc}: {error}"
+        error = self._error("PowerSetActiveScheme", self._api.PowerSetActiveScheme(None, scheme))
+        if error is None and plan.hibernate is not None:
+            error = self.set_hibernate(plan.hibernate)
+        return error
+    
+    def read(self, scheme: str, subgroup: str, setting: str) -> Optional[Tuple[int, int]]:
+        values = []
+        guids = [self._Guid.parse(text) for text in (scheme, subgroup, setting)]
+        for call in ("PowerReadACValueIndex", "PowerReadDCValueIndex"):
+            value = ctypes.c_uint32()
+            if getattr(self._api, call)(None, *guids, ctypes.byref(value)):
+                return None
+            values.append(value.value)
+        return tuple(values)
+
+
+class FakePowerBackend(PowerBackend):
+    """Схемы питания в памяти - для тестов и вне Windows; каждый вызов длится latency секунд"""
+    name = "fake"
+    
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.table: Dict[str, Dict] = {
+            POWER_SCHEME_BALANCED: {"name": "Сбалансированная", "values": {}},
+            POWER_SCHEME_HIGH: {"name": "Высокая производительность", "values": {}},
+        }
+        self.current = POWER_SCHEME_BALANCED
+        self.hibernate = True
+        self.calls: List[str] = []
+    
+    def _call(self, name: str):
+        self.calls.append(name)
+        if self.latency:
+            time.sleep(self.latency)
+    
+    def schemes(self) -> List[str]:
+        self._call("schemes")
+        return list(self.table)
+    
+    def active(self) -> Optional[str]:
+        self._call("active")
+        return self.current
+    
+    def set_active(self, scheme: str) -> Optional[str]:
+        self._call(f"set_active {scheme}")
+        if scheme not in self.table:
+            return f"{scheme}: схема не найдена"
+        self.current = scheme
+        return None
+    
+    def set_hibernate(self, enabled: bool) -> Optional[str]:
+        self._call(f"set_hibernate {enabled}")
+        self.hibernate = enabled
+        return None
+    
+    def apply(self, plan: PowerPlan) -> Optional[str]:
+        self._call(f"apply {plan.scheme}")
+        if plan.scheme not in self.table:
+            base = self.table.get(plan.base) or self.table[POWER_SCHEME_BALANCED]
+            self.table[plan.scheme] = {"name": base["name"], "values": dict(base["values"])}
+        entry = self.table[plan.scheme]
+        entry["name"] = plan.name
+        for item in plan.settings:
+            entry["values"][(item.subgroup, item.setting)] = (item.ac, item.dc)
+        self.current = plan.scheme
+        if plan.hibernate is not None:
+            self.hibernate = plan.hibernate
+        return None
+    
+    def read(self, scheme: str, subgroup: str, setting: str) -> Optional[Tuple[int, int]]:
+        self._call("read")
+        entry = self.table.get(scheme)
+        return None if entry is None else entry["values"].get((subgroup, setting))
+
+
+# ========== ПЛАТФОРМА ==========
+
+BACKEND_ENV = "WEXTWEAKS_BACKEND"  # windows или fake
+
+
+class Platform:
+    """Платформенные бэкенды: реестр, службы, процессы, питание, внешние команды и проверка прав"""
+    name = "base"
+    
+    def __init__(self, registry: RegistryBackend, services: ServiceBackend, executor: CommandExecutor,
+                 processes: ProcessBackend, power: PowerBackend):
+        self.registry = registry
+        self.services = services
+        self.executor = executor
+        self.processes = processes
+        self.power = power
+    
+    def is_admin(self) -> bool:
+        raise NotImplementedError
+    
+    def temp_paths(self) -> List[str]:
+        """Папки временных файлов для очистки"""
+        return []
+
+
+class WindowsPlatform(Platform):
+    """Настоящая Windows: winreg, advapi32, powrprof, psutil и cmd.exe"""
+    name = "windows"
+    
+    def __init__(self):
+        super().__init__(WinRegistryBackend(), WinServiceBackend(), CommandExecutor(), PsutilProcessBackend(),
+                         WinPowerBackend())
+    
+    def is_admin(self) -> bool:
+        try:
+            return bool(ctypes.windll.shell32.IsUserAnAdmin())
+        except (AttributeError, OSError):
+            return False
+    
+    def temp_paths(self) -> List[str]:
+        # Получаем все возможные пути к временным файлам
+        possible_paths = [
+            os.environ.get('TEMP', ''),
+            os.environ.get('TMP', ''),
+            'C:\\Windows\\Temp',
+            'C:\\Windows\\Prefetch',
+            os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Temp'),
+            os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft\\Windows\\INetCache'),
+            os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft\\Windows\\INetCookies'),
+            os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft\\Windows\\History'),
+            os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft\\Windows\\Explorer'),
+            # Временная папка пользователя
+            tempfile.gettempdir(),
+        ]
+        return possible_paths
+
+
+class FakePlatform(Platform):
+    """Всё в памяти: реестр, диспетчер служб, таблица процессов, схемы питания и команды - для Linux и CI.
+    Настоящие временные папки не трогаются: очищаются только temp_dirs"""
+    name = "fake"
+    
+    def __init__(self, latency: float = 0.0, services: Tuple[str, ...] = (), temp_dirs: Tuple[str, ...] = (),
+                 processes: Tuple[str, ...] = ()):
+        registry = MemoryRegistryBackend()
+        _stub_current_version(registry)
+        super().__init__(registry, SimulatedServiceBackend(services, latency), FakeExecutor(latency),
+                         FakeProcessBackend(processes), FakePowerBackend(latency))
+        self.temp_dirs = list(temp_dirs)
+    
+    def is_admin(self) -> bool:
+        return True
+    
+    def temp_paths(self) -> List[str]:
+        return list(self.temp_dirs)
+
+
+def create_platform(name: Optional[str] = None) -> Platform:
+    """Бэкенды для текущей системы; WEXTWEAKS_BACKEND=fake - имитация и в Windows"""
+    name = name or os.environ.get(BACKEND_ENV) or ("windows" if IS_WINDOWS else "fake")
+    if name == "windows":
+        return WindowsPlatform()
+    if name == "fake":
+        return FakePlatform()
+    raise ValueError(f"Неизвестный бэкенд: {name}")
+
+
+# ========== ОЧИСТКА ==========
+
+CLEAN_EXTENSIONS = ('.log', '.dmp', '.tmp', '.temp', '.cache')
+CLEAN_GLOBS = ('thumbcache_*.db',)  # кэш эскизов проводника
+PROGRESS_EVERY = 500  # файлов между сообщениями о прогрессе
+MB = 1024 * 1024
+
+
+class CleanPolicy(NamedTuple):
+    """Правила очистки: какие файлы удалять и сколько.
+    max_keep_bytes - сколько подходящих файлов оставить в каждой корневой папке,
+    max_delete_bytes - сколько всего удалить за один запуск (старые и крупные - первыми)"""
+    extensions: Tuple[str, ...] = CLEAN_EXTENSIONS
+    globs: Tuple[str, ...] = CLEAN_GLOBS
+    exclude: Tuple[str, ...] = ()  # маски файлов, которые не трогаем никогда
+    min_age_days: float = 0
+    max_keep_bytes: Optional[int] = None
+    max_delete_bytes: Optional[int] = None
+    
+    @classmethod
+    def from_config(cls, config: Dict) -> "CleanPolicy":
+        """Политика из ключа clean_policy конфигурации (размеры в МБ)"""
+        def mb(key: str) -> Optional[int]:
+            value = config.get(key)
+            return None if value is None else int(float(value) * MB)
+        
+        return cls(
+            extensions=tuple(config.get("extensions", CLEAN_EXTENSIONS)),
+            globs=tuple(config.get("globs", CLEAN_GLOBS)),
+            exclude=tuple(config.get("exclude", ())),
+            min_age_days=float(config.get("min_age_days", 0)),
+            max_keep_bytes=mb("max_keep_mb"),
+            max_delete_bytes=mb("max_delete_mb"),
+        )
+    
+    @property
+    def has_budget(self) -> bool:
+        """Есть ли лимиты по объёму (тогда перед удалением нужен полный список файлов)"""
+        return self.max_keep_bytes is not None or self.max_delete_bytes is not None
+
+
+class CleanStats:
+    """Итоги очистки одной корневой папки"""
+    
+    def __init__(self, root: str):
+        self.root = root
+        self.files = 0
+        self.bytes = 0
+        self.dirs_removed = 0
+        self.dirs_skipped = 0  # не менялись с прошлой очистки
+        self.errors = 0
+    
+    def as_dict(self) -> Dict:
+        return {"root": self.root, "files": self.files, "bytes": self.bytes,
+                "dirs_removed": self.dirs_removed, "dirs_skipped": self.dirs_skipped, "errors": self.errors}
+
+
+class CleanSnapshot:
+    """Снимок папок после очистки: папка -> [mtime_ns, записей, подпапки(, срок)].
+    Если mtime папки не изменился, её содержимое то же, что после прошлой очистки.
+    Срок - когда оставленный по возрасту файл станет старым и папку нужно проверить снова"""
+    
+    VERSION = 1
+    
+    def __init__(self, path: str, rules: str = ""):
+        self.path = path
+        self.rules = rules  # снимок от других правил очистки не годится
+        self.roots: Dict[str, Dict[str, list]] = {}
+    
+    @classmethod
+    def load(cls, path: str, rules: str = "") -> "CleanSnapshot":
+        snapshot = cls(path, rules)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == cls.VERSION and data.get("rules") == rules:
+                snapshot.roots = data.get("roots", {})
+        except (OSError, ValueError):
+            pass
+        return snapshot
+    
+    def save(self):
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump({"version": self.VERSION, "rules": self.rules, "roots": self.roots},
+                          f, ensure_ascii=False, separators=(",", ":"))
+        except OSError:
+            pass
+
+
+def unique_roots(paths: List[str]) -> List[str]:
+    """Существующие папки без повторов и без вложенных в другие папки списка"""
+    roots = []
+    for path in sorted({os.path.normcase(os.path.abspath(p)) for p in paths if p and os.path.isdir(p)}, key=len):
+        if not any(path == root or path.startswith(root.rstrip(os.sep) + os.sep) for root in roots):
+            roots.append(path)
+    return roots
+
+
+class CleanIndex:
+    """Компактный индекс найденных файлов: параллельные массивы вместо объекта на запись"""
+    
+    def __init__(self):
+        self.roots: List[str] = []
+        self.dirs: List[str] = []
+        self.dir_root = array("H")
+        self.dir_parent = array("l")  # -1 у корня
+        self.dir_entries = array("l")  # записей в папке на момент сканирования
+        self.extensions: List[str] = []
+        self._ext_ids: Dict[str, int] = {}
+        self.file_dir = array("l")
+        self.file_ext = array("H")
+        self.sizes = array("q")
+        self.mtimes = array("q")  # секунды
+        self._names = bytearray()  # имена файлов подряд в UTF-8
+        self._name_ends = array("Q")
+    
+    def __len__(self) -> int:
+        return len(self.sizes)
+    
+    @property
+    def total_bytes(self) -> int:
+        return sum(self.sizes)
+    
+    def add_root(self, root: str) -> int:
+        self.roots.append(root)
+        return len(self.roots) - 1
+    
+    def add_dir(self, path: str, root_id: int, parent_id: int) -> int:
+        self.dirs.append(path)
+        self.dir_root.append(root_id)
+        self.dir_parent.append(parent_id)
+        self.dir_entries.append(0)
+        return len(self.dirs) - 1
+    
+    def add_file(self, dir_id: int, name: str, size: int, mtime: float):
+        ext = os.path.splitext(name)[1].lower()
+        ext_id = self._ext_ids.get(ext)
+        if ext_id is None:
+            ext_id = self._ext_ids[ext] = len(self.extensions)
+            self.extensions.append(ext)
+        self.file_dir.append(dir_id)
+        self.file_ext.append(ext_id)
+        self.sizes.append(size)
+        self.mtimes.append(int(mtime))
+        self._names += name.encode("utf-8", "surrogatepass")
+        self._name_ends.append(len(self._names))
+    
+    def name(self, i: int) -> str:
+        start = self._name_ends[i - 1] if i else 0
+        return self._names[start:self._name_ends[i]].decode("utf-8", "surrogatepass")
+    
+    def path(self, i: int) -> str:
+        return os.path.join(self.dirs[self.file_dir[i]], self.name(i))
+    
+    def merge(self, other: "CleanIndex"):
+        """Добавление индекса другого корня (корни сканируются параллельно)"""
+        root_base, dir_base, name_base = len(self.roots), len(self.dirs), len(self._names)
+        self.roots.extend(other.roots)
+        self.dirs.extend(other.dirs)
+        self.dir_root.extend(array("H", (r + root_base for r in other.dir_root)))
+        self.dir_parent.extend(array("l", (p + dir_base if p >= 0 else -1 for p in other.dir_parent)))
+        self.dir_entries.extend(other.dir_entries)
+        ext_map = []
+        for ext in other.extensions:
+            if ext not in self._ext_ids:
+                self._ext_ids[ext] = len(self.extensions)
+                self.extensions.append(ext)
+            ext_map.append(self._ext_ids[ext])
+        self.file_dir.extend(array("l", (d + dir_base for d in other.file_dir)))
+        self.file_ext.extend(array("H", (ext_map[e] for e in other.file_ext)))
+        self.sizes.extend(other.sizes)
+        self.mtimes.extend(other.mtimes)
+        self._names += other._names
+        self._name_ends.extend(array("Q", (end + name_base for end in other._name_ends)))
+    
+    def totals_by_root(self) -> Dict[str, Tuple[int, int]]:
+        """Корень -> (файлов, байт)"""
+        totals = [[0, 0] for _ in self.roots]
+        for dir_id, size in zip(self.file_dir, self.sizes):
+            total = totals[self.dir_root[dir_id]]
+            total[0] += 1
+            total[1] += size
+        return {root: tuple(total) for root, total in zip(self.roots, totals)}
+    
+    def totals_by_extension(self) -> Dict[str, Tuple[int, int]]:
+        """Расширение -> (файлов, байт)"""
+        totals = [[0, 0] for _ in self.extensions]
+        for ext_id, size in zip(self.file_ext, self.sizes):
+            totals[ext_id][0] += 1
+            totals[ext_id][1] += size
+        return {ext: tuple(total) for ext, total in zip(self.extensions, totals)}
+    
+    def select(self, max_keep_bytes: Optional[int] = None, max_delete_bytes: Optional[int] = None) -> List[int]:
+        """Файлы к удалению в пределах лимитов: из кучи берутся самые старые, при равном
+        возрасте - самые крупные, пока в каждом корне не останется не больше max_keep_bytes
+        и всего удалено не больше max_delete_bytes"""
+        need = [0] * len(self.roots)
+        for dir_id, size in zip(self.file_dir, self.sizes):
+            need[self.dir_root[dir_id]] += size
+        if max_keep_bytes is not None:
+            need = [max(0, total - max_keep_bytes) for total in need]
+        unmet = sum(1 for total in need if total > 0)
+        budget = max_delete_bytes
+        
+        heap = [(mtime, -size, i) for i, (mtime, size) in enumerate(zip(self.mtimes, self.sizes))]
+        heapq.heapify(heap)
+        selected = []
+        while heap and unmet and (budget is None or budget > 0):
+            _, size, i = heapq.heappop(heap)
+            size = -size
+            root_id = self.dir_root[self.file_dir[i]]
+            if need[root_id] <= 0 or (budget is not None and size > budget):
+                continue
+            selected.append(i)
+            need[root_id] -= size
+            if need[root_id] <= 0:
+                unmet -= 1
+            if budget is not None:
+                budget -= size
+        selected.sort()
+        return selected
+    
+    def apply(self, selection: Optional[List[int]] = None) -> List[CleanStats]:
+        """Удаление файлов из индекса (всех или только selection) без повторного сканирования;
+        опустевшие папки удаляются"""
+        stats = [CleanStats(root) for root in self.roots]
+        entries = array("l", self.dir_entries)
+        for i in (range(len(self)) if selection is None else selection):
+            dir_id = self.file_dir[i]
+            root_stats = stats[self.dir_root[dir_id]]
+            try:
+                os.remove(self.path(i))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                root_stats.errors += 1
+                continue
+            entries[dir_id] -= 1
+            root_stats.files += 1
+            root_stats.bytes += self.sizes[i]
+        
+        # Подпапки добавляются в индекс позже родителей - идём с конца
+        for dir_id in range(len(self.dirs) - 1, -1, -1):
+            parent = self.dir_parent[dir_id]
+            if parent >= 0 and entries[dir_id] == 0:
+                try:
+                    os.rmdir(self.dirs[dir_id])
+                    entries[parent] -= 1
+                    stats[self.dir_root[dir_id]].dirs_removed += 1
+                except OSError:
+                    pass
+        return stats
+    
+    def save(self, path: str):
+        """Сохранение индекса: строка JSON-заголовка и сырые байты массивов"""
+        arrays = [self.dir_root, self.dir_parent, self.dir_entries, self.file_dir,
+                  self.file_ext, self.sizes, self.mtimes, self._name_ends]
+        header = {"version": 1, "roots": self.roots, "dirs": self.dirs, "extensions": self.extensions,
+                  "arrays": [[a.typecode, len(a)] for a in arrays], "names": len(self._names)}
+        with open(path, "wb") as f:
+            f.write(json.dumps(header, ensure_ascii=False).encode("utf-8", "surrogatepass") + b"\n")
+            for a in arrays:
+                a.tofile(f)
+            f.write(self._names)
+    
+    @classmethod
+    def load(cls, path: str) -> "CleanIndex":
+        index = cls()
+        with open(path, "rb") as f:
+            header = json.loads(f.readline().decode("utf-8", "surrogatepass"))
+            index.roots, index.dirs, index.extensions = header["roots"], header["dirs"], header["extensions"]
+            index._ext_ids = {ext: i for i, ext in enumerate(index.extensions)}
+            arrays = []
+            for typecode, length in header["arrays"]:
+                a = array(typecode)
+                a.fromfile(f, length)
+                arrays.append(a)
+            (index.dir_root, index.dir_parent, index.dir_entries, index.file_dir,
+             index.file_ext, index.sizes, index.mtimes, index._name_ends) = arrays
+            index._names = bytearray(f.read(header["names"]))
+        return index
+
+
+class _DirFrame:
+    """Папка в обходе: сколько в ней осталось записей и сколько подпапок ещё не обработано"""
+    __slots__ = ("path", "parent", "remaining", "pending", "index_id", "children", "dirty", "saved", "due")
+    
+    def __init__(self, path: str, parent: Optional["_DirFrame"]):
+        self.path = path
+        self.parent = parent
+        self.remaining = 0
+        self.pending = 0
+        self.index_id = -1
+        self.children: List[str] = []  # имена подпапок
+        self.dirty = False  # были ошибки - в снимок не попадает, в следующий раз проверим снова
+        self.saved = None  # запись снимка, если папка не менялась
+        self.due: Optional[float] = None  # когда самый старый из молодых файлов дорастёт до min_age
+
+
+class TempCleaner:
+    """Очистка временных файлов: os.scandir, корни параллельно, прогресс по ходу работы"""
+    
+    def __init__(self, policy: Optional[CleanPolicy] = None, workers: int = DEFAULT_WORKERS,
+                 progress: Optional[Callable[[CleanStats], None]] = None,
+                 snapshot: Optional[CleanSnapshot] = None):
+        self.policy = policy or CleanPolicy()
+        self.extensions = tuple(ext.lower() for ext in self.policy.extensions)
+        # Маски собираются в одно регулярное выражение - одна проверка на файл
+        self._globs = self._compile(self.policy.globs)
+        self._exclude = self._compile(self.policy.exclude)
+        self.min_age = self.policy.min_age_days * 86400
+        self.workers = max(1, int(workers))
+        self.progress = progress
+        self.snapshot = snapshot  # при очистке: пропуск папок, не менявшихся с прошлого раза
+    
+    @staticmethod
+    def _compile(patterns: Tuple[str, ...]):
+        if not patterns:
+            return None
+        return re.compile("|".join(fnmatch.translate(p.lower()) for p in patterns))
+    
+    @property
+    def rules(self) -> str:
+        """Отпечаток правил очистки (для проверки снимка)"""
+        policy = self.policy
+        return json.dumps([sorted(self.extensions), sorted(policy.globs), sorted(policy.exclude),
+                           policy.min_age_days], ensure_ascii=False)
+    
+    def matches(self, entry) -> bool:
+        """Подходит ли файл под правила очистки по имени"""
+        name = entry.name.lower()
+        if not (name.endswith(self.extensions) or (self._globs and self._globs.match(name))):
+            return False
+        return not (self._exclude and self._exclude.match(name))
+    
+    def clean(self, roots: List[str]) -> List[CleanStats]:
+        """Очистка всех корней на пуле потоков"""
+        roots = unique_roots(roots)
+        with futures.ThreadPoolExecutor(max_workers=min(self.workers, max(1, len(roots)))) as pool:
+            results = list(pool.map(self.clean_root, roots))
+        if self.snapshot is not None:
+            # Папки, которых больше нет в списке, из снимка убираем
+            self.snapshot.roots = {root: self.snapshot.roots[root] for root in roots if root in self.snapshot.roots}
+        return results
+    
+    def scan(self, roots: List[str]) -> CleanIndex:
+        """Только анализ: индекс подходящих файлов без удаления"""
+        roots = unique_roots(roots)
+        with futures.ThreadPoolExecutor(max_workers=min(self.workers, max(1, len(roots)))) as pool:
+            parts = list(pool.map(self.scan_root, roots))
+        index = CleanIndex()
+        for part in parts:
+            index.merge(part)
+        return index
+    
+    def scan_root(self, root: str) -> CleanIndex:
+        index = CleanIndex()
+        self.clean_root(root, index)
+        return index
+    
+    def clean_root(self, root: str, index: Optional[CleanIndex] = None) -> CleanStats:
+        """Обход одной папки без рекурсии; пустые подпапки удаляются по счётчику, без повторного листинга.
+        С index файлы не удаляются, а записываются в индекс"""
+        stats = CleanStats(root)
+        root_id = index.add_root(root) if index is not None else -1
+        cutoff = time.time() - self.min_age if self.min_age > 0 else float("inf")
+        previous = None
+        current = None
+        if self.snapshot is not None and index is None:
+            previous = self.snapshot.roots.get(root, {})
+            current = self.snapshot.roots[root] = {}
+        
+        stack = [_DirFrame(root, None)]
+        while stack:
+            frame = stack.pop()
+            if index is not None:
+                parent_id = frame.parent.index_id if frame.parent else -1
+                frame.index_id = index.add_dir(frame.path, root_id, parent_id)
+            
+            if previous and self._unchanged(frame, root, previous):
+                # Папка не менялась - подходящих файлов в ней нет, идём сразу в подпапки
+                stats.dirs_skipped += 1
+                frame.pending = len(frame.children)
+                stack.extend(_DirFrame(os.path.join(frame.path, name), frame) for name in frame.children)
+                if not frame.children:
+                    self._finish(frame, stats, root, current)
+                continue
+            
+            subdirs = []
+            try:
+                with os.scandir(frame.path) as it:
+                    for entry in it:
+                        frame.remaining += 1
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.path)
+                                frame.children.append(entry.name)
+                            elif self.matches(entry):
+                                # stat() из DirEntry кэшируется (в Windows приходит вместе с листингом)
+                                st = entry.stat(follow_symlinks=False)
+                                if st.st_mtime > cutoff:
+                                    # Файл ещё молод - запоминаем, когда папку стоит проверить снова
+                                    due = st.st_mtime + self.min_age
+                                    if frame.due is None or due < frame.due:
+                                        frame.due = due
+                                    continue
+                                size = st.st_size
+                                if index is not None:
+                                    index.add_file(frame.index_id, entry.name, size, st.st_mtime)
+                                else:
+                                    os.remove(entry.path)
+                                    frame.remaining -= 1
+                                stats.files += 1
+                                stats.bytes += size
+                                if self.progress and stats.files % PROGRESS_EVERY == 0:
+                                    self.progress(stats)
+                        except OSError:
+                            # Файлы в использовании и без доступа пропускаем
+                            stats.errors += 1
+                            frame.dirty = True
+            except OSError:
+                stats.errors += 1
+                frame.remaining = -1  # содержимое неизвестно - папку не трогаем
+                frame.dirty = True
+            
+            frame.pending = len(subdirs)
+            stack.extend(_DirFrame(path, frame) for path in subdirs)
+            if index is not None:
+                # При анализе ничего не удаляем - запоминаем число записей для apply()
+                index.dir_entries[frame.index_id] = frame.remaining
+            elif not subdirs:
+                self._finish(frame, stats, root, current)
+        
+        if self.progress:
+            self.progress(stats)
+        return stats
+    
+    @staticmethod
+    def _relpath(path: str, root: str) -> str:
+        # os.path.relpath заметно медленнее, а path всегда лежит внутри root
+        return path[len(root):].lstrip(os.sep) or "."
+    
+    def _unchanged(self, frame: _DirFrame, root: str, previous: Dict[str, list]) -> bool:
+        """Совпадает ли mtime папки со снимком; если да - число записей и подпапки берутся из него"""
+        saved = previous.get(self._relpath(frame.path, root))
+        if saved is None or (len(saved) > 3 and time.time() >= saved[3]):
+            return False
+        try:
+            if os.stat(frame.path).st_mtime_ns != saved[0]:
+                return False
+        except OSError:
+            return False
+        frame.remaining = saved[1]
+        frame.children = list(saved[2])
+        frame.saved = saved
+        return True
+    
+    def _finish(self, frame: _DirFrame, stats: CleanStats, root: str = "",
+                snapshot: Optional[Dict[str, list]] = None):
+        """Папка и все её подпапки обработаны: удаляем её, если она опустела, и поднимаемся выше"""
+        while frame is not None:
+            parent = frame.parent
+            removed = False
+            if parent is not None and frame.remaining == 0:
+                try:
+                    os.rmdir(frame.path)
+                    parent.remaining -= 1
+                    parent.children.remove(os.path.basename(frame.path))
+                    stats.dirs_removed += 1
+                    removed = True
+                except OSError:
+                    pass
+            if snapshot is not None and not removed and not frame.dirty:
+                rel = self._relpath(frame.path, root)
+                if frame.saved is not None and frame.remaining == frame.saved[1]:
+                    # Внутри ничего не удалено - запись снимка прежняя
+                    snapshot[rel] = frame.saved
+                else:
+                    # mtime берётся после всех удалений внутри папки
+                    try:
+                        snapshot[rel] = [os.stat(frame.path).st_mtime_ns, frame.remaining, frame.children]
+                        if frame.due is not None:
+                            snapshot[rel].append(frame.due)
+                    except OSError:
+                        pass
+            if parent is None:
+                return
+            parent.pending -= 1
+            if parent.pending:
+                return
+            frame = parent
+
+
+# ========== МОНИТОР ==========
+
+MONITOR_INTERVAL = 1.0  # секунд между выборками
+MONITOR_SAMPLES = 3600  # размер кольцевого буфера (час при опросе раз в секунду)
+MONITOR_WINDOW = 10  # выборок в скользящей статистике на экране
+MONITOR_FIELDS = ("time", "cpu", "mem", "disk_read", "disk_write", "net_recv", "net_sent")
+
+
+class SampleRing:
+    """Кольцевой буфер выборок фиксированного размера: один array('d'), без объектов на выборку"""
+    
+    def __init__(self, fields: Tuple[str, ...], capacity: int = MONITOR_SAMPLES):
+        self.fields = tuple(fields)
+        self.width = len(self.fields)
+        self.capacity = capacity
+        self.count = 0  # записано всего (в буфере - последние capacity)
+        self._data = array("d", bytes(8 * self.width * capacity))
+        self._offsets = {name: i for i, name in enumerate(self.fields)}
+    
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+    
+    def append(self, values: List[float]):
+        start = (self.count % self.capacity) * self.width
+        self._data[start:start + self.width] = array("d", values)
+        self.count += 1
+    
+    def _positions(self, last: Optional[int] = None):
+        n = len(self) if last is None else min(last, len(self))
+        return ((i % self.capacity) * self.width for i in range(self.count - n, self.count))
+    
+    def column(self, name: str, last: Optional[int] = None) -> List[float]:
+        """Значения поля от старых к новым (last - только последние)"""
+        offset = self._offsets[name]
+        return [self._data[pos + offset] for pos in self._positions(last)]
+    
+    def stats(self, name: str, last: Optional[int] = None) -> Tuple[float, float, float]:
+        """(среднее, минимум, максимум) поля"""
+        values = self.column(name, last)
+        if not values:
+            return 0.0, 0.0, 0.0
+        return sum(values) / len(values), min(values), max(values)
+    
+    def rows(self):
+        for pos in self._positions():
+            yield self._data[pos:pos + self.width]
+    
+    def to_csv(self, path: str) -> int:
+        """Выгрузка выборок в CSV, возвращает число строк"""
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.fields)
+            for row in self.rows():
+                writer.writerow([f"{value:.3f}" for value in row])
+        return len(self)
+
+
+class ResourceSampler:
+    """Опрос счётчиков psutil: загрузка по ядрам, память, скорость диска и сети"""
+    
+    def __init__(self):
+        # Первый вызов cpu_percent задаёт точку отсчёта и число ядер
+        self.cores = len(psutil.cpu_percent(percpu=True)) or 1
+        self.fields = MONITOR_FIELDS + tuple(f"cpu{i}" for i in range(self.cores))
+        self._last = None
+    
+    @staticmethod
+    def counters() -> Tuple[float, float, float, float]:
+        disk = psutil.disk_io_counters()
+        net = psutil.net_io_counters()
+        return (disk.read_bytes if disk else 0, disk.write_bytes if disk else 0,
+                net.bytes_recv if net else 0, net.bytes_sent if net else 0)
+    
+    def sample(self) -> List[float]:
+        """Одна выборка: время, CPU, память, байт/с диска и сети, CPU по ядрам"""
+        now = time.time()
+        cores = psutil.cpu_percent(percpu=True)
+        memory = psutil.virtual_memory().percent
+        counters = self.counters()
+        if self._last is None:
+            rates = [0.0] * len(counters)
+        else:
+            elapsed = max(now - self._last[0], 1e-6)
+            rates = [(value - previous) / elapsed for value, previous in zip(counters, self._last[1])]
+        self._last = (now, counters)
+        return [now, sum(cores) / len(cores), memory] + rates + list(cores)
+
+
+class ResourceMonitor:
+    """Опрос ресурсов с заданной частотой в кольцевой буфер; учитывает собственную нагрузку на CPU"""
+    
+    def __init__(self, sampler: Optional[ResourceSampler] = None, interval: float = MONITOR_INTERVAL,
+                 capacity: int = MONITOR_SAMPLES):
+        self.sampler = sampler or ResourceSampler()
+        self.ring = SampleRing(self.sampler.fields, capacity)
+        self.interval = interval
+        self.cpu_time = 0.0
+        self.wall_time = 0.0
+        self._running: Optional[Tuple[float, float]] = None  # (perf_counter, process_time) начала опроса
+    
+    @property
+    def overhead_percent(self) -> float:
+        """Процессорное время монитора в процентах от времени работы (и во время опроса)"""
+        wall, cpu = self.wall_time, self.cpu_time
+        if self._running is not None:
+            wall += time.perf_counter() - self._running[0]
+            cpu += time.process_time() - self._running[1]
+        return 100.0 * cpu / wall if wall else 0.0
+    
+    def run(self, duration: Optional[float] = None, on_sample: Optional[Callable[["ResourceMonitor"], None]] = None,
+            stop: Optional[threading.Event] = None) -> SampleRing:
+        """Опрос до stop, истечения duration или Ctrl+C; тики не накапливают сдвиг"""
+        stop = stop or threading.Event()
+        start = next_tick = time.perf_counter()
+        cpu_start = time.process_time()
+        self._running = (start, cpu_start)
+        try:
+            while not stop.is_set():
+                self.ring.append(self.sampler.sample())
+                if on_sample is not None:
+                    on_sample(self)
+                next_tick += self.interval
+                if duration is not None and next_tick - start > duration:
+                    break
+                stop.wait(max(0.0, next_tick - time.perf_counter()))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._running = None
+            self.wall_time += time.perf_counter() - start
+            self.cpu_time += time.process_time() - cpu_start
+        return self.ring
+    
+    def summary(self, last: Optional[int] = None) -> Dict[str, Dict[str, float]]:
+        """Среднее, минимум и максимум каждого поля (кроме времени)"""
+        result = {}
+        for name in self.ring.fields[1:]:
+            mean, low, high = self.ring.stats(name, last)
+            result[name] = {"mean": round(mean, 2), "min": round(low, 2), "max": round(high, 2)}
+        return result
+    
+    def status_line(self, window: int = MONITOR_WINDOW) -> str:
+        """Скользящая статистика за последние window выборок - одной строкой"""
+        ring = self.ring
+        cpu = ring.stats("cpu", window)[0]
+        busiest = max(ring.stats(f"cpu{i}", window)[0] for i in range(self.sampler.cores))
+        mem = ring.stats("mem", window)[0]
+        rate = {name: ring.stats(name, window)[0] / MB for name in MONITOR_FIELDS[3:]}
+        return (f"CPU {cpu:5.1f}% (ядро до {busiest:5.1f}%) | RAM {mem:4.1f}% | "
+                f"диск ↓{rate['disk_read']:.1f} ↑{rate['disk_write']:.1f} МБ/с | "
+                f"сеть ↓{rate['net_recv']:.2f} ↑{rate['net_sent']:.2f} МБ/с | "
+                f"монитор {self.overhead_percent:.2f}% CPU")
+
+
+# ========== ЗАМЕРЫ ПРОИЗВОДИТЕЛЬНОСТИ ==========
+
+PERF_FILE = "wextweaks_perf.json"
+PERF_REPEATS = 7
+PERF_HISTORY = 10  # прогонов каждой фазы в истории
+PERF_PHASES = ("before", "after")
+
+# Квантили распределения Стьюдента для двустороннего 95% интервала по числу степеней свободы
+_T95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262,
+        10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086, 30: 2.042, 60: 2.000}
+
+
+def t95(df: float) -> float:
+    """Квантиль для ближайшего меньшего числа степеней свободы (интервал не уже истинного)"""
+    known = [limit for limit in _T95 if limit <= df]
+    if not known:
+        return _T95[1]
+    return _T95[max(known)] if df < 120 else 1.96
+
+
+class Estimate(NamedTuple):
+    """Среднее замеров и полуширина 95% доверительного интервала"""
+    mean: float
+    half_width: float
+    n: int
+    variance: float
+
+
+def estimate(values: List[float]) -> Estimate:
+    n = len(values)
+    mean = sum(values) / n
+    variance = sum((v - mean) ** 2 for v in values) / (n - 1) if n > 1 else 0.0
+    return Estimate(mean, t95(n - 1) * (variance / n) ** 0.5 if n > 1 else 0.0, n, variance)
+
+
+def compare_estimates(before: Estimate, after: Estimate) -> Tuple[float, float]:
+    """Разница средних (после - до) и полуширина её 95% интервала (t-критерий Уэлча)"""
+    a, b = before.variance / before.n, after.variance / after.n
+    se = (a + b) ** 0.5
+    if se == 0:
+        return after.mean - before.mean, 0.0
+    df = (a + b) ** 2 / ((a * a / (before.n - 1) if before.n > 1 else 0) +
+                         (b * b / (after.n - 1) if after.n > 1 else 0) or 1e-12)
+    return after.mean - before.mean, t95(df) * se
+
+
+def _perf_cpu(scale: float, workdir: str) -> float:
+    """SHA-256 в памяти на одном ядре, МБ/с"""
+    block = b"\x5a" * MB
+    rounds = max(1, int(48 * scale))
+    digest = hashlib.sha256()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        digest.update(block)
+    return rounds / (time.perf_counter() - start)
+
+
+def _perf_memory(scale: float, workdir: str) -> float:
+    """Копирование большого буфера, ГБ/с"""
+    size = max(MB, int(64 * MB * scale))
+    src, dst = bytearray(size), bytearray(size)
+    rounds = 4
+    start = time.perf_counter()
+    for _ in range(rounds):
+        dst[:] = src
+    return rounds * size / (time.perf_counter() - start) / 1024 ** 3
+
+
+def _perf_file_write(scale: float, workdir: str) -> float:
+    """Последовательная запись с fsync, МБ/с"""
+    block = os.urandom(MB)
+    count = max(1, int(32 * scale))
+    path = os.path.join(workdir, "write.bin")
+    start = time.perf_counter()
+    with open(path, "wb", buffering=0) as f:
+        for _ in range(count):
+            f.write(block)
+        os.fsync(f.fileno())
+    return count / (time.perf_counter() - start)
+
+
+def _perf_file_read(scale: float, workdir: str) -> float:
+    """Последовательное чтение файла (из кэша ОС после записи), МБ/с"""
+    path = os.path.join(workdir, "read.bin")
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            for _ in range(max(1, int(32 * scale))):
+                f.write(os.urandom(MB))
+    size = os.path.getsize(path)
+    start = time.perf_counter()
+    with open(path, "rb", buffering=0) as f:
+        while f.read(MB):
+            pass
+    return size / MB / (time.perf_counter() - start)
+
+
+def _perf_timer(scale: float, workdir: str) -> float:
+    """Опоздание sleep(1 мс) относительно запрошенного, мкс (зависит от разрешения таймера)"""
+    rounds = max(10, int(200 * scale))
+    late = 0.0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        time.sleep(0.001)
+        late += time.perf_counter() - start - 0.001
+    return late / rounds * 1e6
+
+
+def _perf_wakeup(scale: float, workdir: str) -> float:
+    """Задержка пробуждения потока по событию (половина обмена пинг-понг), мкс"""
+    rounds = max(20, int(500 * scale))
+    ping, pong = threading.Event(), threading.Event()
+    
+    def worker():
+        for _ in range(rounds):
+            ping.wait()
+            ping.clear()
+            pong.set()
+    
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    total = 0.0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        ping.set()
+        pong.wait()
+        pong.clear()
+        total += time.perf_counter() - start
+    thread.join()
+    return total / rounds / 2 * 1e6
+
+
+class PerfMetric(NamedTuple):
+    name: str
+    desc: str
+    unit: str
+    higher_is_better: bool
+    func: Callable[[float, str], float]
+
+
+PERF_METRICS = (
+    PerfMetric("cpu", "CPU (SHA-256, одно ядро)", "МБ/с", True, _perf_cpu),
+    PerfMetric("memory", "Пропускная способность памяти", "ГБ/с", True, _perf_memory),
+    PerfMetric("file_write", "Запись файла с fsync", "МБ/с", True, _perf_file_write),
+    PerfMetric("file_read", "Чтение файла", "МБ/с", True, _perf_file_read),
+    PerfMetric("timer", "Опоздание таймера sleep(1 мс)", "мкс", False, _perf_timer),
+    PerfMetric("wakeup", "Пробуждение потока", "мкс", False, _perf_wakeup),
+)
+
+
+class PerfSuite:
+    """Воспроизводимые микробенчмарки: одинаковые объёмы работы, прогрев, повторы для интервалов"""
+    
+    def __init__(self, repeats: int = PERF_REPEATS, scale: float = 1.0,
+                 metrics: Tuple[PerfMetric, ...] = PERF_METRICS):
+        self.repeats = repeats
+        self.scale = scale
+        self.metrics = metrics
+    
+    def run(self, progress: Optional[Callable[[PerfMetric, Estimate], None]] = None) -> Dict[str, List[float]]:
+        """Замеры всех метрик: {имя: [значение каждого повтора]}"""
+        workdir = tempfile.mkdtemp(prefix="wextweaks_perf_")
+        results = {metric.name: [] for metric in self.metrics}
+        try:
+            for metric in self.metrics:
+                metric.func(self.scale, workdir)  # прогрев: кэши, частота CPU, первый доступ к файлу
+            # Повторы чередуются по метрикам: медленный дрейф (нагрев, фоновые задачи) ложится на все поровну
+            for _ in range(self.repeats):
+                for metric in self.metrics:
+                    results[metric.name].append(metric.func(self.scale, workdir))
+            if progress is not None:
+                for metric in self.metrics:
+                    progress(metric, estimate(results[metric.name]))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return results
+
+
+def delta_row(metric: PerfMetric, before: Estimate, after: Estimate, delta: float, half_width: float) -> Dict:
+    """Строка сравнения: значения до и после, изменение в процентах с интервалом;
+    verdict - только если интервал не включает ноль"""
+    if abs(delta) <= half_width:
+        verdict = "same"
+    else:
+        verdict = "better" if (delta > 0) == metric.higher_is_better else "worse"
+    scale = 100.0 / before.mean if before.mean else 0.0
+    return {
+        "metric": metric.name, "desc": metric.desc, "unit": metric.unit,
+        "before": round(before.mean, 3), "before_ci": round(before.half_width, 3),
+        "after": round(after.mean, 3), "after_ci": round(after.half_width, 3),
+        "delta_percent": round(delta * scale, 2), "delta_ci_percent": round(half_width * scale, 2),
+        "verdict": verdict,
+    }
+
+
+def perf_report(before: Dict[str, List[float]], after: Dict[str, List[float]]) -> List[Dict]:
+    """Изменение каждой метрики с 95% интервалом (t-критерий Уэлча)"""
+    rows = []
+    for metric in PERF_METRICS:
+        if metric.name not in before or metric.name not in after:
+            continue
+        b, a = estimate(before[metric.name]), estimate(after[metric.name])
+        rows.append(delta_row(metric, b, a, *compare_estimates(b, a)))
+    return rows
+
+
+class PerfStore:
+    """Результаты замеров в JSON: машина -> профиль -> фаза (before/after) -> последние прогоны"""
+    
+    def __init__(self, path: str = PERF_FILE):
+        self.path = path
+        self.data = {"version": 1, "machines": {}}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                loaded = json.load(f)
+            if loaded.get("version") == 1:
+                self.data = loaded
+        except (OSError, ValueError):
+            pass
+    
+    @staticmethod
+    def machine_key(facts: Dict) -> str:
+        """Ключ машины: имя компьютера, процессор, память и сборка Windows"""
+        desc = "|".join([platform.node()] + [str(facts.get(name, "")) for name in
+                                             ("processor", "cpu_threads", "ram_gb", "os_version")])
+        return hashlib.sha1(desc.encode("utf-8")).hexdigest()[:12]
+    
+    def add(self, machine: str, profile: str, phase: str, metrics: Dict[str, List[float]], **meta):
+        runs = (self.data["machines"].setdefault(machine, {})
+                .setdefault(profile, {}).setdefault(phase, []))
+        runs.append(dict(meta, time=datetime.datetime.now().isoformat(), metrics=metrics))
+        del runs[:-PERF_HISTORY]
+        self.save()
+    
+    def latest(self, machine: str, profile: str, phase: str) -> Optional[Dict]:
+        """Последний прогон фазы: time, repeats, scale, metrics"""
+        runs = self.data["machines"].get(machine, {}).get(profile, {}).get(phase, [])
+        return runs[-1] if runs else None
+    
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+
+# ========== СЕТЬ ==========
+
+ECHO_PORT = 7777  # стандартный порт echo (7) в Linux требует root - его задают явно: --port 7
+NET_COUNT = 200  # замеров задержки на протокол
+NET_RATE = 50.0  # замеров в секунду
+NET_SIZE = 64  # байт в пакете
+NET_TIMEOUT = 1.0  # секунд ожидания ответа; дольше - потеря
+NET_BULK_MB = 4  # объём одного замера пропускной способности TCP
+NET_BULK_RUNS = 5
+NET_BOOTSTRAP = 500  # повторных выборок для интервала перцентилей
+
+
+# Обработчики socketserver - функции с сигнатурой RequestHandlerClass(request, client_address, server):
+# наследование от BaseRequestHandler загружало бы socketserver при импорте модуля
+def _tcp_echo(request, client_address, server):
+    request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    while True:
+        data = request.recv(65536)
+        if not data:
+            break
+        request.sendall(data)
+
+
+def _udp_echo(request, client_address, server):
+    data, sock = request
+    sock.sendto(data, client_address)
+
+
+class EchoServer:
+    """Эхо-сервер TCP и UDP на одном порту в фоновых потоках: для замеров по loopback или со второй машины"""
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.tcp = socketserver.ThreadingTCPServer((host, port), _tcp_echo, bind_and_activate=False)
+        self.tcp.daemon_threads = True
+        self.tcp.allow_reuse_address = True
+        self.tcp.server_bind()
+        self.tcp.server_activate()
+        self.address = self.tcp.server_address[:2]
+        self.udp = socketserver.UDPServer(self.address, _udp_echo)
+        self._threads: List[threading.Thread] = []
+    
+    def start(self) -> "EchoServer":
+        for server in (self.tcp, self.udp):
+            thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.2}, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+    
+    def stop(self):
+        for server in (self.tcp, self.udp):
+            if self._threads:
+                server.shutdown()
+            server.server_close()
+        self._threads.clear()
+    
+    def __enter__(self) -> "EchoServer":
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _pace(start: float, index: int, rate: float):
+    """Ровная частота отправки без накопления сдвига"""
+    delay = start + index / rate - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def echo_tcp(host: str, port: int, count: int = NET_COUNT, rate: float = NET_RATE, size: int = NET_SIZE,
+             timeout: float = NET_TIMEOUT) -> Tuple[List[float], int]:
+    """Задержки TCP в мс по одному соединению (Nagle выключен) и число потерь.
+    После таймаута поток рассинхронизирован - оставшиеся замеры считаются потерянными"""
+    payload = os.urandom(size)
+    rtts = []
+    with socket.create_connection((host, port), timeout) as sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        start = time.perf_counter()
+        try:
+            for index in range(count):
+                _pace(start, index, rate)
+                sent = time.perf_counter()
+                sock.sendall(payload)
+                received = 0
+                while received < size:
+                    chunk = sock.recv(size - received)
+                    if not chunk:
+                        raise ConnectionError("соединение закрыто сервером")
+                    received += len(chunk)
+                rtts.append((time.perf_counter() - sent) * 1000)
+        except (socket.timeout, ConnectionError):
+            pass
+    return rtts, count - len(rtts)
+
+
+def echo_udp(host: str, port: int, count: int = NET_COUNT, rate: float = NET_RATE, size: int = NET_SIZE,
+             timeout: float = NET_TIMEOUT) -> Tuple[List[float], int]:
+    """Задержки UDP в мс и число потерь; опоздавшие ответы на прошлые пакеты отбрасываются по номеру"""
+    family, _, _, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0]
+    payload = os.urandom(max(size, 4))
+    rtts, lost = [], 0
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        sock.connect(address)
+        start = time.perf_counter()
+        for index in range(count):
+            _pace(start, index, rate)
+            seq = index.to_bytes(4, "big")
+            sent = time.perf_counter()
+            sock.send(seq + payload[4:])
+            while True:
+                remaining = sent + timeout - time.perf_counter()
+                if remaining <= 0:
+                    lost += 1
+                    break
+                sock.settimeout(remaining)
+                try:
+                    data = sock.recv(65536)
+                except (socket.timeout, ConnectionRefusedError):  # ConnectionRefused - ICMP "порт недоступен"
+                    lost += 1
+                    break
+                if data[:4] == seq:
+                    rtts.append((time.perf_counter() - sent) * 1000)
+                    break
+    return rtts, lost
+
+
+def echo_throughput(host: str, port: int, megabytes: int = NET_BULK_MB, timeout: float = NET_TIMEOUT * 10) -> float:
+    """Пропускная способность TCP через эхо, МБ/с: отправка и приём идут одновременно"""
+    block = os.urandom(64 * 1024)
+    total = megabytes * MB // len(block) * len(block)
+    received = 0
+    with socket.create_connection((host, port), timeout) as sock:
+        def send():
+            with contextlib.suppress(OSError):
+                for _ in range(total // len(block)):
+                    sock.sendall(block)
+        
+        sender = threading.Thread(target=send, daemon=True)
+        start = time.perf_counter()
+        sender.start()
+        with contextlib.suppress(socket.timeout):
+            while received < total:
+                chunk = sock.recv(MB)
+                if not chunk:
+                    break
+                received += len(chunk)
+        elapsed = time.perf_counter() - start
+        sender.join(timeout)
+    return received / MB / elapsed
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль по рангу (без интерполяции)"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def jitter_samples(rtts: List[float]) -> List[float]:
+    """Разброс задержки: модули разностей соседних замеров"""
+    return [abs(b - a) for a, b in zip(rtts, rtts[1:])]
+
+
+def bootstrap_delta(before: List[float], after: List[float], statistic: Callable[[List[float]], float],
+                    rounds: int = NET_BOOTSTRAP, seed: int = 0) -> Tuple[float, float]:
+    """Разница статистики (после - до) и полуширина её 95% интервала бутстрепа (большая из сторон)"""
+    rng = random.Random(seed)
+    delta = statistic(after) - statistic(before)
+    deltas = sorted(statistic(rng.choices(after, k=len(after))) - statistic(rng.choices(before, k=len(before)))
+                    for _ in range(rounds))
+    low, high = deltas[int(0.025 * rounds)], deltas[int(0.975 * rounds) - 1]
+    return delta, max(delta - low, high - delta, 0.0)
+
+
+def measure_network(host: Optional[str] = None, port: int = ECHO_PORT, count: int = NET_COUNT,
+                    rate: float = NET_RATE, size: int = NET_SIZE, bulk_runs: int = NET_BULK_RUNS) -> Dict[str, List[float]]:
+    """Замеры TCP и UDP; без host - через встроенный эхо-сервер на loopback"""
+    server = EchoServer().start() if host is None else None
+    if server is not None:
+        host, port = server.address
+    try:
+        tcp, tcp_lost = echo_tcp(host, port, count, rate, size)
+        udp, udp_lost = echo_udp(host, port, count, rate, size)
+        echo_throughput(host, port, 1)  # прогрев: окно TCP и буферы сокетов
+        bulk = [echo_throughput(host, port) for _ in range(bulk_runs)]
+    finally:
+        if server is not None:
+            server.stop()
+    return {"tcp_rtt": tcp, "tcp_lost": [tcp_lost], "udp_rtt": udp, "udp_lost": [udp_lost], "tcp_mbps": bulk}
+
+
+def latency_stats(rtts: List[float], lost: int = 0) -> Dict:
+    if not rtts:
+        return {"count": 0, "lost": lost, "loss_percent": 100.0 if lost else 0.0}
+    return {"count": len(rtts), "lost": lost, "loss_percent": round(100 * lost / (len(rtts) + lost), 2),
+            "p50_ms": round(percentile(rtts, 50), 3), "p99_ms": round(percentile(rtts, 99), 3),
+            "mean_ms": round(sum(rtts) / len(rtts), 3), "min_ms": round(min(rtts), 3), "max_ms": round(max(rtts), 3),
+            "jitter_ms": round(sum(jitter_samples(rtts)) / max(len(rtts) - 1, 1), 3)}
+
+
+def network_report(before: Dict[str, List[float]], after: Dict[str, List[float]]) -> List[Dict]:
+    """p50, p99 (бутстреп) и джиттер, пропускная способность (Уэлч) - до и после, с 95% интервалами"""
+    rows = []
+    for proto in ("tcp", "udp"):
+        b, a = before.get(f"{proto}_rtt") or [], after.get(f"{proto}_rtt") or []
+        if len(b) < 2 or len(a) < 2:
+            continue
+        for q in (50, 99):
+            metric = PerfMetric(f"{proto}_p{q}", f"{proto.upper()} задержка p{q}", "мс", False, None)
+            statistic = partial(percentile, q=q)
+            rows.append(delta_row(metric, Estimate(statistic(b), 0.0, len(b), 0.0), Estimate(statistic(a), 0.0, len(a), 0.0),
+                                  *bootstrap_delta(b, a, statistic)))
+        metric = PerfMetric(f"{proto}_jitter", f"{proto.upper()} джиттер", "мс", False, None)
+        jb, ja = estimate(jitter_samples(b)), estimate(jitter_samples(a))
+        rows.append(delta_row(metric, jb, ja, *compare_estimates(jb, ja)))
+    if len(before.get("tcp_mbps") or []) > 1 and len(after.get("tcp_mbps") or []) > 1:
+        metric = PerfMetric("tcp_mbps", "TCP пропускная способность", "МБ/с", True, None)
+        b, a = estimate(before["tcp_mbps"]), estimate(after["tcp_mbps"])
+        rows.append(delta_row(metric, b, a, *compare_estimates(b, a)))
+    return rows
+
+
+# ========== DNS ==========
+
+DNS_PORT = 53
+# Кандидаты (ключ dns_resolvers; можно "адрес:порт")
+DNS_RESOLVERS = ("1.1.1.1", "8.8.8.8", "9.9.9.9", "208.67.222.222", "94.140.14.14", "77.88.8.8")
+# Домены игровых сервисов для кэшированных запросов (ключ dns_domains)
+DNS_DOMAINS = ("steampowered.com", "steamcommunity.com", "epicgames.com", "riotgames.com", "battle.net",
+               "xboxlive.com", "ea.com", "ubisoft.com", "discord.com", "twitch.tv")
+DNS_ROUNDS = 3  # повторов кэшированных запросов
+DNS_CONCURRENCY = 32  # одновременных запросов к одному серверу
+DNS_TIMEOUT = 2.0
+DNS_MAX_FAILURES = 0.1  # сервер с большей долей неотвеченных запросов ставится в конец
+DNS_CACHED_WEIGHT = 0.7  # вес кэшированных ответов в оценке: большинство запросов игры - к знакомым доменам
+
+
+def dns_query(name: str, qid: int, qtype: int = 1) -> bytes:
+    """Запрос DNS: заголовок с RD, один вопрос (тип A, класс IN)"""
+    qname = b"".join(bytes([len(label)]) + label for label in name.encode("ascii").split(b".") if label) + b"\0"
+    return struct.pack(">HHHHHH", qid, 0x0100, 1, 0, 0, 0) + qname + struct.pack(">HH", qtype, 1)
+
+
+def parse_resolver(resolver: str) -> Tuple[str, int]:
+    host, _, port = resolver.rpartition(":") if resolver.count(":") == 1 else (resolver, "", "")
+    return host, int(port) if port else DNS_PORT
+
+
+class _DnsClient:
+    """Протокол asyncio: один UDP-сокет на сервер, ответы сопоставляются запросам по id"""
+    
+    def __init__(self):
+        self.transport = None
+        self.pending: Dict[int, "asyncio.Future"] = {}
+    
+    def connection_made(self, transport):
+        self.transport = transport
+    
+    def datagram_received(self, data: bytes, addr):
+        if len(data) < 12:
+            return
+        qid, flags = struct.unpack_from(">HH", data)
+        future = self.pending.pop(qid, None)
+        if future is not None and not future.done():
+            future.set_result(flags & 0xF)
+    
+    def error_received(self, exc: Exception):
+        # ICMP "порт недоступен": сервер не отвечает ни на один запрос
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self.pending.clear()
+    
+    def connection_lost(self, exc: Optional[Exception]):
+        pass
+    
+    async def query(self, name: str, timeout: float) -> float:
+        """Время ответа в мс; NXDOMAIN - тоже ответ"""
+        qid = random.getrandbits(16)
+        while qid in self.pending:
+            qid = random.getrandbits(16)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[qid] = future
+        start = time.perf_counter()
+        self.transport.sendto(dns_query(name, qid))
+        try:
+            rcode = await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(qid, None)
+        if rcode not in (0, 3):
+            raise OSError(f"{name}: код ответа {rcode}")
+        return (time.perf_counter() - start) * 1000
+
+
+class DnsResult(NamedTuple):
+    """Итог сервера: медианы холодных (домен не в кэше сервера) и кэшированных ответов"""
+    resolver: str
+    cold_ms: Optional[float]
+    cached_ms: Optional[float]
+    cached_p99_ms: Optional[float]
+    queries: int
+    failures: int
+    
+    @property
+    def failure_rate(self) -> float:
+        return self.failures / self.queries if self.queries else 1.0
+    
+    @property
+    def score(self) -> float:
+        if self.cold_ms is None or self.cached_ms is None:
+            return float("inf")
+        return DNS_CACHED_WEIGHT * self.cached_ms + (1 - DNS_CACHED_WEIGHT) * self.cold_ms
+    
+    def as_dict(self) -> Dict:
+        return dict(self._asdict(), failure_rate=round(self.failure_rate, 3),
+                    score=None if self.score == float("inf") else round(self.score, 3))
+
+
+async def _open_resolver(resolver: str, local_addr: Optional[Tuple[str, int]]) -> Optional[Tuple[object, _DnsClient]]:
+    """UDP-сокет к серверу: (transport, клиент) или None, если сокет не открылся"""
+    host, port = parse_resolver(resolver)
+    try:
+        return await asyncio.get_running_loop().create_datagram_endpoint(
+            _DnsClient, remote_addr=(host, port), local_addr=local_addr)
+    except OSError:
+        return None
+
+
+async def _query_phase(endpoint, names: List[str], concurrency: int, timeout: float) -> List[Optional[float]]:
+    """Запросы к одному серверу (не больше concurrency одновременно): время ответа в мс или None"""
+    if endpoint is None:
+        return [None] * len(names)
+    client = endpoint[1]
+    limit = asyncio.Semaphore(concurrency)
+    
+    async def timed(name: str) -> Optional[float]:
+        async with limit:
+            try:
+                return await client.query(name, timeout)
+            except (asyncio.TimeoutError, OSError):
+                return None
+    
+    return await asyncio.gather(*(timed(name) for name in names))
+
+
+def _dns_result(resolver: str, cold: List[Optional[float]], cached: List[Optional[float]]) -> DnsResult:
+    cold_ok = [t for t in cold if t is not None]
+    cached_ok = [t for t in cached if t is not None]
+    return DnsResult(resolver,
+                     round(percentile(cold_ok, 50), 3) if cold_ok else None,
+                     round(percentile(cached_ok, 50), 3) if cached_ok else None,
+                     round(percentile(cached_ok, 99), 3) if cached_ok else None,
+                     len(cold) + len(cached), len(cold) + len(cached) - len(cold_ok) - len(cached_ok))
+
+
+def benchmark_resolvers(resolvers: Tuple[str, ...] = DNS_RESOLVERS, domains: Tuple[str, ...] = DNS_DOMAINS,
+                        rounds: int = DNS_ROUNDS, concurrency: int = DNS_CONCURRENCY, timeout: float = DNS_TIMEOUT,
+                        local_addr: Optional[Tuple[str, int]] = None) -> List[DnsResult]:
+    """Все серверы опрашиваются одновременно, по фазам: холодные запросы, прогрев, кэшированные.
+    Фазы не перекрываются - кэшированные ответы не ждут в очереди за холодными. Результат - от лучшего к худшему"""
+    async def run_all():
+        endpoints = await asyncio.gather(*(_open_resolver(resolver, local_addr) for resolver in resolvers))
+        
+        async def phase(names: List[str]) -> List[List[Optional[float]]]:
+            return await asyncio.gather(*(_query_phase(endpoint, names, concurrency, timeout)
+                                          for endpoint in endpoints))
+        
+        # Холодные: случайный поддомен точно не в кэше - сервер идёт к авторитетным серверам домена
+        token = f"{random.getrandbits(32):08x}"
+        try:
+            cold = await phase([f"wex{token}{i}.{domain}" for i, domain in enumerate(domains)])
+            await phase(list(domains))  # прогрев кэша серверов
+            cached = [[] for _ in resolvers]
+            for _ in range(rounds):
+                # Повторы - раундами, по запросу на домен: нагрузка как у холодной фазы
+                for times, more in zip(cached, await phase(list(domains))):
+                    times.extend(more)
+        finally:
+            for endpoint in endpoints:
+                if endpoint is not None:
+                    endpoint[0].close()
+        return [_dns_result(resolver, *times) for resolver, times in zip(resolvers, zip(cold, cached))]
+    
+    results = asyncio.run(run_all())
+    return sorted(results, key=lambda result: (result.failure_rate > DNS_MAX_FAILURES, result.score))
+
+
+def dns_interfaces() -> Dict[str, str]:
+    """Активные сетевые интерфейсы с IPv4 (кроме loopback): имя -> адрес"""
+    stats = psutil.net_if_stats()
+    interfaces = {}
+    for name, addresses in psutil.net_if_addrs().items():
+        if name not in stats or not stats[name].isup:
+            continue
+        for address in addresses:
+            if address.family == socket.AF_INET and not address.address.startswith("127."):
+                interfaces[name] = address.address
+                break
+    return interfaces
+
 
 class WexTweaksGaming:
     def __init__(self):
         self.total_optimizations = 0
-        self.estimated_fps_boost = 0
         self.gaming_optimizations = []
         self.config_file = "wextweaks_config.json"
         self.log_file = "wextweaks.log"
+        self._logger: Optional[LogWriter] = None
+        self.profile = RunProfile()
+        self.profile_file = "wextweaks_profile.json"
+        self.trace_file = "wextweaks_trace.json"  # открывается в chrome://tracing или ui.perfetto.dev
         self.backup_dir = "wextweaks_backup"
-        self.is_admin = self.check_admin()
-        self.system_info = self.get_detailed_system_info()
-        self.os_version = self.get_windows_version()
+        self.journal_file = JOURNAL_FILE
+        self.journal: Optional[ApplyJournal] = None  # ведётся только во время полной оптимизации
+        self.clean_snapshot_file = "wextweaks_clean_snapshot.json"
+        self.perf_file = PERF_FILE
+        # Реестр, службы, процессы, питание и команды - через бэкенды платформы (вне Windows - имитация в памяти)
+        self.platform = create_platform()
+        self.registry = self.platform.registry
+        self.services = self.platform.services
+        self.executor = self.platform.executor
+        self.processes = self.platform.processes
+        self.power = self.platform.power
+        self.session_file = SESSION_FILE
+        if os.path.exists(self.session_file):
+            # Прошлая игровая сессия завершилась аварийно - фоновые программы ещё приостановлены
+            GameSession.resume_leftovers(self.processes, self.session_file)
+        self.catalog = None
+        self._plans = {}
+        self._lock = threading.Lock()
+        # Сведения о системе собираются при первом обращении (и берутся из кэша, если система та же)
+        self.facts = SystemFacts(self.registry)
+        self._is_admin: Optional[bool] = None
         self.load_config()
+    
+    @property
+    def is_admin(self) -> bool:
+        if self._is_admin is None:
+            self._is_admin = bool(self.check_admin())
+        return self._is_admin
+    
+    @property
+    def os_version(self) -> str:
+        return self.facts.get("os_version")
+    
+    @property
+    def system_info(self) -> Dict:
+        return self.facts.facts
         
     def check_admin(self) -> bool:
         """Проверка прав администратора"""
-        try:
-            return ctypes.windll.shell32.IsUserAnAdmin()
-        except:
-            return False
+        return self.platform.is_admin()
     
     def get_windows_version(self) -> str:
         """Получение точной версии Windows"""
-        try:
-            # Читаем версию из реестра
-            key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, 
-                                r"SOFTWARE\Microsoft\Windows NT\CurrentVersion")
-            
-            product_name = winreg.QueryValueEx(key, "ProductName")[0]
-            build_number = winreg.QueryValueEx(key, "CurrentBuildNumber")[0]
-            winreg.CloseKey(key)
-            
-            # Определяем версию
-            if "Windows 11" in product_name:
-                return f"Windows 11 (Build {build_number})"
-            elif "Windows 10" in product_name:
-                return f"Windows 10 (Build {build_number})"
-            else:
-                return product_name
-                
-        except Exception as e:
-            return f"Windows {platform.release()}"
+        return self.facts.get("os_version")
     
     def get_detailed_system_info(self) -> Dict:
         """Получение детальной информации о системе"""
-        info = {
-            'os': platform.system(),
-            'version': platform.version(),
-            'release': platform.release(),
-            'architecture': platform.architecture()[0],
-            'processor': platform.processor(),
-            'ram_gb': round(psutil.virtual_memory().total / (1024**3), 1),
-            'cpu_cores': psutil.cpu_count(logical=False),
-            'cpu_threads': psutil.cpu_count(logical=True),
-            'windows_edition': self.get_windows_edition()
-        }
-        return info
+        return self.facts.facts
     
     def get_windows_edition(self) -> str:
         """Получение редакции Windows"""
-        try:
-            key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, 
-                                r"SOFTWARE\Microsoft\Windows NT\CurrentVersion")
-            edition = winreg.QueryValueEx(key, "EditionID")[0]
-            winreg.CloseKey(key)
-            return edition
-        except:
-            return "Unknown"
+        return self.facts.get("windows_edition")
     
     def clear_screen(self):
         """Очистка экрана"""
@@ -169,12 +4059,12 @@ class WexTweaksGaming:
             print(f"     {Colors.WHITE}{desc}")
         
         print(f"{Colors.CYAN}{'─'*70}")
-        print(f"{Colors.YELLOW}📈 Ожидаемый прирост FPS: {Colors.GREEN}+{self.estimated_fps_boost}%")
+        print(f"{Colors.YELLOW}📏 Замеры до/после: {Colors.GREEN}{self.measured_summary()}")
         print(f"{Colors.YELLOW}🔧 Выполнено оптимизаций: {Colors.CYAN}{self.total_optimizations}")
         print(f"{Colors.CYAN}{'─'*70}")
     
-    def log(self, message: str, level: str = "info"):
-        """Логирование"""
+    def log(self, message: str, level: str = "info", **fields):
+        """Логирование (fields - данные операции для лога в формате JSON lines)"""
         timestamp = datetime.datetime.now().strftime("%H:%M:%S")
         
         if COLORAMA_AVAILABLE:
@@ -194,63 +4084,265 @@ class WexTweaksGaming:
                 "gaming": ""
             }
         
-        icons = {
-            "success": "✅",
-            "error": "❌",
-            "warning": "⚠️",
-            "info": "ℹ️",
-            "gaming": "🎮"
-        }
+        color = colors.get(level, Colors.WHITE)
+        icon = LOG_ICONS.get(level, "•")
+        
+        log_line = f"[{timestamp}] {icon} {message}"
+        print(f"{color}{log_line}")
+        
+        # Запись в файл - в фоновом потоке, вывод в консоль не ждёт диска
+        self.logger.write(level, message, **fields)
+    
+    @property
+    def logger(self) -> LogWriter:
+        """Запись лога в файл (ключи log_format, log_max_mb, log_backups в конфигурации)"""
+        if self._logger is None or self._logger.path != self.log_file:
+            if self._logger is not None:
+                self._logger.close()
+            # Лог может понадобиться до загрузки конфигурации
+            config = getattr(self, "config", {})
+            self._logger = LogWriter(self.log_file, int(config.get("log_max_mb", 1) * MB),
+                                     config.get("log_backups", LOG_BACKUPS),
+                                     json_lines=config.get("log_format") == "json")
+        return self._logger
+    
+    def record_success(self, desc: str):
+        """Учёт успешно выполненной оптимизации"""
+        with self._lock:
+            self.total_optimizations += 1
+            self.gaming_optimizations.append({
+                "time": datetime.datetime.now().isoformat(),
+                "command": desc
+            })
+    
+    def apply_registry(self, tweaks: List[Tuple[RegTweak, str]]) -> int:
+        """Запись значений реестра напрямую через бэкенд, без reg.exe"""
+        descs = {id(tweak): desc for tweak, desc in tweaks}
+        success = 0
+        with self.profile.measure(f"Реестр: {len(tweaks)} знач.", "registry"):
+            results = apply_registry_tweaks(self.registry, [t for t, _ in tweaks])
+        for tweak, error in results:
+            desc = descs[id(tweak)]
+            if error is None:
+                self.record_success(desc)
+                self.log(f"{desc}: готово", "success")
+                success += 1
+            else:
+                self.log(f"{desc}: ошибка реестра: {error[:100]}", "warning")
+        report_failures(len(results) - success)
+        return success
+    
+    def get_catalog(self) -> TweakCatalog:
+        """Каталог твиков (файл читается при первом обращении)"""
+        if self.catalog is None:
+            self.catalog = TweakCatalog(resource_path(CATALOG_FILE))
+        return self.catalog
+    
+    def get_plan(self, stages: Tuple[str, ...], **facts) -> List[PlanOp]:
+        """Скомпилированный план для этапов (каталог читается один раз, план кэшируется)"""
+        facts = dict(facts, os=self.os_version)
+        memo_key = (stages, tuple(sorted(facts.items())))
+        if memo_key not in self._plans:
+            self._plans[memo_key] = self.get_catalog().compile(stages, facts)
+        return self._plans[memo_key]
+    
+    def get_profile_plan(self, name: str) -> Tuple[List[PlanOp], Tuple[str, ...]]:
+        """План профиля и его задачи вне каталога (компилируется один раз, кэшируется)"""
+        facts = {"os": self.os_version}
+        memo_key = ("profile", name, facts["os"])
+        if memo_key not in self._plans:
+            self._plans[memo_key] = self.get_catalog().compile_profile(name, facts)
+        return self._plans[memo_key]
+    
+    @property
+    def preset(self) -> Optional[str]:
+        """Профиль для полной оптимизации из меню (ключ preset в конфигурации, None - все этапы)"""
+        return self.config.get("preset")
+    
+    @staticmethod
+    def stage_ops(plan: List[PlanOp], stage: str) -> List[PlanOp]:
+        """Операции одного этапа из общего плана"""
+        return [op for op in plan if op.stage == stage]
+    
+    @property
+    def workers(self) -> int:
+        """Число потоков для независимых операций (ключ workers в конфигурации)"""
+        return self.config.get("workers", DEFAULT_WORKERS)
+    
+    @property
+    def diff_mode(self) -> bool:
+        """Режим "сначала сравнить": применяются только отличия от текущего состояния"""
+        return self.config.get("diff_mode", False)
+    
+    @property
+    def clean_policy(self) -> CleanPolicy:
+        """Правила очистки (ключ clean_policy в конфигурации)"""
+        return CleanPolicy.from_config(self.config.get("clean_policy", {}))
+    
+    def diff_plan(self, ops: List[PlanOp]) -> Tuple[List[PlanOp], List[PlanOp]]:
+        """Сравнение плана с текущим состоянием системы: (нужно применить, уже применено)"""
+        # Значения реестра и типы запуска служб читаются одной пачкой
+        state_ops = [op for op in ops if op.kind in ("reg", "service")]
+        tweaks = [op.target if op.kind == "reg" else service_start_tweak(op.target) for op in state_ops]
+        current = dict(zip((op.id for op in state_ops), read_registry_values(self.registry, tweaks)))
+        
+        # Каждая команда-проба (например, netsh int tcp show global) запускается один раз
+        probes = list(OrderedDict.fromkeys(op.check[0] for op in ops if op.check and not op.maintenance))
+        outputs = {}
+        start = time.perf_counter()
+        for result in self.executor.run_many(probes, self.workers, deadline=COMMAND_TIMEOUT):
+            outputs[result.command] = result.stdout
+            self.profile.record(result.command, "probe", start, start + result.duration, result.spawn_s,
+                                result.returncode, result.output_bytes, stage="diff")
         
-        color = colors.get(level, Colors.WHITE)
-        icon = icons.get(level, "•")
+        pending, applied = [], []
+        for op in ops:
+            if op.kind == "reg":
+                value = current[op.id]
+                done = value is not None and value[1] == op.target.type and value[0] == op.target.data
+            elif op.kind == "service":
+                # Нет Start - нет и службы, отключать нечего
+                value = current[op.id]
+                done = value is None or value[0] == SERVICE_DISABLED
+            elif op.maintenance:
+                done = True
+            else:
+                done = bool(op.check) and re.search(op.check[1], outputs.get(op.check[0], "")) is not None
+            (applied if done else pending).append(op)
+        return pending, applied
+    
+    def execute_op(self, op: PlanOp):
+        """Выполнение одной команды плана (реестр и службы выполняются пачками)"""
+        ok = self.run_cmd(op.target, op.desc)
+        if not ok:
+            report_failures()
+        return ok
+    
+    def plan_tasks(self, ops: List[PlanOp]) -> List[Task]:
+        """Задачи планировщика: значения реестра этапа и службы этапа - по одной задаче, команды - по одной"""
+        task_of = {}
+        batches = OrderedDict()
+        for op in ops:
+            task_of[op.id] = op_task_id(op)
+            if op.kind in BATCH_TASKS:
+                batches.setdefault((op.stage, op.kind), []).append(op)
         
-        log_line = f"[{timestamp}] {icon} {message}"
-        print(f"{color}{log_line}")
+        def deps(group, task_id):
+            # Зависимости от операций, не попавших в план, пропускаем
+            return tuple(sorted({task_of[dep] for op in group for dep in op.after if dep in task_of} - {task_id}))
+        
+        # Задачи идут в порядке плана: пачка - на месте первой своей операции этапа
+        tasks = []
+        for op in ops:
+            if op.kind not in BATCH_TASKS:
+                tasks.append(Task(op.id, op.stage, partial(self.execute_op, op), deps([op], op.id)))
+            elif (op.stage, op.kind) in batches:
+                group = batches.pop((op.stage, op.kind))
+                task_id = task_of[op.id]
+                if op.kind == "reg":
+                    func = partial(self.apply_registry, [(item.target, item.desc) for item in group])
+                else:
+                    func = partial(self.disable_services, group)
+                tasks.append(Task(task_id, op.stage, func, deps(group, task_id)))
+        return tasks
+    
+    def run_plan(self, ops: List[PlanOp], extra_tasks: List[Task] = ()) -> ScheduleReport:
+        """Параллельное выполнение плана; порядок соблюдается только там, где задан after"""
+        started = time.perf_counter()
+        applied = []
+        if self.diff_mode:
+            ops, applied = self.diff_plan(ops)
+            if applied:
+                self.log(f"Уже применено, пропускаем: {len(applied)}", "info")
         
-        # Запись в файл
+        tasks = self.plan_tasks(ops) + list(extra_tasks)
+        if self.journal is not None:
+            ops_of = {}
+            for op in ops:
+                ops_of.setdefault(op_task_id(op), []).append(op)
+            tasks = [task._replace(func=partial(self._journaled, task, ops_of.get(task.id, [])))
+                     for task in tasks]
+        report = TaskScheduler(self.workers).run(tasks)
+        report.started = started  # время сравнения с текущим состоянием входит в общее
+        for op in applied:
+            report.skipped[op.stage] = report.skipped.get(op.stage, 0) + 1
+        for task_id, error in report.errors.items():
+            self.log(f"{task_id}: {error[:100]}", "error")
+        return report
+    
+    def _journaled(self, task: Task, ops: List[PlanOp]):
+        """Задача под журналом: прежние значения - на диск, затем изменение, затем отметка о выполнении"""
+        power_scheme = self.active_power_scheme() if task.stage == "power" else None
+        values = self.plan_registry_values(ops)
+        if values or power_scheme:
+            previous = RegistryBackup.capture(self.registry, values).values
+            self.journal.write_ahead(task.id, previous, power_scheme)
+        result = task.func()
+        self.journal.commit(task.id, [op.id for op in ops])
+        return result
+    
+    def active_power_scheme(self) -> Optional[str]:
+        """GUID активной схемы питания"""
         try:
-            with open(self.log_file, "a", encoding="utf-8") as f:
-                f.write(log_line + "\n")
-        except:
-            pass
+            return self.power.active()
+        except OSError:
+            return None
     
-    def run_cmd(self, command: str, desc: str, fps_boost: int = 0, show_output: bool = False) -> bool:
+    def pending_journal(self) -> Optional[JournalState]:
+        """Журнал прерванной полной оптимизации (None - если прошлый прогон завершён)"""
+        state = ApplyJournal.read(self.journal_file)
+        return state if state is not None and not state.finished else None
+    
+    def rollback_journal(self, state: JournalState) -> bool:
+        """Откат прерванного прогона по журналу: прежние значения реестра и схема питания"""
+        with self.profile.measure(f"Откат: {len(state.registry)} знач.", "registry", stage="rollback"):
+            results = RegistryBackup(state.registry).restore(self.registry)
+        failed = [(tweak, error) for tweak, error in results if error]
+        for tweak, error in failed:
+            self.log(f"{tweak.key}\\{tweak.value}: ошибка отката: {error[:100]}", "warning")
+        if state.power_scheme:
+            error = self.power.set_active(state.power_scheme)
+            if error:
+                self.log(f"Прежняя схема питания: {error}", "warning")
+        ApplyJournal(self.journal_file).finish("rollback")
+        self.log(f"Откат по журналу: {len(results) - len(failed)} из {len(results)} значений",
+                 "success" if not failed else "warning")
+        return not failed
+    
+    def execute_plan(self, ops: List[PlanOp]) -> int:
+        """Выполнение операций плана, возвращает число успешных (и уже применённых)"""
+        return self.run_plan(ops).done()
+    
+    def run_cmd(self, command: str, desc: str, show_output: bool = False) -> bool:
         """Выполнение команды с обработкой ошибок - ИСПРАВЛЕННАЯ"""
+        tweak = parse_reg_add(command)
+        if tweak is not None:
+            return self.apply_registry([(tweak, desc)]) == 1
+        
         self.log(f"Выполняем: {desc}", "info")
         
+        start = time.perf_counter()
         try:
-            # Для EXE файлов - избегаем проблем с путями PyInstaller
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                encoding='cp866',
-                timeout=30,
-                cwd=os.environ.get('SystemRoot', 'C:\\Windows')  # Рабочий каталог System32
-            )
-            
-            if show_output and result.stdout:
-                print(f"{Colors.CYAN}{result.stdout}")
+            # Вывод показывается построчно по мере выполнения, а не после завершения
+            on_output = self._print_output if show_output else None
+            result = self.executor.run(command, on_output=on_output)
+            self.profile.record(desc, "cmd", start, time.perf_counter(), result.spawn_s,
+                                result.returncode, result.output_bytes)
             
+            fields = {"op": desc, "returncode": result.returncode,
+                      "duration_s": round(time.perf_counter() - start, 4)}
             if result.returncode in [0, 1]:  # 1 часто нормальный код
-                self.total_optimizations += 1
-                self.estimated_fps_boost += fps_boost
-                self.gaming_optimizations.append({
-                    "time": datetime.datetime.now().isoformat(),
-                    "command": desc,
-                    "fps_boost": fps_boost
-                })
-                self.log(f"Успешно! (+{fps_boost}% FPS)", "success")
+                self.record_success(desc)
+                self.log("Успешно!", "success", **fields)
                 return True
             else:
                 if result.stderr and "не является внутренней" not in result.stderr:
-                    self.log(f"Ошибка: {result.stderr[:100]}", "warning")
+                    self.log(f"Ошибка: {result.stderr[:100]}", "warning", **fields)
                 return False
                 
         except subprocess.TimeoutExpired:
-            self.log("Таймаут выполнения", "warning")
+            self.profile.record(desc, "cmd", start, time.perf_counter())
+            self.log("Таймаут выполнения", "warning", op=desc, duration_s=round(time.perf_counter() - start, 4))
             return False
         except Exception as e:
             # Игнорируем ошибки PyInstaller временных файлов
@@ -260,13 +4352,17 @@ class WexTweaksGaming:
             self.log(f"Ошибка: {str(e)[:100]}", "error")
             return False
     
+    @staticmethod
+    def _print_output(command: str, stream: str, line: str):
+        if line and stream == "stdout":
+            print(f"{Colors.CYAN}{line}")
+    
     def load_config(self):
         """Загрузка конфигурации"""
         if os.path.exists(self.config_file):
             try:
                 with open(self.config_file, 'r', encoding='utf-8') as f:
                     self.config = json.load(f)
-                    self.estimated_fps_boost = self.config.get('fps_boost', 0)
             except:
                 self.config = {}
         else:
@@ -274,7 +4370,7 @@ class WexTweaksGaming:
     
     def save_config(self):
         """Сохранение конфигурации"""
-        self.config['fps_boost'] = self.estimated_fps_boost
+        self.config.pop('fps_boost', None)  # оценка прироста FPS из старых версий
         self.config['last_run'] = datetime.datetime.now().isoformat()
         self.config['os_version'] = self.os_version
         
@@ -284,32 +4380,64 @@ class WexTweaksGaming:
         except:
             pass
     
-    def create_registry_backup(self):
-        """Создание бэкапа реестра"""
+    @staticmethod
+    def plan_registry_values(plan: List[PlanOp]) -> List[RegTweak]:
+        """Все значения реестра, которые изменит план (включая тип запуска служб)"""
+        tweaks = []
+        for op in plan:
+            if op.kind == "reg":
+                tweaks.append(op.target)
+            elif op.kind == "service":
+                tweaks.append(service_start_tweak(op.target))
+            else:
+                tweak = parse_reg_add(op.target)
+                if tweak is not None:
+                    tweaks.append(tweak)
+        return tweaks
+    
+    def create_registry_backup(self, plan: Optional[List[PlanOp]] = None) -> Optional[str]:
+        """Бэкап ровно тех значений реестра, которые затронет план; возвращает путь к файлу"""
         if not os.path.exists(self.backup_dir):
             os.makedirs(self.backup_dir)
         
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = os.path.join(self.backup_dir, f"registry_backup_{timestamp}.reg")
+        backup_file = os.path.join(self.backup_dir, f"registry_backup_{timestamp}.json")
+        plan = plan if plan is not None else self.get_plan(FULL_STAGES)
         
         try:
-            # Создаем бэкап через reg export
-            keys_to_backup = [
-                r"HKCU\Software\Microsoft\GameBar",
-                r"HKCU\System\GameConfigStore",
-                r"HKLM\SYSTEM\CurrentControlSet\Control\PriorityControl"
-            ]
-            
-            with open(backup_file, 'w', encoding='utf-8') as f:
-                f.write("Windows Registry Editor Version 5.00\n\n")
-                f.write(f"; WexTweaks Backup - {timestamp}\n")
-                f.write(f"; System: {self.os_version}\n\n")
-            
-            self.log(f"Бэкап создан: {backup_file}", "success")
-            return True
-        except Exception as e:
+            with self.profile.measure("Бэкап реестра", "registry", stage="backup"):
+                backup = RegistryBackup.capture(self.registry, self.plan_registry_values(plan),
+                                                created=timestamp, system=self.os_version)
+                backup.save(backup_file)
+            self.log(f"Бэкап создан: {backup_file} (значений: {len(backup)})", "success")
+            return backup_file
+        except (OSError, ValueError) as e:
             self.log(f"Ошибка создания бэкапа: {e}", "error")
+            return None
+    
+    def latest_backup(self) -> Optional[str]:
+        """Последний бэкап реестра (имена файлов сортируются по времени создания)"""
+        if not os.path.isdir(self.backup_dir):
+            return None
+        names = sorted(name for name in os.listdir(self.backup_dir)
+                       if name.startswith("registry_backup_") and name.endswith(".json"))
+        return os.path.join(self.backup_dir, names[-1]) if names else None
+    
+    def restore_registry_backup(self, path: str) -> bool:
+        """Возврат значений реестра из бэкапа: прежние данные записываются, новые значения удаляются"""
+        try:
+            backup = RegistryBackup.load(path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.log(f"Не удалось прочитать бэкап {path}: {e}", "error")
             return False
+        with self.profile.measure(f"Восстановление: {len(backup)} знач.", "registry", stage="restore"):
+            results = backup.restore(self.registry)
+        failed = [(tweak, error) for tweak, error in results if error]
+        for tweak, error in failed:
+            self.log(f"{tweak.key}\\{tweak.value}: ошибка восстановления: {error[:100]}", "warning")
+        self.log(f"Восстановлено значений реестра: {len(results) - len(failed)} из {len(results)} ({path})",
+                 "success" if not failed else "warning")
+        return not failed
     
     # ========== ОСНОВНЫЕ ФУНКЦИИ ==========
     
@@ -332,363 +4460,322 @@ class WexTweaksGaming:
         print(f"  5. Отключение ненужных служб")
         print(f"  6. Очистка временных файлов")
         print(f"  7. Оптимизация реестра и системных настроек")
+        if self.preset:
+            print(f"{Colors.CYAN}  Профиль {self.preset}: только его твики (ключ preset в конфигурации)")
+        measure = self.config.get("measure", False)
+        if measure:
+            print(f"{Colors.CYAN}  Замеры производительности до и после (ключ measure в конфигурации)")
         
         confirm = input(f"\n{Colors.YELLOW}Продолжить? (y/n): ")
         if confirm.lower() != 'y':
             return
         
-        # Создаем бэкап
-        self.create_registry_backup()
+        # Прошлый прогон прерван (таймаут, сбой, Ctrl+C) - откатываем его по журналу или продолжаем
+        resume = self.pending_journal()
+        if resume is not None:
+            print(f"\n{Colors.YELLOW}⚠️  Прошлая оптимизация прервана (выполнено задач: {len(resume.done_tasks)})")
+            choice = input(f"{Colors.YELLOW}[r] продолжить, [u] откатить, [n] начать заново: ").lower()
+            if choice == 'u':
+                self.rollback_journal(resume)
+                input(f"\n{Colors.CYAN}Нажмите Enter для продолжения...")
+                return
+            if choice != 'r':
+                resume = None
         
-        optimizations = [
-            (self.optimize_gaming_mode, "Игровой режим и Game DVR", 8),
-            (self.optimize_power_settings, "Настройки питания", 5),
-            (self.optimize_network_settings, "Сетевые настройки", 4),
-            (self.disable_unneeded_services, "Отключение служб", 6),
-            (self.clean_system_temp, "Очистка системы", 2),
-            (self.optimize_system_settings, "Системные настройки", 3)
-        ]
+        preset = resume.preset if resume is not None else self.preset
+        if measure and resume is None:
+            self.measure_performance("before", preset)
         
-        total_boost = 0
-        for func, name, boost in optimizations:
-            print(f"\n{Colors.CYAN}▶ {name}...")
-            result = func()
-            if result:
-                total_boost += boost
-            time.sleep(1)
+        # Независимые операции всех этапов выполняются параллельно
+        print(f"\n{Colors.CYAN}▶ Выполняем этапы (потоков: {self.workers})...")
+        report = self.run_full_optimization(resume, self.preset)
         
-        print(f"\n{Colors.GREEN}✅ Оптимизация завершена!")
-        print(f"{Colors.YELLOW}📈 Ожидаемый прирост FPS: {Colors.GREEN}+{total_boost}%")
+        print(f"\n{Colors.CYAN}⏱  Время этапов:")
+        stage_times = report.stage_times()
+        for stage, name in FULL_STAGE_NAMES:
+            print(f"{Colors.WHITE}  {name}: {stage_times.get(stage, 0):.2f} с")
+        print(f"{Colors.WHITE}  Всего: {report.wall_time:.2f} с")
+        if self.diff_mode:
+            print(f"{Colors.WHITE}  Пропущено (уже применено): {sum(report.skipped.values())}")
+        self.print_profile()
         
-        self.save_config()
+        print(f"\n{Colors.GREEN}✅ Оптимизация завершена!")
+        if measure:
+            # Вместо оценки FPS - измеренные изменения; часть твиков подействует только после перезагрузки
+            self.measure_performance("after", preset)
+            self.print_performance_report(self.performance_report(preset))
+            print(f"{Colors.WHITE}  После перезагрузки повторите замер: WexOptimizer.py perf after")
+        else:
+            print(f"{Colors.YELLOW}📏 Изменения не измерены: включите замеры ключом measure в конфигурации "
+                  f"или командой WexOptimizer.py perf before / perf after")
         
         restart = input(f"\n{Colors.YELLOW}Перезагрузить компьютер для применения изменений? (y/n): ")
         if restart.lower() == 'y':
-            self.run_cmd("shutdown /r /t 30", "Перезагрузка через 30 сек", 0)
-            print(f"{Colors.YELLOW}Компьютер перезагрузится через 30 секунд...")
+            self.reboot()
         
         input(f"\n{Colors.CYAN}Нажмите Enter для продолжения...")
     
-    def optimize_gaming_mode(self) -> bool:
+    def run_full_optimization(self, resume: Optional[JournalState] = None,
+                              preset: Optional[str] = None) -> ScheduleReport:
+        """Полная оптимизация (или только твики профиля preset) без вопросов:
+        бэкап, план под журналом, сохранение конфигурации"""
+        if resume is not None:
+            # Прерванный прогон продолжается с тем же профилем
+            preset = resume.preset
+        if preset:
+            plan, task_ids = self.get_profile_plan(preset)
+        else:
+            # Один план на все этапы: повторы (TaskbarDa, flushdns) выполняются один раз
+            plan, task_ids = self.get_plan(FULL_STAGES), PROFILE_TASKS
+        extra_tasks = [task for task in (
+            Task("power", "power", self.optimize_power_settings),
+            Task("clean.files", "clean", self.clean_temp_files),
+        ) if task.id in task_ids]
+        self.profile = RunProfile()
+        if resume is not None:
+            # Выполненные задачи пропускаем, бэкап остаётся от начала прерванного прогона
+            plan = [op for op in plan if op.id not in resume.done_ops]
+            extra_tasks = [task for task in extra_tasks if task.id not in resume.done_tasks]
+        else:
+            # Создаем бэкап значений, которые изменит план
+            self.create_registry_backup(plan)
+        
+        self.journal = ApplyJournal(self.journal_file)
+        try:
+            stages = tuple(OrderedDict.fromkeys(op.stage for op in plan)) if preset else FULL_STAGES
+            self.journal.begin(stages, resume=resume is not None, preset=preset)
+            report = self.run_plan(plan, extra_tasks)
+            if not report.errors:
+                self.journal.finish()
+        finally:
+            self.journal.close()
+            self.journal = None
+        
+        self.save_config()
+        return report
+    
+    def reboot(self):
+        """Перезагрузка через 30 секунд (её можно отменить командой shutdown /a)"""
+        self.run_cmd("shutdown /r /t 30", "Перезагрузка через 30 сек")
+        print(f"{Colors.YELLOW}Компьютер перезагрузится через 30 секунд...")
+    
+    def print_profile(self, top: int = 3):
+        """Самые долгие операции по этапам и сохранение профиля (JSON и Chrome trace)"""
+        print(f"\n{Colors.CYAN}🐢 Самые долгие операции:")
+        for line in self.profile.summary(top):
+            print(f"{Colors.WHITE}  {line}")
+        try:
+            self.profile.save_json(self.profile_file)
+            self.profile.save_chrome_trace(self.trace_file)
+            print(f"{Colors.WHITE}  Профиль: {self.profile_file}, трасса: {self.trace_file}")
+        except OSError as e:
+            self.log(f"Не удалось сохранить профиль: {e}", "warning")
+    
+    def optimize_gaming_mode(self, plan: Optional[List[PlanOp]] = None) -> bool:
         """Оптимизация игрового режима и Game DVR"""
         self.log("Настройка игрового режима...", "gaming")
         
-        # Для Windows 10 и 11 разные настройки
-        if "Windows 11" in self.os_version:
-            commands = [
-                # Windows 11 Game Mode
-                ('reg add "HKCU\\Software\\Microsoft\\GameBar" /v UseNexus /t REG_DWORD /d 0 /f', "Откл. Nexus"),
-                ('reg add "HKCU\\Software\\Microsoft\\GameBar" /v AutoGameModeEnabled /t REG_DWORD /d 1 /f', "Игровой режим"),
-                ('reg add "HKCU\\System\\GameConfigStore" /v GameDVR_Enabled /t REG_DWORD /d 0 /f', "Откл. Game DVR"),
-                
-                # Отключение виджетов Windows 11
-                ('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\ContentDeliveryManager" /v SubscribedContent-338393Enabled /t REG_DWORD /d 0 /f', "Откл. виджеты"),
-                ('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\ContentDeliveryManager" /v SubscribedContent-353694Enabled /t REG_DWORD /d 0 /f', "Откл. советы"),
-                
-                # Отключение анимаций Windows 11
-                ('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\Advanced" /v TaskbarDa /t REG_DWORD /d 0 /f', "Откл. анимации панели"),
-            ]
-        else:
-            # Windows 10
-            commands = [
-                ('reg add "HKCU\\Software\\Microsoft\\GameBar" /v AllowAutoGameMode /t REG_DWORD /d 1 /f', "Авто-игровой режим"),
-                ('reg add "HKCU\\Software\\Microsoft\\GameBar" /v AutoGameModeEnabled /t REG_DWORD /d 1 /f', "Игровой режим"),
-                ('reg add "HKCU\\System\\GameConfigStore" /v GameDVR_Enabled /t REG_DWORD /d 0 /f', "Откл. Game DVR"),
-                ('reg add "HKCU\\System\\GameConfigStore" /v GameDVR_FSEBehaviorMode /t REG_DWORD /d 2 /f', "Режим FSE"),
-            ]
-        
-        # Общие для всех Windows
-        commands.extend([
-            # Отключение Xbox Game Bar
-            ('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\GameDVR" /v AppCaptureEnabled /t REG_DWORD /d 0 /f', "Откл. захват игр"),
-            ('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\GameDVR" /v HistoricalCaptureEnabled /t REG_DWORD /d 0 /f', "Откл. историю"),
-            ('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\GameDVR" /v AudioCaptureEnabled /t REG_DWORD /d 0 /f', "Откл. аудио"),
-            
-            # Отключение Game DVR через политики
-            ('reg add "HKLM\\SOFTWARE\\Policies\\Microsoft\\Windows\\GameDVR" /v AllowGameDVR /t REG_DWORD /d 0 /f', "Полное откл. Game DVR"),
-            
-            # Остановка служб Xbox
-            ('sc stop XblAuthManager 2>nul', "Остановка Xbox Auth"),
-            ('sc config XblAuthManager start= disabled', "Откл. автозапуск Xbox Auth"),
-            ('sc stop XblGameSave 2>nul', "Остановка Xbox Game Save"),
-            ('sc config XblGameSave start= disabled', "Откл. Xbox Game Save"),
-        ])
-        
-        success = 0
-        for cmd, desc in commands:
-            if self.run_cmd(cmd, desc, 0):
-                success += 1
+        # Настройки для Windows 10 и 11 отбираются при компиляции плана
+        ops = plan if plan is not None else self.get_plan(("gaming",))
+        report = self.run_plan(ops)
         
-        return success >= 5
+        return not report.failures()
     
     def optimize_power_settings(self) -> bool:
-        """Оптимизация настроек питания"""
+        """Схема питания для игр: одно определение, применяется одной пачкой и проверяется чтением из системы"""
         self.log("Настройка питания...", "info")
+        plan = self.config_power_plan()
         
-        # Создаем схему высокой производительности если её нет
-        power_cfg = '''<?xml version="1.0" encoding="UTF-8"?>
-<PowerScheme>
-  <uuid>8c5e7fda-e8bf-4a96-9a85-a6e23a8c635c</uuid>
-  <name>Высокая производительность</name>
-  <description>Максимальная производительность для игр</description>
-</PowerScheme>'''
-        
-        try:
-            # Проверяем существование схемы
-            result = subprocess.run('powercfg /list', shell=True, capture_output=True, text=True)
-            if "8c5e7fda-e8bf-4a96-9a85-a6e23a8c635c" not in result.stdout:
-                # Создаем схему
-                self.run_cmd('powercfg -duplicatescheme a1841308-3541-4fab-bc81-f71556f20b4a', "Создание схемы производительности", 0)
-            
-            # Активируем схему высокой производительности
-            result = self.run_cmd(
-                'powercfg /setactive 8c5e7fda-e8bf-4a96-9a85-a6e23a8c635c',
-                "Активация 'Высокой производительности'",
-                3
-            )
-            
-            if result:
-                # Настройки для CPU
-                self.run_cmd('powercfg /setacvalueindex SCHEME_CURRENT SUB_PROCESSOR PERFINCPOL 100', "CPU 100% от сети", 0)
-                self.run_cmd('powercfg /setdcvalueindex SCHEME_CURRENT SUB_PROCESSOR PERFINCPOL 100', "CPU 100% от батареи", 0)
-                self.run_cmd('powercfg /setacvalueindex SCHEME_CURRENT SUB_PROCESSOR PERFEPP 0', "Откл. энергосбережение (сеть)", 0)
-                self.run_cmd('powercfg /setdcvalueindex SCHEME_CURRENT SUB_PROCESSOR PERFEPP 0', "Откл. энергосбережение (батарея)", 0)
-                
-                # Отключение гибернации
-                self.run_cmd('powercfg -h off', "Отключение гибернации", 0)
-                
-                return True
-        except:
-            # Альтернативный способ
-            self.run_cmd('powercfg -setactive 8c5e7fda-e8bf-4a96-9a85-a6e23a8c635c', "Активация высокой производительности", 3)
+        if self.diff_mode and not verify_power_plan(self.power, plan):
+            self.log("Схема питания уже настроена", "info")
             return True
         
-        return False
+        with self.profile.measure(f"Схема питания «{plan.name}»", "power", stage="power"):
+            error = self.power.apply(plan)
+            problems = [error] if error else verify_power_plan(self.power, plan)
+        if problems:
+            for problem in problems:
+                self.log(f"Питание: {problem}", "error")
+            report_failures()
+            return False
+        
+        self.record_success(f"Схема питания «{plan.name}»")
+        self.log(f"Схема «{plan.name}» активна, значений: {len(plan.settings)}"
+                 + (", гибернация выключена" if plan.hibernate is False else ""), "success")
+        return True
     
-    def optimize_network_settings(self) -> bool:
+    def config_power_plan(self) -> PowerPlan:
+        """Схема для игр; ключ hibernate: true оставляет гибернацию как есть"""
+        if self.config.get("hibernate", False):
+            return GAMING_POWER_PLAN._replace(hibernate=None)
+        return GAMING_POWER_PLAN
+    
+    def optimize_network_settings(self, plan: Optional[List[PlanOp]] = None) -> bool:
         """Оптимизация сетевых настроек для игр"""
         self.log("Оптимизация сети...", "info")
         
-        commands = [
-            # Оптимизация TCP/IP
-            ('netsh int tcp set global autotuninglevel=normal', "Автонастройка TCP"),
-            ('netsh int tcp set global congestionprovider=ctcp', "Compound TCP"),
-            ('netsh int tcp set global rsc=enabled', "RSC включен"),
-            ('netsh int tcp set global netdma=enabled', "NetDMA включен"),
-            
-            # Очистка сетевых кэшей
-            ('ipconfig /flushdns', "Очистка DNS кэша"),
-            ('netsh winsock reset catalog', "Сброс Winsock"),
-            ('netsh int ip reset', "Сброс IP"),
-            
-            # Отключение QoS (может помочь в некоторых играх)
-            ('netsh int tcp set global dca=disabled', "Откл. Direct Cache Access"),
-        ]
+        ops = plan if plan is not None else self.get_plan(("network",))
+        report = self.run_plan(ops)
         
-        # Добавляем настройки реестра для сетевой оптимизации
-        reg_commands = [
-            ('reg add "HKLM\\SYSTEM\\CurrentControlSet\\Services\\Tcpip\\Parameters" /v Tcp1323Opts /t REG_DWORD /d 1 /f', "TCP оптимизация"),
-            ('reg add "HKLM\\SYSTEM\\CurrentControlSet\\Services\\Tcpip\\Parameters" /v DefaultTTL /t REG_DWORD /d 64 /f', "TTL 64"),
-            ('reg add "HKLM\\SYSTEM\\CurrentControlSet\\Services\\Tcpip\\Parameters" /v EnablePMTUDiscovery /t REG_DWORD /d 1 /f', "PMTU Discovery"),
-            ('reg add "HKLM\\SYSTEM\\CurrentControlSet\\Services\\Tcpip\\Parameters" /v SackOpts /t REG_DWORD /d 1 /f', "SACK оптимизация"),
-        ]
+        return not report.failures()
+    
+    def disable_services(self, ops: List[PlanOp]) -> int:
+        """Остановка и отключение служб одной пачкой через диспетчер служб, возвращает число отключённых"""
+        try:
+            with self.profile.measure(f"Службы: {len(ops)}", "services"):
+                results = stop_and_disable_services(self.services, [op.target for op in ops], workers=self.workers)
+        finally:
+            self.services.close()
         
         success = 0
-        for cmd, desc in commands + reg_commands:
-            if self.run_cmd(cmd, desc, 0):
+        for op, result in zip(ops, results):
+            if not result.found:
+                continue
+            if result.ok:
+                self.record_success(f"Отключение: {op.desc}")
                 success += 1
-        
-        return success >= 6
+            if result.error:
+                self.log(f"{op.desc}: {result.error[:100]}", "warning")
+            elif result.ok:
+                self.log(f"Отключение: {op.desc}: готово", "success")
+        report_failures(sum(1 for result in results if result.found and not result.ok))
+        missing = sum(1 for result in results if not result.found)
+        if missing:
+            self.log(f"Нет в системе, пропущено служб: {missing}", "info")
+        return success
     
-    def disable_unneeded_services(self) -> bool:
+    def disable_unneeded_services(self, plan: Optional[List[PlanOp]] = None) -> bool:
         """Отключение ненужных служб - ИСПРАВЛЕННАЯ"""
         self.log("Отключение служб...", "info")
         
-        # Список служб для отключения (с проверкой существования)
-        services = [
-            ("DiagTrack", "Диагностическое отслеживание"),
-            ("dmwappushservice", "Push-уведомления"),
-            ("lfsvc", "Служба географического положения"),
-            ("MapsBroker", "Загрузчик карт"),
-            ("WpnService", "Push-уведомления Windows"),
-            ("XblAuthManager", "Диспетчер проверки подлинности Xbox Live"),
-            ("XblGameSave", "Служба сохранения игр Xbox Live"),
-            ("XboxNetApiSvc", "Сетевая служба Xbox Live"),
-            ("XboxGipSvc", "Служба Xbox GIP"),
-            ("wisvc", "Сбор данных Windows"),
-            ("Fax", "Факс"),
-            ("RemoteRegistry", "Удаленный реестр"),
-            ("WMPNetworkSvc", "Сетевая служба Windows Media Player"),
-            ("SharedAccess", "Общий доступ к интернету"),
-            ("lltdsvc", "Обнаружение топологии"),
-            ("wscsvc", "Центр безопасности"),
-            ("RemoteAccess", "Маршрутизация и удаленный доступ"),
-            ("SysMain", "Superfetch (переименован в Windows 10/11)"),
-        ]
-        
-        success = 0
-        skipped = 0
+        # Список служб для отключения (с проверкой существования) - в каталоге
+        ops = plan if plan is not None else self.get_plan(("services",))
         
-        for service, desc in services:
-            # Проверяем существует ли служба
-            check_cmd = f'sc query "{service}"'
-            result = subprocess.run(check_cmd, shell=True, capture_output=True, text=True)
-            
-            if "FAILED 1060" in result.stdout or "не существует" in result.stdout:
-                skipped += 1
-                continue
-            
-            # Останавливаем службу
-            stop_cmd = f'net stop "{service}" /y 2>nul'
-            disable_cmd = f'sc config "{service}" start= disabled'
-            
-            stop_success = self.run_cmd(stop_cmd, f"Остановка: {desc}", 0)
-            disable_success = self.run_cmd(disable_cmd, f"Отключение: {desc}", 0)
-            
-            if stop_success or disable_success:
-                success += 1
+        # Все службы этапа - одна пачка: запросы остановки параллельно, общий таймаут ожидания
+        report = self.run_plan(ops)
+        success = report.done()
         
-        self.log(f"Отключено служб: {success}, пропущено: {skipped}", "success")
-        return success >= 5
+        self.log(f"Отключено служб: {success} из {len(ops)}", "success")
+        return not report.failures()
     
-    def clean_system_temp(self) -> bool:
+    def clean_system_temp(self, plan: Optional[List[PlanOp]] = None, index: Optional[CleanIndex] = None) -> bool:
         """Очистка временных файлов - ИСПРАВЛЕННАЯ И РАБОЧАЯ"""
         self.log("Очистка временных файлов...", "info")
         
-        temp_paths = []
-        cleaned_size = 0
-        cleaned_count = 0
-        
-        # Получаем все возможные пути к временным файлам
-        possible_paths = [
-            os.environ.get('TEMP', ''),
-            os.environ.get('TMP', ''),
-            'C:\\Windows\\Temp',
-            'C:\\Windows\\Prefetch',
-            os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Temp'),
-            os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft\\Windows\\INetCache'),
-            os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft\\Windows\\INetCookies'),
-            os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft\\Windows\\History'),
-            os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft\\Windows\\Explorer'),
-        ]
+        cleaned_count = self.clean_temp_files(index)
         
-        # Фильтруем существующие пути
-        for path in possible_paths:
-            if path and os.path.exists(path):
-                temp_paths.append(path)
+        # Очистка DNS кэша (в полной оптимизации уже выполнена на этапе сети)
+        self.execute_plan(plan if plan is not None else self.get_plan(("clean",)))
         
-        # Добавляем временные папки пользователя
-        user_temp = tempfile.gettempdir()
-        if user_temp and os.path.exists(user_temp):
-            temp_paths.append(user_temp)
+        return cleaned_count > 0
+    
+    def temp_roots(self) -> List[str]:
+        """Папки с временными файлами, которые есть в системе"""
+        # Существующие пути без повторов и вложенных папок
+        return unique_roots(self.platform.temp_paths())
+    
+    def _clean_progress(self, verb: str) -> Callable[[CleanStats], None]:
+        """Вывод общего прогресса по всем параллельно обрабатываемым папкам"""
+        progress = {}
         
-        # Уникальные пути
-        temp_paths = list(set(temp_paths))
+        def show_progress(stats: CleanStats):
+            with self._lock:
+                progress[stats.root] = (stats.files, stats.bytes)
+                files = sum(f for f, _ in progress.values())
+                size_mb = sum(b for _, b in progress.values()) / (1024 * 1024)
+                print(f"\r{Colors.CYAN}  {verb}: {files} файлов, {size_mb:.1f} МБ", end="", flush=True)
         
-        self.log(f"Найдено {len(temp_paths)} папок для очистки", "info")
+        return show_progress
+    
+    def scan_temp_files(self) -> CleanIndex:
+        """Анализ без удаления: сколько места освободит очистка"""
+        temp_paths = self.temp_roots()
+        self.log(f"Анализ {len(temp_paths)} папок...", "info")
         
-        # Очищаем каждую папку
-        for temp_dir in temp_paths:
-            try:
-                self.log(f"Очистка: {temp_dir}", "info")
-                
-                if not os.path.exists(temp_dir):
-                    continue
-                
-                # Получаем список файлов
-                for root, dirs, files in os.walk(temp_dir, topdown=False):
-                    for name in files:
-                        file_path = os.path.join(root, name)
-                        try:
-                            # Пропускаем системные файлы и файлы в использовании
-                            if name.endswith(('.log', '.dmp', '.tmp', '.temp', '.cache')):
-                                size = os.path.getsize(file_path)
-                                os.remove(file_path)
-                                cleaned_size += size
-                                cleaned_count += 1
-                        except:
-                            continue
-                    
-                    # Пробуем удалить пустые папки
-                    for name in dirs:
-                        dir_path = os.path.join(root, name)
-                        try:
-                            if not os.listdir(dir_path):
-                                os.rmdir(dir_path)
-                        except:
-                            pass
-                            
-            except Exception as e:
-                self.log(f"Ошибка очистки {temp_dir}: {e}", "warning")
-                continue
+        policy = self.clean_policy
+        cleaner = TempCleaner(policy, workers=self.workers, progress=self._clean_progress("Найдено"))
+        index = cleaner.scan(temp_paths)
+        print()
         
-        # Очистка DNS кэша
-        self.run_cmd('ipconfig /flushdns', "Очистка DNS кэша", 0)
+        print(f"\n{Colors.CYAN}📁 ПО ПАПКАМ:")
+        for root, (files, size) in index.totals_by_root().items():
+            print(f"{Colors.WHITE}  {root}: {files} файлов, {size / (1024 * 1024):.1f} МБ")
+        print(f"\n{Colors.CYAN}📄 ПО ТИПАМ ФАЙЛОВ:")
+        for ext, (files, size) in sorted(index.totals_by_extension().items(), key=lambda item: -item[1][1]):
+            print(f"{Colors.WHITE}  {ext or '(без расширения)'}: {files} файлов, {size / (1024 * 1024):.1f} МБ")
+        print(f"\n{Colors.YELLOW}Можно освободить: {Colors.GREEN}{index.total_bytes / (1024 * 1024):.1f} МБ "
+              f"{Colors.YELLOW}({len(index)} файлов)")
+        if policy.has_budget:
+            selection = index.select(policy.max_keep_bytes, policy.max_delete_bytes)
+            size = sum(index.sizes[i] for i in selection)
+            print(f"{Colors.YELLOW}С учётом лимитов будет удалено: {Colors.GREEN}{size / MB:.1f} МБ "
+                  f"{Colors.YELLOW}({len(selection)} файлов, сначала самые старые)")
+        return index
+    
+    def clean_temp_files(self, index: Optional[CleanIndex] = None, full_rescan: bool = False) -> int:
+        """Удаление временных файлов и кэша эскизов, возвращает число удалённых файлов.
+        С index удаляются файлы, найденные анализом, без повторного сканирования.
+        Папки, не менявшиеся с прошлой очистки, не сканируются (full_rescan - сканировать всё)"""
+        start = time.perf_counter()
+        policy = self.clean_policy
+        if index is not None:
+            selection = index.select(policy.max_keep_bytes, policy.max_delete_bytes) if policy.has_budget else None
+            results = index.apply(selection)
+        elif policy.has_budget:
+            # Для лимитов нужен полный список файлов корня - сначала индекс, потом удаление по куче
+            temp_paths = self.temp_roots()
+            self.log(f"Найдено {len(temp_paths)} папок для очистки (с лимитами по объёму)", "info")
+            index = TempCleaner(policy, workers=self.workers, progress=self._clean_progress("Найдено")).scan(temp_paths)
+            print()
+            results = index.apply(index.select(policy.max_keep_bytes, policy.max_delete_bytes))
+        else:
+            temp_paths = self.temp_roots()
+            self.log(f"Найдено {len(temp_paths)} папок для очистки", "info")
+            
+            # Папки очищаются параллельно, прогресс выводится по ходу работы
+            cleaner = TempCleaner(policy, workers=self.workers, progress=self._clean_progress("Удалено"))
+            cleaner.snapshot = CleanSnapshot(self.clean_snapshot_file, cleaner.rules)
+            if not full_rescan:
+                cleaner.snapshot = CleanSnapshot.load(self.clean_snapshot_file, cleaner.rules)
+            results = cleaner.clean(temp_paths)
+            cleaner.snapshot.save()
+            print()
         
-        # Очистка кэша эскизов
-        thumb_cache = os.path.join(os.environ.get('LOCALAPPDATA', ''), 'Microsoft\\Windows\\Explorer')
-        if os.path.exists(thumb_cache):
-            for pattern in ['thumbcache_*.db', '*.tmp']:
-                for file in glob.glob(os.path.join(thumb_cache, pattern)):
-                    try:
-                        os.remove(file)
-                        cleaned_count += 1
-                    except:
-                        pass
+        cleaned_count = sum(stats.files for stats in results)
+        cleaned_size = sum(stats.bytes for stats in results)
+        self.profile.record(f"Временные файлы: {cleaned_count}", "clean", start, time.perf_counter())
+        for stats in results:
+            self.log(f"Очистка: {stats.root} - {stats.files} файлов, пропущено {stats.errors}, "
+                     f"без изменений папок: {stats.dirs_skipped}", "info")
         
         # Показываем результаты
         cleaned_mb = cleaned_size / (1024 * 1024)
         self.log(f"Очищено: {cleaned_count} файлов, {cleaned_mb:.1f} МБ", "success")
         
-        return cleaned_count > 0
+        return cleaned_count
     
-    def optimize_system_settings(self) -> bool:
-        """Оптимизация системных настроек"""
-        self.log("Оптимизация системных настроек...", "info")
+    def clean_menu(self):
+        """Очистка из меню: сначала анализ, удаление - после подтверждения"""
+        self.print_banner()
+        print(f"\n{Colors.YELLOW}🧹 ОЧИСТКА СИСТЕМЫ")
+        print(f"{Colors.CYAN}{'─'*70}")
         
-        commands = []
+        index = self.scan_temp_files()
         
-        # Настройки для Windows 11
-        if "Windows 11" in self.os_version:
-            commands.extend([
-                # Отключение визуальных эффектов Windows 11
-                ('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\Advanced" /v TaskbarDa /t REG_DWORD /d 0 /f', "Откл. анимации панели задач"),
-                ('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\Advanced" /v TaskbarMn /t REG_DWORD /d 0 /f', "Откл. меню панели"),
-                
-                # Отключение прозрачности
-                ('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\Themes\\Personalize" /v EnableTransparency /t REG_DWORD /d 0 /f', "Откл. прозрачность"),
-                
-                # Отключение виджетов
-                ('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\Advanced" /v TaskbarDa /t REG_DWORD /d 0 /f', "Откл. виджеты"),
-            ])
-        
-        # Общие настройки для всех Windows
-        commands.extend([
-            # Отключение индексирования
-            ('reg add "HKLM\\SOFTWARE\\Microsoft\\Windows Search" /v SetupCompletedSuccessfully /t REG_DWORD /d 0 /f', "Откл. индексирование"),
-            
-            # Оптимизация для игр
-            ('reg add "HKLM\\SOFTWARE\\Microsoft\\Windows NT\\CurrentVersion\\Multimedia\\SystemProfile" /v SystemResponsiveness /t REG_DWORD /d 0 /f', "Макс. отзывчивость"),
-            ('reg add "HKLM\\SOFTWARE\\Microsoft\\Windows NT\\CurrentVersion\\Multimedia\\SystemProfile\\Tasks\\Games" /v "GPU Priority" /t REG_DWORD /d 8 /f', "Приоритет GPU"),
-            ('reg add "HKLM\\SOFTWARE\\Microsoft\\Windows NT\\CurrentVersion\\Multimedia\\SystemProfile\\Tasks\\Games" /v "Priority" /t REG_DWORD /d 6 /f', "Приоритет игр"),
-            
-            # Отключение телеметрии
-            ('reg add "HKLM\\SOFTWARE\\Policies\\Microsoft\\Windows\\DataCollection" /v AllowTelemetry /t REG_DWORD /d 0 /f', "Откл. телеметрию"),
-            ('reg add "HKLM\\SOFTWARE\\Policies\\Microsoft\\Windows\\AppCompat" /v AITEnable /t REG_DWORD /d 0 /f', "Откл. совместимость"),
-            
-            # Ускорение меню
-            ('reg add "HKCU\\Control Panel\\Desktop" /v MenuShowDelay /t REG_SZ /d 0 /f', "Мгновенное меню"),
-            
-            # Отключение анимации окон
-            ('reg add "HKCU\\Control Panel\\Desktop\\WindowMetrics" /v MinAnimate /t REG_SZ /d 0 /f', "Откл. анимацию окон"),
-        ])
+        confirm = input(f"\n{Colors.YELLOW}Удалить найденные файлы? (y/n): ")
+        if confirm.lower() == 'y':
+            self.clean_system_temp(index=index)
         
-        success = 0
-        for cmd, desc in commands:
-            if self.run_cmd(cmd, desc, 0):
-                success += 1
+        input(f"\n{Colors.CYAN}Нажмите Enter...")
+    
+    def optimize_system_settings(self, plan: Optional[List[PlanOp]] = None) -> bool:
+        """Оптимизация системных настроек"""
+        self.log("Оптимизация системных настроек...", "info")
         
-        return success >= 5
+        ops = plan if plan is not None else self.get_plan(("system",))
+        report = self.run_plan(ops)
+        
+        return not report.failures()
     
     def optimize_gpu_settings(self):
         """Оптимизация настроек GPU"""
@@ -706,112 +4793,62 @@ class WexTweaksGaming:
         if confirm.lower() != 'y':
             return
         
-        commands = [
-            # DirectX оптимизация
-            ('reg add "HKCU\\Software\\Microsoft\\DirectX\\UserGpuPreferences" /v DirectXUserGlobalSettings /t REG_SZ /d "SwapEffectUpgradeEnable=1;HDRSupport=0" /f', "Настройки DirectX"),
-            
-            # DWM оптимизация
-            ('reg add "HKCU\\Control Panel\\Desktop" /v SmoothScroll /t REG_DWORD /d 0 /f', "Откл. плавную прокрутку"),
-            ('reg add "HKCU\\Control Panel\\Desktop" /v FontSmoothing /t REG_SZ /d 0 /f', "Откл. сглаживание шрифтов"),
-            ('reg add "HKCU\\Control Panel\\Desktop" /v UserPreferencesMask /t REG_BINARY /d 9032078000000 /f', "Настройки анимации"),
-            
-            # Визуальные эффекты
-            ('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\VisualEffects" /v VisualFXSetting /t REG_DWORD /d 2 /f', "Эффекты для производительности"),
-            
-            # Полноэкранная оптимизация
-            ('reg add "HKCU\\System\\GameConfigStore" /v GameDVR_FSEBehavior /t REG_DWORD /d 2 /f', "Поведение FSE"),
-            ('reg add "HKCU\\System\\GameConfigStore" /v GameDVR_DXGIHonorFSEWindowsCompatible /t REG_DWORD /d 1 /f', "Совместимость DXGI"),
-            
-            # Hardware acceleration
-            ('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\Advanced" /v DisallowShaking /t REG_DWORD /d 1 /f', "Откл. тряску окон"),
-        ]
-        
-        for cmd, desc in commands:
-            self.run_cmd(cmd, desc, 0)
+        self.apply_gpu_settings()
         
         print(f"\n{Colors.GREEN}✅ Настройки GPU применены!")
         print(f"{Colors.YELLOW}⚠️  Для некоторых игр может потребоваться перезагрузка")
         
-        self.estimated_fps_boost += 5
-        self.save_config()
-        
         input(f"\n{Colors.CYAN}Нажмите Enter для продолжения...")
     
+    def apply_gpu_settings(self) -> bool:
+        """Настройки GPU и дисплея без вопросов"""
+        ops = self.get_plan(("gpu",))
+        report = self.run_plan(ops)
+        self.save_config()
+        return not report.failures()
+    
     def optimize_disk_settings(self):
         """Оптимизация настроек диска - ИСПРАВЛЕННАЯ"""
         self.print_banner()
         print(f"\n{Colors.YELLOW}💾 ОПТИМИЗАЦИЯ ДИСКА И SSD")
         print(f"{Colors.CYAN}{'─'*70}")
         
-        # Проверяем тип диска без использования PowerShell (может не работать в EXE)
-        is_ssd = False
-        try:
-            # Простой способ проверки SSD через wmic
-            result = subprocess.run(
-                'wmic diskdrive get MediaType 2>nul',
-                shell=True,
-                capture_output=True,
-                text=True
-            )
-            is_ssd = "SSD" in result.stdout or "Solid State" in result.stdout
-        except:
-            # Если wmic не работает, используем эвристику
-            try:
-                # Проверяем наличие TRIM поддержки
-                result = subprocess.run('fsutil behavior query DisableDeleteNotify', 
-                                       shell=True, capture_output=True, text=True)
-                is_ssd = "0" in result.stdout
-            except:
-                is_ssd = False
-        
+        is_ssd = self.detect_ssd()
         if is_ssd:
             print(f"{Colors.GREEN}✓ Обнаружен SSD")
-            commands = [
-                # Включение TRIM для SSD
-                ('fsutil behavior set DisableDeleteNotify 0', "TRIM для SSD", 0),
-                
-                # Отключение дефрагментации для SSD
-                ('reg add "HKLM\\SOFTWARE\\Microsoft\\Dfrg\\BootOptimizeFunction" /v Enable /t REG_SZ /d N /f', "Откл. дефрагментацию", 0),
-                
-                # Отключение индексирования для SSD
-                ('reg add "HKLM\\SOFTWARE\\Microsoft\\Windows Search" /v SetupCompletedSuccessfully /t REG_DWORD /d 0 /f', "Откл. индексирование", 0),
-            ]
         else:
             print(f"{Colors.YELLOW}✓ Обнаружен HDD")
-            commands = [
-                # Дефрагментация для HDD
-                ('defrag C: /O /U', "Дефрагментация диска C:", 0),
-                
-                # Включение Superfetch для HDD
-                ('reg add "HKLM\\SYSTEM\\CurrentControlSet\\Control\\Session Manager\\Memory Management\\PrefetchParameters" /v EnableSuperfetch /t REG_DWORD /d 3 /f', "Superfetch для HDD", 0),
-            ]
-        
-        # Общие настройки для всех типов дисков
-        common_commands = [
-            # Отключение времени последнего доступа
-            ('reg add "HKLM\\SYSTEM\\CurrentControlSet\\Control\\FileSystem" /v NtfsDisableLastAccessUpdate /t REG_DWORD /d 1 /f', "Откл. время доступа", 0),
-            
-            # Увеличение кэша файловой системы
-            ('reg add "HKLM\\SYSTEM\\CurrentControlSet\\Control\\Session Manager\\Memory Management" /v IoPageLockLimit /t REG_DWORD /d 1048576 /f', "Увеличение кэша", 0),
-            
-            # Оптимизация для больших файлов
-            ('reg add "HKLM\\SYSTEM\\CurrentControlSet\\Control\\FileSystem" /v NtfsMemoryUsage /t REG_DWORD /d 2 /f', "Память NTFS", 0),
-        ]
-        
-        all_commands = commands + common_commands
         
-        for cmd, desc, boost in all_commands:
-            self.run_cmd(cmd, desc, boost)
-        
-        # Очистка кэша DNS
-        self.run_cmd('ipconfig /flushdns', "Очистка DNS кэша", 0)
+        self.apply_disk_settings(is_ssd)
         
         print(f"\n{Colors.GREEN}✅ Настройки диска применены!")
-        self.estimated_fps_boost += 3
-        self.save_config()
         
         input(f"\n{Colors.CYAN}Нажмите Enter для продолжения...")
     
+    def detect_ssd(self) -> bool:
+        """Тип системного диска: True - SSD"""
+        # Проверяем тип диска без использования PowerShell (может не работать в EXE)
+        # Простой способ проверки SSD через wmic; поддержка TRIM - запасная эвристика.
+        # Обе команды запускаются сразу, а не одна после другой
+        wmic, trim = self.executor.run_many(['wmic diskdrive get MediaType 2>nul',
+                                             'fsutil behavior query DisableDeleteNotify'], deadline=10)
+        if wmic.ok and wmic.stdout.strip():
+            is_ssd = "SSD" in wmic.stdout or "Solid State" in wmic.stdout
+        else:
+            # Если wmic не работает, используем эвристику
+            is_ssd = trim.ok and "0" in trim.stdout
+        return is_ssd
+    
+    def apply_disk_settings(self, is_ssd: Optional[bool] = None) -> bool:
+        """Настройки диска без вопросов (тип диска определяется, если не задан)"""
+        if is_ssd is None:
+            is_ssd = self.detect_ssd()
+        # TRIM/дефрагментация, файловая система и очистка DNS кэша - в каталоге
+        ops = self.get_plan(("disk",), disk="ssd" if is_ssd else "hdd")
+        report = self.run_plan(ops)
+        self.save_config()
+        return not report.failures()
+    
     def show_system_info(self):
         """Показать информацию о системе"""
         self.print_banner()
@@ -847,7 +4884,11 @@ class WexTweaksGaming:
         # Статус оптимизаций
         print(f"\n{Colors.CYAN}⚡ СТАТУС ОПТИМИЗАЦИЙ:")
         print(f"{Colors.WHITE}  Выполнено оптимизаций: {self.total_optimizations}")
-        print(f"{Colors.WHITE}  Ожидаемый прирост FPS: {Colors.GREEN}+{self.estimated_fps_boost}%")
+        rows = self.performance_report(self.preset)
+        if rows:
+            self.print_performance_report(rows)
+        else:
+            print(f"{Colors.WHITE}  Замеры до/после: не измерено (WexOptimizer.py perf before / perf after)")
         
         if self.gaming_optimizations:
             print(f"\n{Colors.CYAN}📝 ПОСЛЕДНИЕ ОПТИМИЗАЦИИ:")
@@ -855,7 +4896,7 @@ class WexTweaksGaming:
                 try:
                     time_obj = datetime.datetime.fromisoformat(opt['time'])
                     time_str = time_obj.strftime('%d.%m %H:%M')
-                    print(f"{Colors.WHITE}  [{time_str}] {opt['command']} (+{opt['fps_boost']}%)")
+                    print(f"{Colors.WHITE}  [{time_str}] {opt['command']}")
                 except:
                     pass
         
@@ -869,8 +4910,233 @@ class WexTweaksGaming:
         if not self.is_admin:
             print(f"\n{Colors.RED}⚠️  Для полной оптимизации запустите программу от имени администратора!")
         
+        choice = input(f"\n{Colors.CYAN}Enter - продолжить, m - монитор ресурсов: ")
+        if choice.lower() == 'm':
+            self.monitor_menu()
+    
+    def monitor_resources(self, duration: Optional[float] = None, interval: Optional[float] = None,
+                          show: bool = True) -> ResourceMonitor:
+        """Опрос ресурсов до Ctrl+C или истечения duration (ключи monitor_interval, monitor_samples)"""
+        monitor = ResourceMonitor(interval=interval or self.config.get("monitor_interval", MONITOR_INTERVAL),
+                                  capacity=self.config.get("monitor_samples", MONITOR_SAMPLES))
+        
+        def render(m: ResourceMonitor):
+            print(f"\r{Colors.WHITE}  {m.status_line()}", end="", flush=True)
+        
+        monitor.run(duration, render if show else None)
+        if show:
+            print()
+        return monitor
+    
+    def monitor_menu(self):
+        """Монитор ресурсов в консоли с выгрузкой в CSV"""
+        print(f"\n{Colors.YELLOW}📈 МОНИТОР РЕСУРСОВ {Colors.WHITE}(среднее за {MONITOR_WINDOW} выборок, Ctrl+C - стоп)")
+        monitor = self.monitor_resources()
+        print(f"{Colors.WHITE}  Выборок: {len(monitor.ring)}, нагрузка монитора: {monitor.overhead_percent:.2f}% CPU")
+        
+        if input(f"\n{Colors.YELLOW}Сохранить выборки в CSV? (y/n): ").lower() == 'y':
+            path = f"wextweaks_monitor_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            try:
+                monitor.ring.to_csv(path)
+                print(f"{Colors.GREEN}✅ Сохранено: {path}")
+            except OSError as e:
+                print(f"{Colors.RED}Не удалось сохранить: {e}")
         input(f"\n{Colors.CYAN}Нажмите Enter для продолжения...")
     
+    def watch_games(self, duration: Optional[float] = None, show: bool = True,
+                    session: Optional[bool] = None) -> GameWatcher:
+        """Приоритет играм на время их работы (ключи games, background_processes, watch_interval, reserve_cores);
+        session - игровая сессия с приостановкой фоновых программ (ключи session_mode, session_processes)"""
+        games = tuple(self.config.get("games", DEFAULT_GAMES))
+        interval = self.config.get("watch_interval", WATCH_INTERVAL)
+        reserve_cores = self.config.get("reserve_cores", 1)
+        if session if session is not None else self.config.get("session_mode", False):
+            watcher = GameSession(self.processes, games, self.config.get("session_processes", SESSION_POLICY),
+                                  interval, reserve_cores, self.session_file)
+        else:
+            watcher = GameWatcher(self.processes, games,
+                                  tuple(self.config.get("background_processes", DEFAULT_BACKGROUND)),
+                                  interval, reserve_cores)
+        labels = {"start": "запущена игра", "exit": "игра закрыта", "lower": "понижен",
+                  "suspend": "приостановлен", "restore": "возвращён"}
+        
+        def report(event: WatchEvent):
+            self.log(f"{labels[event.kind]}: {event.name} ({event.pid})" + (f" - {event.error}" if event.error else ""),
+                     "warning" if event.error else "gaming", pid=event.pid)
+        
+        watcher.run(duration, report if show else None)
+        return watcher
+    
+    def watch_menu(self):
+        """Слежение за играми в консоли до Ctrl+C"""
+        if input(f"\n{Colors.YELLOW}Следить за запуском игр и поднимать им приоритет? (y/n): ").lower() == 'y':
+            print(f"{Colors.WHITE}  Игры: {', '.join(self.config.get('games', DEFAULT_GAMES))}")
+            print(f"{Colors.WHITE}  Ctrl+C - остановить слежение и вернуть приоритеты")
+            watcher = self.watch_games()
+            print(f"{Colors.WHITE}  Проверок: {watcher.ticks}, нагрузка: {watcher.overhead_percent:.2f}% CPU")
+            if isinstance(watcher, GameSession):
+                stats = watcher.stats.as_dict()
+                print(f"{Colors.GREEN}  Сессия: освобождено {stats['memory_freed_mb']} МБ памяти, "
+                      f"{stats['cpu_saved_s']} с CPU ({stats['cpu_saved_percent']}% ядра); "
+                      f"приостановлено {stats['suspended']}, понижено {stats['lowered']}")
+        input(f"\n{Colors.CYAN}Нажмите Enter...")
+    
+    def measure_network(self, phase: str, host: Optional[str] = None, port: int = ECHO_PORT) -> Dict[str, List[float]]:
+        """Задержка, джиттер и пропускная способность до или после сетевого этапа (ключи net_count, net_rate, net_size);
+        без host - через встроенный эхо-сервер на loopback"""
+        print(f"{Colors.CYAN}▶ Замеры сети {'до' if phase == 'before' else 'после'} оптимизации ({host or 'loopback'})...")
+        metrics = measure_network(host, port, self.config.get("net_count", NET_COUNT),
+                                  self.config.get("net_rate", NET_RATE), self.config.get("net_size", NET_SIZE))
+        for proto in ("tcp", "udp"):
+            stats = latency_stats(metrics[f"{proto}_rtt"], metrics[f"{proto}_lost"][0])
+            print(f"{Colors.WHITE}  {proto.upper()}: p50 {stats.get('p50_ms', '-')} мс, p99 {stats.get('p99_ms', '-')} мс, "
+                  f"джиттер {stats.get('jitter_ms', '-')} мс, потери {stats['loss_percent']}%")
+        PerfStore(self.perf_file).add(self.machine_id, f"net:{host or 'loopback'}", phase, metrics)
+        return metrics
+    
+    def network_report(self, host: Optional[str] = None) -> List[Dict]:
+        """Сравнение последних замеров сети до и после (пусто, если одной из фаз нет)"""
+        store = PerfStore(self.perf_file)
+        before, after = (store.latest(self.machine_id, f"net:{host or 'loopback'}", phase) for phase in PERF_PHASES)
+        if before is None or after is None:
+            return []
+        return network_report(before["metrics"], after["metrics"])
+    
+    def network_menu(self):
+        """Сеть для игр; с ключом measure - замеры задержки до и после; подбор DNS-сервера"""
+        measure = self.config.get("measure", False)
+        if measure:
+            self.measure_network("before")
+        self.optimize_network_settings()
+        if measure:
+            self.measure_network("after")
+            self.print_performance_report(self.network_report())
+        if input(f"\n{Colors.YELLOW}Подобрать самый быстрый DNS-сервер? (y/n): ").lower() == 'y':
+            results = self.benchmark_dns()
+            if self.is_admin and input(f"\n{Colors.YELLOW}Установить лучший сервер для каждого подключения? (y/n): ").lower() == 'y':
+                self.apply_dns(results)
+        input(f"\n{Colors.CYAN}Нажмите Enter...")
+    
+    def benchmark_dns(self, interfaces: Optional[Dict[str, str]] = None) -> Dict[str, List[DnsResult]]:
+        """Замер DNS-серверов через каждое подключение (ключи dns_resolvers, dns_domains);
+        результат по подключениям - от лучшего сервера к худшему"""
+        interfaces = dns_interfaces() if interfaces is None else interfaces
+        resolvers = tuple(self.config.get("dns_resolvers", DNS_RESOLVERS))
+        domains = tuple(self.config.get("dns_domains", DNS_DOMAINS))
+        results = {}
+        # Без активных подключений - один замер по маршруту по умолчанию
+        for interface, address in (interfaces or {"": ""}).items():
+            print(f"{Colors.CYAN}▶ DNS-серверы через {interface or 'маршрут по умолчанию'}...")
+            ranked = results[interface] = benchmark_resolvers(resolvers, domains,
+                                                              local_addr=(address, 0) if address else None)
+            for result in ranked:
+                print(f"{Colors.WHITE}  {result.resolver}: холодный {result.cold_ms} мс, из кэша {result.cached_ms} мс, "
+                      f"без ответа {result.failure_rate:.0%}")
+        return results
+    
+    def apply_dns(self, results: Dict[str, List[DnsResult]]) -> Dict[str, str]:
+        """Лучший сервер на каждое подключение через netsh; restore_system возвращает DNS от DHCP"""
+        applied = {}
+        for interface, ranked in results.items():
+            if not interface or not ranked:
+                continue
+            best = ranked[0]
+            host, port = parse_resolver(best.resolver)
+            if best.failure_rate > DNS_MAX_FAILURES or port != DNS_PORT:
+                self.log(f"{interface}: нет подходящего DNS-сервера", "warning")
+                continue
+            command = (f'netsh interface ipv4 set dnsservers name="{interface}" source=static '
+                       f'address={host} register=primary validate=no')
+            if self.run_cmd(command, f"DNS {host} для {interface}"):
+                applied[interface] = host
+        if applied:
+            self.config.setdefault("dns_applied", {}).update(applied)
+            self.save_config()
+        return applied
+    
+    @property
+    def machine_id(self) -> str:
+        return PerfStore.machine_key(self.system_info)
+    
+    def measure_performance(self, phase: str, preset: Optional[str] = None, repeats: Optional[int] = None,
+                            quick: bool = False) -> Dict[str, List[float]]:
+        """Микробенчмарки до или после профиля; результат сохраняется по машине и профилю (ключ perf_repeats)"""
+        suite = PerfSuite(repeats or self.config.get("perf_repeats", PERF_REPEATS), 0.25 if quick else 1.0)
+        print(f"{Colors.CYAN}▶ Замеры {'до' if phase == 'before' else 'после'} оптимизации (повторов: {suite.repeats})...")
+        
+        def show(metric: PerfMetric, result: Estimate):
+            print(f"{Colors.WHITE}  {metric.desc}: {result.mean:.2f} ± {result.half_width:.2f} {metric.unit}")
+        
+        metrics = suite.run(show)
+        PerfStore(self.perf_file).add(self.machine_id, preset or "full", phase, metrics,
+                                      repeats=suite.repeats, scale=suite.scale)
+        return metrics
+    
+    def performance_report(self, preset: Optional[str] = None) -> List[Dict]:
+        """Изменения по последним замерам до и после для профиля (пусто, если одной из фаз нет)"""
+        store = PerfStore(self.perf_file)
+        before, after = (store.latest(self.machine_id, preset or "full", phase) for phase in PERF_PHASES)
+        if before is None or after is None:
+            return []
+        if before.get("scale") != after.get("scale"):
+            self.log("Замеры до и после сделаны с разным объёмом (--quick): сравнение неточно", "warning")
+        return perf_report(before["metrics"], after["metrics"])
+    
+    def measured_summary(self) -> str:
+        """Итог последних замеров до/после для баннера"""
+        rows = self.performance_report(self.preset)
+        if not rows:
+            return "не измерено"
+        counts = Counter(row["verdict"] for row in rows)
+        return f"лучше {counts['better']}, хуже {counts['worse']}, в пределах шума {counts['same']}"
+    
+    def print_performance_report(self, rows: List[Dict]):
+        verdicts = {"better": (Colors.GREEN, "лучше"), "worse": (Colors.RED, "хуже"), "same": (Colors.WHITE, "в пределах шума")}
+        print(f"\n{Colors.CYAN}📏 Замеры до/после (95% интервал):")
+        for row in rows:
+            color, verdict = verdicts[row["verdict"]]
+            print(f"{Colors.WHITE}  {row['desc']}: {row['before']} → {row['after']} {row['unit']} "
+                  f"{color}{row['delta_percent']:+.1f}% ± {row['delta_ci_percent']:.1f}% ({verdict})")
+    
+    def system_report(self) -> Dict:
+        """Сведения о системе и использование ресурсов (для вывода в JSON)"""
+        memory = psutil.virtual_memory()
+        disks = {}
+        for part in psutil.disk_partitions():
+            try:
+                usage = psutil.disk_usage(part.mountpoint)
+            except OSError:
+                continue
+            disks[part.device] = {"percent": usage.percent, "free_gb": usage.free // (1024**3),
+                                  "total_gb": usage.total // (1024**3)}
+        return {
+            "system": self.system_info,
+            "admin": self.is_admin,
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "memory_percent": memory.percent,
+            "disks": disks,
+            "backup": self.latest_backup(),
+            "interrupted_run": self.pending_journal() is not None,
+        }
+    
+    def restore_defaults(self):
+        """Значения Windows по умолчанию - когда бэкапа нет"""
+        # Включение Game DVR и Xbox Game Bar
+        self.run_cmd('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\GameDVR" /v AppCaptureEnabled /t REG_DWORD /d 1 /f', "Вкл. Game DVR")
+        self.run_cmd('reg add "HKCU\\Software\\Microsoft\\GameBar" /v AutoGameModeEnabled /t REG_DWORD /d 1 /f', "Вкл. игровой режим")
+        
+        # Включение служб
+        services = ["DiagTrack", "XblAuthManager", "XblGameSave", "SysMain"]
+        for service in services:
+            self.run_cmd(f'sc config "{service}" start= auto', f"Вкл. службу {service}")
+            self.run_cmd(f'net start "{service}" 2>nul', f"Запуск службы {service}")
+        
+        # Восстановление визуальных эффектов
+        if "Windows 11" in self.os_version:
+            self.run_cmd('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\Advanced" /v TaskbarDa /t REG_DWORD /d 1 /f', "Вкл. анимации")
+        
+        self.run_cmd('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\VisualEffects" /v VisualFXSetting /t REG_DWORD /d 3 /f', "Визуальные эффекты")
+    
     def restore_settings(self):
         """Восстановление стандартных настроек"""
         self.print_banner()
@@ -889,49 +5155,295 @@ class WexTweaksGaming:
         if confirm.lower() != 'y':
             return
         
-        # Восстановление стандартной схемы питания
-        self.run_cmd('powercfg /setactive 381b4222-f694-41f0-9685-ff5bb260df2e', "Стандартная схема питания", 0)
+        self.restore_system()
         
-        # Включение Game DVR и Xbox Game Bar
-        self.run_cmd('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\GameDVR" /v AppCaptureEnabled /t REG_DWORD /d 1 /f', "Вкл. Game DVR", 0)
-        self.run_cmd('reg add "HKCU\\Software\\Microsoft\\GameBar" /v AutoGameModeEnabled /t REG_DWORD /d 1 /f', "Вкл. игровой режим", 0)
+        print(f"\n{Colors.GREEN}✅ Настройки восстановлены к стандартным!")
         
-        # Включение служб
-        services = ["DiagTrack", "XblAuthManager", "XblGameSave", "SysMain"]
-        for service in services:
-            self.run_cmd(f'sc config "{service}" start= auto', f"Вкл. службу {service}", 0)
-            self.run_cmd(f'net start "{service}" 2>nul', f"Запуск службы {service}", 0)
+        restart = input(f"\n{Colors.YELLOW}Перезагрузить компьютер для применения изменений? (y/n): ")
+        if restart.lower() == 'y':
+            self.reboot()
         
-        # Сброс сетевых настроек
-        self.run_cmd('netsh int tcp set global autotuninglevel=normal', "Сброс сети", 0)
-        self.run_cmd('netsh int tcp set global congestionprovider=none', "Сброс провайдера", 0)
+        input(f"\n{Colors.CYAN}Нажмите Enter для продолжения...")
+    
+    def restore_system(self) -> bool:
+        """Восстановление без вопросов: False - часть значений реестра вернуть не удалось"""
+        # Восстановление стандартной схемы питания
+        error = self.power.set_active(POWER_SCHEME_BALANCED)
+        self.log(f"Стандартная схема питания: {error}" if error else "Стандартная схема питания", "warning" if error else "success")
+        # Гибернацию выключает этап питания, если её не оставили ключом hibernate
+        if self.config_power_plan().hibernate is False:
+            error = self.power.set_hibernate(True)
+            self.log(f"Гибернация: {error}" if error else "Гибернация включена", "warning" if error else "success")
         
-        # Восстановление визуальных эффектов
-        if "Windows 11" in self.os_version:
-            self.run_cmd('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\Advanced" /v TaskbarDa /t REG_DWORD /d 1 /f', "Вкл. анимации", 0)
+        # Сброс сетевых настроек (netsh в бэкап реестра не попадает)
+        self.run_cmd('netsh int tcp set global autotuninglevel=normal', "Сброс сети")
+        self.run_cmd('netsh int tcp set global congestionprovider=none', "Сброс провайдера")
+        for interface in self.config.pop("dns_applied", {}):
+            self.run_cmd(f'netsh interface ipv4 set dnsservers name="{interface}" source=dhcp', f"DNS от DHCP для {interface}")
         
-        self.run_cmd('reg add "HKCU\\Software\\Microsoft\\Windows\\CurrentVersion\\Explorer\\VisualEffects" /v VisualFXSetting /t REG_DWORD /d 3 /f', "Визуальные эффекты", 0)
+        # Реестр и типы запуска служб - точно как было до оптимизации, если есть бэкап
+        backup_file = self.latest_backup()
+        if backup_file:
+            restored = self.restore_registry_backup(backup_file)
+        else:
+            self.log("Бэкап не найден - восстанавливаем значения по умолчанию", "warning")
+            self.restore_defaults()
+            restored = True
         
         # Очистка счетчиков
         self.total_optimizations = 0
-        self.estimated_fps_boost = 0
         self.gaming_optimizations = []
         self.save_config()
-        
-        print(f"\n{Colors.GREEN}✅ Настройки восстановлены к стандартным!")
-        
-        restart = input(f"\n{Colors.YELLOW}Перезагрузить компьютер для применения изменений? (y/n): ")
-        if restart.lower() == 'y':
-            self.run_cmd("shutdown /r /t 30", "Перезагрузка через 30 сек", 0)
-            print(f"{Colors.YELLOW}Компьютер перезагрузится через 30 секунд...")
-        
-        input(f"\n{Colors.CYAN}Нажмите Enter для продолжения...")
+        return restored
+
+# ========== КОМАНДНАЯ СТРОКА ==========
+
+EXIT_OK = 0
+EXIT_FAILED = 1  # часть операций не выполнена
+EXIT_USAGE = 2  # ошибка в аргументах или нет --yes
+EXIT_NOT_ADMIN = 3
+EXIT_INTERRUPTED = 130
+
+# Этапы, которые можно запустить по отдельности: метод приложения и описание
+CLI_STAGES = OrderedDict([
+    ("gaming", ("optimize_gaming_mode", "игровой режим и Game DVR")),
+    ("power", ("optimize_power_settings", "схема питания")),
+    ("network", ("optimize_network_settings", "сеть для онлайн-игр")),
+    ("services", ("disable_unneeded_services", "отключение ненужных служб")),
+    ("clean", ("clean_system_temp", "очистка временных файлов")),
+    ("system", ("optimize_system_settings", "системные настройки")),
+    ("gpu", ("apply_gpu_settings", "настройки GPU и дисплея")),
+    ("disk", ("apply_disk_settings", "настройки диска и SSD")),
+])
+
+
+def build_parser() -> "argparse.ArgumentParser":
+    """Разбор аргументов: без команды запускается интерактивное меню"""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--yes", "-y", action="store_true", help="не спрашивать подтверждения (обязателен для изменений)")
+    common.add_argument("--no-reboot", action="store_true", help="не перезагружать компьютер после изменений")
+    common.add_argument("--json", action="store_true", help="результат одним JSON-документом в stdout, журнал - в stderr")
+    common.add_argument("--profile", metavar="FILE", help="куда сохранить профиль прогона (время операций)")
+    
+    parser = argparse.ArgumentParser(prog="WexOptimizer.py", description="WexTweaks Gamer Edition без меню и вопросов")
+    commands = parser.add_subparsers(dest="command", metavar="КОМАНДА")
+    full = commands.add_parser("full", parents=[common], help="полная оптимизация всех этапов")
+    full.add_argument("--fresh", action="store_true", help="не продолжать прерванный прогон, начать заново")
+    full.add_argument("--preset", metavar="NAME", help="только твики профиля (список - команда presets)")
+    full.add_argument("--measure", action="store_true", help="замеры производительности до и после")
+    for name, (_, desc) in CLI_STAGES.items():
+        stage = commands.add_parser(name, parents=[common], help=desc)
+        if name == "network":
+            stage.add_argument("--measure", action="store_true", help="замеры задержки по loopback до и после")
+    commands.add_parser("restore", parents=[common], help="вернуть значения из последнего бэкапа")
+    commands.add_parser("rollback", parents=[common], help="откатить прерванный прогон по журналу")
+    commands.add_parser("info", parents=[common], help="сведения о системе")
+    commands.add_parser("presets", parents=[common], help="профили твиков из каталога")
+    monitor = commands.add_parser("monitor", parents=[common], help="монитор ресурсов (до Ctrl+C или --duration)")
+    monitor.add_argument("--interval", type=float, metavar="S", help=f"секунд между выборками (по умолчанию {MONITOR_INTERVAL})")
+    monitor.add_argument("--duration", type=float, metavar="S", help="сколько секунд опрашивать")
+    monitor.add_argument("--csv", metavar="FILE", help="выгрузить выборки в CSV")
+    watch = commands.add_parser("watch", parents=[common], help="приоритет играм на время их работы (до Ctrl+C или --duration)")
+    watch.add_argument("--interval", type=float, metavar="S", help=f"секунд между проверками (по умолчанию {WATCH_INTERVAL})")
+    watch.add_argument("--duration", type=float, metavar="S", help="сколько секунд следить")
+    watch.add_argument("--session", action="store_true", help="игровая сессия: приостановить фоновые программы и выгрузить их память")
+    net = commands.add_parser("net", parents=[common], help="задержка, джиттер и пропускная способность TCP/UDP")
+    net.add_argument("phase", choices=PERF_PHASES + ("report", "serve"))
+    net.add_argument("--host", help="эхо-сервер (по умолчанию встроенный на loopback)")
+    net.add_argument("--port", type=int, default=ECHO_PORT, help=f"порт эхо-сервера (по умолчанию {ECHO_PORT})")
+    net.add_argument("--count", type=int, metavar="N", help=f"замеров на протокол (по умолчанию {NET_COUNT})")
+    net.add_argument("--rate", type=float, metavar="HZ", help=f"замеров в секунду (по умолчанию {NET_RATE:g})")
+    dns = commands.add_parser("dns", parents=[common], help="замер DNS-серверов и выбор самого быстрого")
+    dns.add_argument("--apply", action="store_true", help="установить лучший сервер для каждого подключения (нужен --yes)")
+    dns.add_argument("--resolver", action="append", metavar="ADDR", help="сервер-кандидат (можно несколько; адрес или адрес:порт)")
+    perf = commands.add_parser("perf", parents=[common], help="замеры до/после оптимизации и сравнение")
+    perf.add_argument("phase", choices=PERF_PHASES + ("report",))
+    perf.add_argument("--preset", metavar="NAME", help="профиль, к которому относятся замеры (по умолчанию full)")
+    perf.add_argument("--repeats", type=int, metavar="N", help=f"повторов каждой метрики (по умолчанию {PERF_REPEATS})")
+    perf.add_argument("--quick", action="store_true", help="уменьшенный объём работы (шире интервалы)")
+    bench = commands.add_parser("bench", parents=[common], help="бенчмарк (работает и вне Windows)")
+    bench.add_argument("name", help="имя бенчмарка (список - в README)")
+    return parser
+
+
+def run_cli(args: "argparse.Namespace") -> int:
+    """Выполнение команды без вопросов и пауз, возвращает код выхода"""
+    if args.command == "bench":
+        # Бенчмарки - в отдельном модуле, он берёт классы отсюда (и при запуске скрипта как __main__)
+        sys.modules.setdefault("WexOptimizer", sys.modules[__name__])
+        import WexBenchmarks
+        if args.name not in WexBenchmarks.BENCHMARKS:
+            print(f"Неизвестный бенчмарк {args.name}: {', '.join(WexBenchmarks.BENCHMARKS)}", file=sys.stderr)
+            return EXIT_USAGE
+        results = WexBenchmarks.run_benchmark(args.name)
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        failed = WexBenchmarks.failed_checks(results)
+        if failed:
+            print(f"Самопроверка не пройдена: {', '.join(failed)}", file=sys.stderr)
+            return EXIT_FAILED
+        return EXIT_OK
+    
+    app = WexTweaksGaming()
+    if args.profile:
+        app.profile_file = args.profile
+    if args.command == "info":
+        emit(args, app.system_report())
+        return EXIT_OK
+    if args.command == "monitor":
+        # С --json строка состояния не выводится - в stdout только итог
+        monitor = app.monitor_resources(args.duration, args.interval, show=not args.json)
+        if args.csv:
+            monitor.ring.to_csv(args.csv)
+        emit(args, {"samples": len(monitor.ring), "interval_s": monitor.interval,
+                    "overhead_percent": round(monitor.overhead_percent, 3), "csv": args.csv,
+                    "stats": monitor.summary()})
+        return EXIT_OK
+    if args.command == "watch":
+        # Все изменения временные и возвращаются при выходе - --yes не нужен
+        if args.interval:
+            app.config["watch_interval"] = args.interval
+        with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+            watcher = app.watch_games(args.duration, session=args.session or None)
+        counts = {}
+        for event in watcher.events:
+            counts[event.kind] = counts.get(event.kind, 0) + 1
+        result = {"ticks": watcher.ticks, "overhead_percent": round(watcher.overhead_percent, 3),
+                  "events": counts, "errors": [event._asdict() for event in watcher.events if event.error]}
+        if isinstance(watcher, GameSession):
+            result["session"] = watcher.stats.as_dict()
+        emit(args, result)
+        return EXIT_OK
+    if args.command == "presets":
+        result = {}
+        for name, profile in app.get_catalog().profiles.items():
+            plan, tasks = app.get_profile_plan(name)
+            result[name] = {"desc": profile.get("desc", ""), "ops": len(plan), "tasks": list(tasks)}
+        emit(args, result)
+        return EXIT_OK
+    
+    preset = getattr(args, "preset", None)
+    if preset and preset not in app.get_catalog().profiles:
+        print(f"Неизвестный профиль: {preset} (список - команда presets)", file=sys.stderr)
+        return EXIT_USAGE
+    if args.command == "net":
+        if args.phase == "serve":
+            # Эхо-сервер для замеров с другой машины: net before --host этот_компьютер
+            with EchoServer(args.host or "0.0.0.0", args.port) as server:
+                print(f"Эхо-сервер TCP/UDP: {server.address[0]}:{server.address[1]} (Ctrl+C - стоп)", file=sys.stderr)
+                with contextlib.suppress(KeyboardInterrupt):
+                    while True:
+                        time.sleep(1)
+            return EXIT_OK
+        for key in ("count", "rate"):
+            if getattr(args, key):
+                app.config[f"net_{key}"] = getattr(args, key)
+        result = {"target": args.host or "loopback", "phase": args.phase}
+        if args.phase != "report":
+            try:
+                with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+                    metrics = app.measure_network(args.phase, args.host, args.port)
+            except OSError as e:
+                print(f"Эхо-сервер недоступен: {e}", file=sys.stderr)
+                return EXIT_FAILED
+            result.update({proto: latency_stats(metrics[f"{proto}_rtt"], metrics[f"{proto}_lost"][0])
+                           for proto in ("tcp", "udp")})
+        result["report"] = {row["metric"]: row for row in app.network_report(args.host)}
+        emit(args, result)
+        return EXIT_OK
+    if args.command == "dns":
+        if args.resolver:
+            app.config["dns_resolvers"] = args.resolver
+        if args.apply and not args.yes:
+            print("Установка DNS меняет настройки системы: добавьте --yes", file=sys.stderr)
+            return EXIT_USAGE
+        if args.apply and not app.is_admin:
+            print("Требуются права администратора!", file=sys.stderr)
+            return EXIT_NOT_ADMIN
+        with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+            results = app.benchmark_dns()
+            applied = app.apply_dns(results) if args.apply else {}
+        emit(args, {"interfaces": {interface: [result.as_dict() for result in ranked]
+                                   for interface, ranked in results.items()}, "applied": applied})
+        return EXIT_OK
+    if args.command == "perf":
+        # Замеры ничего не меняют в системе - ни --yes, ни прав администратора не нужно
+        if args.phase != "report":
+            with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+                app.measure_performance(args.phase, preset, args.repeats, args.quick)
+        rows = app.performance_report(preset)
+        emit(args, {"machine": app.machine_id, "profile": preset or "full", "phase": args.phase,
+                    "file": app.perf_file, "report": {row["metric"]: row for row in rows}})
+        return EXIT_OK
+    
+    if not args.yes:
+        print(f"Команда {args.command} меняет настройки системы: добавьте --yes", file=sys.stderr)
+        return EXIT_USAGE
+    if not app.is_admin:
+        print("Требуются права администратора!", file=sys.stderr)
+        emit(args, {"command": args.command, "ok": False, "error": "not_admin"})
+        return EXIT_NOT_ADMIN
+    
+    started = time.perf_counter()
+    result = {"command": args.command}
+    # В режиме --json весь вывод движка уходит в stderr, в stdout - только результат
+    with contextlib.redirect_stdout(sys.stderr if args.json else sys.stdout):
+        if args.command == "full":
+            resume = None if args.fresh else app.pending_journal()
+            if resume is not None:
+                preset = resume.preset
+            if args.measure and resume is None:
+                app.measure_performance("before", preset)
+            report = app.run_full_optimization(resume, preset)
+            app.print_profile()
+            if args.measure:
+                app.measure_performance("after", preset)
+                result.update(measured={row["metric"]: row for row in app.performance_report(preset)})
+            else:
+                result.update(measured=None)  # не измерено
+            ok = not report.failures()
+            result.update(preset=preset, resumed=resume is not None,
+                          stages_s={stage: round(t, 3) for stage, t in report.stage_times().items()},
+                          skipped=sum(report.skipped.values()), errors=report.errors)
+        elif args.command == "rollback":
+            state = app.pending_journal()
+            ok = state is None or app.rollback_journal(state)
+            result.update(rolled_back=state is not None)
+        elif args.command == "restore":
+            ok = app.restore_system()
+        else:
+            app.profile = RunProfile()
+            measure = getattr(args, "measure", False)
+            if measure:
+                app.measure_network("before")
+            # Для очистки False значит "нечего удалять" - это не ошибка
+            ok = bool(getattr(app, CLI_STAGES[args.command][0])()) or args.command == "clean"
+            app.print_profile()
+            if measure:
+                app.measure_network("after")
+                result.update(measured={row["metric"]: row for row in app.network_report()})
+        reboot = ok and args.command in ("full", "restore") and not args.no_reboot
+        if reboot:
+            app.reboot()
+    
+    result.update(ok=ok, optimizations=app.total_optimizations, reboot=reboot,
+                  wall_s=round(time.perf_counter() - started, 3), profile=app.profile_file)
+    emit(args, result)
+    return EXIT_OK if ok else EXIT_FAILED
+
+
+def emit(args: "argparse.Namespace", result: Dict):
+    """Вывод результата команды: JSON или строки вида ключ: значение"""
+    if args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False, default=str))
+        return
+    for key, value in result.items():
+        print(f"{key}: {json.dumps(value, ensure_ascii=False, default=str) if isinstance(value, (dict, list)) else value}")
+
 
 def main():
     """Главная функция"""
     try:
         print(f"{Colors.CYAN}Загрузка WexTweaks Gamer Edition v5.0...")
-        time.sleep(1)
         
         app = WexTweaksGaming()
         
@@ -949,20 +5461,18 @@ def main():
                 app.full_optimization()
             elif choice == '2':
                 app.optimize_gaming_mode()
-                input(f"\n{Colors.CYAN}Нажмите Enter...")
+                app.watch_menu()
             elif choice == '3':
                 app.optimize_gpu_settings()
             elif choice == '4':
                 app.optimize_disk_settings()
             elif choice == '5':
-                app.optimize_network_settings()
-                input(f"\n{Colors.CYAN}Нажмите Enter...")
+                app.network_menu()
             elif choice == '6':
                 app.disable_unneeded_services()
                 input(f"\n{Colors.CYAN}Нажмите Enter...")
             elif choice == '7':
-                app.clean_system_temp()
-                input(f"\n{Colors.CYAN}Нажмите Enter...")
+                app.clean_menu()
             elif choice == '8':
                 app.show_system_info()
             elif choice == '9':
@@ -990,11 +5500,30 @@ if __name__ == "__main__":
         print("Требуется Python 3.7 или выше!")
         sys.exit(1)
     
-    # Проверка Windows
-    if platform.system() != "Windows":
+    # Прежний вызов --bench ИМЯ - то же, что команда bench
+    argv = sys.argv[1:]
+    if argv[:1] == ["--bench"]:
+        argv = ["bench"] + argv[1:]
+    args = build_parser().parse_args(argv)
+    
+    # Бенчмарки работают и вне Windows (бэкенд реестра в памяти)
+    if args.command == "bench":
+        sys.exit(run_cli(args))
+    
+    # Проверка Windows (с WEXTWEAKS_BACKEND=fake программа работает на имитации и вне её)
+    if not IS_WINDOWS and os.environ.get(BACKEND_ENV) != "fake":
         print("Эта программа работает только на Windows!")
+        print(f"Для проверки вне Windows: {BACKEND_ENV}=fake python WexOptimizer.py")
         sys.exit(1)
     
+    # Команда без меню: ни вопросов, ни пауз, результат - в коде выхода
+    if args.command:
+        try:
+            sys.exit(run_cli(args))
+        except KeyboardInterrupt:
+            print("Прервано: незавершённый прогон можно откатить командой rollback", file=sys.stderr)
+            sys.exit(EXIT_INTERRUPTED)
+    
     # Установка colorama если не установлен
     if not COLORAMA_AVAILABLE:
         print("Устанавливаем необходимые библиотеки...")
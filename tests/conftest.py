@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Файлы приложения (конфиг, кэши, журнал, профиль) пишутся во временную папку"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
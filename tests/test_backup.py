@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from WexOptimizer import MemoryRegistryBackend, RegistryBackup, RegTweak, apply_registry_tweaks
+
+KEY = "Software\\WexTweaks\\Test"
+
+
+def tweak(value, reg_type, data, key=KEY):
+    return RegTweak("HKEY_CURRENT_USER", key, value, reg_type, data)
+
+
+# Что было в системе до оптимизации
+BEFORE = [
+    tweak("Dword", "REG_DWORD", 7),
+    tweak("Text", "REG_SZ", "старое значение"),
+    tweak("Blob", "REG_BINARY", b"\x00\x01\xfe\xff"),
+    tweak("Qword", "REG_QWORD", 1 << 40),
+    tweak("Multi", "REG_MULTI_SZ", ["a", "b"]),
+    # Тип, которого нет в REG_TYPES (REG_NONE): query_value в Windows возвращает его номером
+    tweak("Raw", "0", b"\x10\x20"),
+    tweak("Empty", "REG_BINARY", None),
+]
+# Что записывает план: те же значения с другими данными и значения, которых раньше не было
+PLAN = [
+    tweak("Dword", "REG_DWORD", 0),
+    tweak("Text", "REG_SZ", "новое"),
+    tweak("Blob", "REG_BINARY", b"\x01"),
+    tweak("Qword", "REG_QWORD", 0),
+    tweak("Multi", "REG_MULTI_SZ", []),
+    tweak("Raw", "REG_DWORD", 1),
+    tweak("Empty", "REG_BINARY", b"\x02"),
+    tweak("Absent", "REG_DWORD", 1),
+    tweak("Absent", "REG_SZ", "x", key=KEY + "\\New"),
+]
+
+
+def snapshot(backend):
+    return {key: dict(values) for key, values in backend.keys.items() if values}
+
+
+def test_capture_marks_absent_values():
+    backend = MemoryRegistryBackend()
+    apply_registry_tweaks(backend, BEFORE)
+    backup = RegistryBackup.capture(backend, PLAN + PLAN[:2])
+    assert len(backup) == len(PLAN)  # повторы читаются один раз
+    absent = [t.value for t in backup.values if t.type is None]
+    assert absent == ["Absent", "Absent"]
+
+
+def test_save_load_restore_round_trip(tmp_path):
+    backend = MemoryRegistryBackend()
+    apply_registry_tweaks(backend, BEFORE)
+    before = snapshot(backend)
+    path = str(tmp_path / "registry_backup.json")
+    RegistryBackup.capture(backend, PLAN, preset="full").save(path)
+    
+    assert all(error is None for _, error in apply_registry_tweaks(backend, PLAN))
+    assert snapshot(backend) != before
+    
+    loaded = RegistryBackup.load(path)
+    assert loaded.meta == {"preset": "full"}
+    assert [error for _, error in loaded.restore(backend)] == [None] * len(PLAN)
+    assert snapshot(backend) == before
+
+
+def test_binary_and_raw_types_are_stored_as_hex(tmp_path):
+    backend = MemoryRegistryBackend()
+    apply_registry_tweaks(backend, BEFORE)
+    path = str(tmp_path / "registry_backup.json")
+    RegistryBackup.capture(backend, PLAN).save(path)
+    with open(path, encoding="utf-8") as f:
+        items = {value: (reg_type, data) for value, reg_type, data in json.load(f)["keys"][0][2]}
+    assert items["Blob"] == ("REG_BINARY", "0001feff")
+    assert items["Raw"] == ("0", "1020")
+    assert items["Empty"] == ("REG_BINARY", None)
+
+
+def test_load_rejects_foreign_file(tmp_path):
+    path = tmp_path / "other.json"
+    path.write_text(json.dumps({"format": "something-else", "version": 1, "keys": []}), encoding="utf-8")
+    with pytest.raises(ValueError):
+        RegistryBackup.load(str(path))
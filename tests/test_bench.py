@@ -0,0 +1,23 @@
+import pytest
+
+import WexBenchmarks
+from WexOptimizer import EXIT_FAILED, EXIT_OK, EXIT_USAGE, build_parser, run_cli
+
+
+def test_failed_checks_walk_nested_results():
+    results = {"exact": True, "batch": {"verified": False}, "false_positives": ["cpu"], "failed": 0}
+    assert WexBenchmarks.failed_checks(results) == ["batch.verified", "false_positives"]
+
+
+@pytest.mark.parametrize("results, code", [
+    ({"exact": True, "speedup": 3.0}, EXIT_OK),
+    ({"rollback_exact": False}, EXIT_FAILED),
+    ({"ranking_matches_injected": False}, EXIT_FAILED),
+])
+def test_bench_exit_code_follows_self_checks(monkeypatch, results, code):
+    monkeypatch.setitem(WexBenchmarks.BENCHMARKS, "stub", lambda: results)
+    assert run_cli(build_parser().parse_args(["bench", "stub"])) == code
+
+
+def test_unknown_bench_is_usage_error():
+    assert run_cli(build_parser().parse_args(["bench", "nope"])) == EXIT_USAGE
@@ -0,0 +1,36 @@
+import pytest
+
+from WexBenchmarks import StandInDnsServer
+from WexOptimizer import DNS_MAX_FAILURES, benchmark_resolvers
+
+
+@pytest.fixture
+def servers(request):
+    started = [StandInDnsServer(*params).start() for params in request.param]
+    yield started
+    for server in started:
+        server.stop()
+
+
+@pytest.mark.parametrize("servers", [[(0.04, 0.015), (0.002, 0.0005), (0.08, 0.03)]], indirect=True)
+def test_ranking_follows_injected_latency(servers):
+    ranked = benchmark_resolvers(tuple(server.address for server in servers), rounds=2)
+    assert [result.resolver for result in ranked] == [servers[i].address for i in (1, 0, 2)]
+    assert all(result.failures == 0 for result in ranked)
+
+
+@pytest.mark.parametrize("servers", [[(0.002, 0.0005, 0.5), (0.002, 0.0005)]], indirect=True)
+def test_lost_queries_are_counted(servers):
+    ranked = benchmark_resolvers(tuple(server.address for server in servers), rounds=2, timeout=0.3)
+    by_address = {result.resolver: result for result in ranked}
+    lossy, clean = by_address[servers[0].address], by_address[servers[1].address]
+    assert lossy.failures > 0 and lossy.failure_rate > DNS_MAX_FAILURES
+    assert clean.failures == 0
+    assert [result.resolver for result in ranked] == [clean.resolver, lossy.resolver]
+
+
+@pytest.mark.parametrize("servers", [[(0.05, 0.002)]], indirect=True)
+def test_cached_answers_are_faster_than_cold(servers):
+    result, = benchmark_resolvers((servers[0].address,), rounds=2)
+    assert result.cached_ms < result.cold_ms
+    assert result.cold_ms >= 50
@@ -0,0 +1,127 @@
+import os
+
+import pytest
+
+from WexOptimizer import (FULL_STAGES, POWER_SCHEME_BALANCED, POWER_SCHEME_WEX, ApplyJournal, FakeExecutor,
+                          FakePowerBackend, MemoryRegistryBackend, RegTweak, SimulatedServiceBackend, Task,
+                          WexTweaksGaming, apply_registry_tweaks, service_start_tweak)
+
+
+def tweak(value, data):
+    return RegTweak("HKEY_CURRENT_USER", "Software\\WexTweaks\\Test", value, "REG_DWORD", data)
+
+
+@pytest.fixture
+def app():
+    app = WexTweaksGaming()
+    app.registry = MemoryRegistryBackend()
+    app.executor = FakeExecutor(0.0)
+    app.power = FakePowerBackend()
+    app.log_file = os.devnull
+    return app
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = ApplyJournal(path, durable=False)
+    journal.begin(("gaming", "power"))
+    journal.write_ahead("gaming.reg", [tweak("A", 1)], power_scheme=POWER_SCHEME_BALANCED)
+    journal.commit("gaming.reg", ["gaming.a"])
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"t":"before","task":"power","keys":[["HKEY_CURRENT_USER","Softw')  # обрыв записи
+    
+    state = ApplyJournal.read(path)
+    assert state.stages == ["gaming", "power"]
+    assert state.registry == [tweak("A", 1)]
+    assert state.power_scheme == POWER_SCHEME_BALANCED
+    assert (state.done_tasks, state.done_ops) == (["gaming.reg"], ["gaming.a"])
+    assert not state.finished
+
+
+def test_resume_keeps_begin_stages_and_preset(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = ApplyJournal(path, durable=False)
+    journal.begin(("gaming", "network"), preset="competitive")
+    journal.write_ahead("gaming.reg", [tweak("A", 1)])
+    journal.commit("gaming.reg", ["gaming.a"])
+    journal.close()
+    
+    # Продолжение: дописывается, в заголовке - только оставшиеся этапы
+    journal = ApplyJournal(path, durable=False)
+    journal.begin(("network",), resume=True, preset="competitive")
+    journal.write_ahead("network.reg", [tweak("A", 2), RegTweak("HKEY_CURRENT_USER", "Software\\WexTweaks\\Test", "B", None, None)])
+    journal.commit("network.reg", ["network.b"])
+    journal.close()
+    
+    state = ApplyJournal.read(path)
+    assert state.stages == ["gaming", "network"]
+    assert state.preset == "competitive"
+    assert state.done_tasks == ["gaming.reg", "network.reg"]
+    # Для каждого значения остаётся первая запись - состояние до всего прогона
+    assert [(t.value, t.data) for t in state.registry] == [("A", 1), ("B", None)]
+    assert not state.finished
+
+
+@pytest.mark.parametrize("status", ["end", "rollback"])
+def test_finished_after_end_and_rollback(tmp_path, status):
+    path = str(tmp_path / "journal.jsonl")
+    journal = ApplyJournal(path, durable=False)
+    journal.begin(FULL_STAGES)
+    journal.write_ahead("gaming.reg", [tweak("A", 1)])
+    assert not ApplyJournal.read(path).finished
+    journal.finish(status)
+    journal.close()
+    assert ApplyJournal.read(path).finished
+    
+    # Завершить можно и без открытого журнала (так пишет откат)
+    journal = ApplyJournal(path, durable=False)
+    journal.begin(FULL_STAGES, resume=True)
+    journal.close()
+    assert not ApplyJournal.read(path).finished
+    ApplyJournal(path, durable=False).finish(status)
+    assert ApplyJournal.read(path).finished
+
+
+def test_missing_or_empty_journal(tmp_path):
+    assert ApplyJournal.read(str(tmp_path / "nope.jsonl")) is None
+    (tmp_path / "empty.jsonl").write_text("", encoding="utf-8")
+    assert ApplyJournal.read(str(tmp_path / "empty.jsonl")) is None
+
+
+def test_rollback_restores_registry_services_and_power(app):
+    plan = app.get_plan(FULL_STAGES)
+    services = [op.target for op in plan if op.kind == "service"]
+    assert services
+    app.services = SimulatedServiceBackend(tuple(services), stop_latency=0.0)
+    
+    # До оптимизации: часть значений есть с другими данными, службы запускаются автоматически
+    tweaks = app.plan_registry_values(plan)
+    existing = [t._replace(data=t.data + 1) for t in tweaks[::2] if t.type == "REG_DWORD"]
+    apply_registry_tweaks(app.registry, existing + [service_start_tweak(s)._replace(data=2) for s in services])
+    before = {key: dict(values) for key, values in app.registry.keys.items()}
+    assert app.power.active() == POWER_SCHEME_BALANCED
+    
+    app.journal = ApplyJournal(app.journal_file)
+    app.journal.begin(FULL_STAGES)
+    report = app.run_plan(plan, [Task("power", "power", app.optimize_power_settings)])
+    app.journal.close()
+    app.journal = None
+    assert not report.errors
+    # Диспетчер служб в Windows записывает Start = 4 в реестр - имитируем это
+    apply_registry_tweaks(app.registry, [service_start_tweak(s) for s in services])
+    assert app.power.active() == POWER_SCHEME_WEX
+    assert app.registry.keys != before
+    
+    # Прогон не отмечен завершённым - как после обрыва
+    state = app.pending_journal()
+    assert state is not None and state.power_scheme == POWER_SCHEME_BALANCED
+    assert app.rollback_journal(state)
+    
+    restored = {key: values for key, values in app.registry.keys.items() if values or key in before}
+    assert restored == before
+    for service in services:
+        start = service_start_tweak(service)
+        assert app.registry.query_value(app.registry.open_key(start.hive, start.key), "Start") == (2, "REG_DWORD")
+    assert app.power.active() == POWER_SCHEME_BALANCED
+    assert app.pending_journal() is None
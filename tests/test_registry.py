@@ -0,0 +1,53 @@
+from WexOptimizer import (MemoryRegistryBackend, RegTweak, apply_registry_tweaks, parse_reg_add,
+                          read_registry_values)
+
+
+def test_parse_quoted_key_value_and_data():
+    tweak = parse_reg_add('reg add "HKLM\\SOFTWARE\\My Key" /v "Some Value" /t REG_SZ /d "hello world" /f')
+    assert tweak == RegTweak("HKEY_LOCAL_MACHINE", "SOFTWARE\\My Key", "Some Value", "REG_SZ", "hello world")
+
+
+def test_parse_hex_and_decimal_dword():
+    assert parse_reg_add('reg add "HKCU\\Software\\X" /v A /t REG_DWORD /d 0xffffffff /f').data == 0xFFFFFFFF
+    assert parse_reg_add('reg add "HKCU\\Software\\X" /v A /t REG_DWORD /d 0x10 /f').data == 16
+    assert parse_reg_add('reg add "HKCU\\Software\\X" /v A /t REG_DWORD /d 38 /f').data == 38
+    assert parse_reg_add('reg add "HKCU\\Software\\X" /v A /t REG_QWORD /d 0x100000000 /f').data == 1 << 32
+
+
+def test_parse_missing_type_defaults_to_sz():
+    tweak = parse_reg_add('reg add "HKCU\\Control Panel\\Desktop" /v MenuShowDelay /d 0 /f')
+    assert (tweak.type, tweak.data) == ("REG_SZ", "0")
+
+
+def test_parse_default_value_binary_and_multi_sz():
+    assert parse_reg_add('reg add "HKCU\\Software\\X" /ve /d text /f').value == ""
+    assert parse_reg_add('reg add "HKCU\\Software\\X" /v B /t REG_BINARY /d 0a0b /f').data == b"\x0a\x0b"
+    assert parse_reg_add('reg add "HKCU\\Software\\X" /v M /t REG_MULTI_SZ /d a\\0b /f').data == ["a", "b"]
+
+
+def test_parse_rejects_what_reg_exe_must_handle():
+    assert parse_reg_add('reg add "HKCU\\Software\\X" /v A /t REG_DWORD /d 1 /reg:32 /f') is None
+    assert parse_reg_add('reg add "HKCU\\Software\\X" /v A /t REG_DWORD /d nope /f') is None
+    assert parse_reg_add('reg add "HKCU\\Software\\X" /v A /t REG_FOO /d 1 /f') is None
+    assert parse_reg_add('reg add "HKXX\\Software\\X" /v A /d 1 /f') is None
+    assert parse_reg_add('reg delete "HKCU\\Software\\X" /v A /f') is None
+    assert parse_reg_add('reg add "HKCU\\Software\\X" /f') is None
+
+
+def test_apply_opens_each_key_once():
+    tweaks = [RegTweak("HKEY_CURRENT_USER", key, f"V{i}", "REG_DWORD", i)
+              for i, key in enumerate(["Software\\A", "Software\\B", "SOFTWARE\\a", "Software\\b", "Software\\A"])]
+    backend = MemoryRegistryBackend()
+    results = apply_registry_tweaks(backend, tweaks)
+    assert [error for _, error in results] == [None] * len(tweaks)
+    assert backend.opened == 2  # ключи сравниваются без учёта регистра
+    assert backend.writes == len(tweaks)
+    assert read_registry_values(backend, tweaks) == [(i, "REG_DWORD") for i in range(len(tweaks))]
+
+
+def test_read_missing_key_and_value():
+    backend = MemoryRegistryBackend()
+    apply_registry_tweaks(backend, [RegTweak("HKEY_CURRENT_USER", "Software\\A", "Here", "REG_SZ", "x")])
+    missing = [RegTweak("HKEY_CURRENT_USER", "Software\\A", "Gone", "REG_SZ", ""),
+               RegTweak("HKEY_CURRENT_USER", "Software\\Nope", "Gone", "REG_SZ", "")]
+    assert read_registry_values(backend, missing) == [None, None]
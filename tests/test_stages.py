@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from WexOptimizer import FakeExecutor, FakePowerBackend, MemoryRegistryBackend, SimulatedServiceBackend, WexTweaksGaming
+
+
+class ReadOnlyRegistry(MemoryRegistryBackend):
+    """Реестр, в который нельзя записать ни одного значения"""
+    
+    def set_value(self, handle, value, reg_type, data):
+        raise OSError("Отказано в доступе")
+
+
+@pytest.fixture
+def app():
+    app = WexTweaksGaming()
+    app.registry = MemoryRegistryBackend()
+    app.executor = FakeExecutor(0.0)
+    app.power = FakePowerBackend()
+    app.services = SimulatedServiceBackend(stop_latency=0.0)
+    app.log_file = os.devnull
+    return app
+
+
+def test_absent_services_are_not_failures(app):
+    assert app.disable_unneeded_services()
+
+
+def test_running_services_are_disabled(app):
+    services = [op.target for op in app.get_plan(("services",))]
+    app.services = SimulatedServiceBackend(running=tuple(services[:3]), stop_latency=0.0)
+    assert app.disable_unneeded_services()
+
+
+@pytest.mark.parametrize("stage", ["optimize_gaming_mode", "optimize_system_settings", "apply_gpu_settings"])
+def test_stage_succeeds_without_failures(app, stage):
+    assert getattr(app, stage)()
+
+
+def test_failed_registry_write_fails_stage(app):
+    app.registry = ReadOnlyRegistry()
+    assert not app.optimize_gaming_mode()
+    report = app.run_plan(app.get_plan(("gaming",)))
+    assert report.failures("gaming") == sum(1 for op in app.get_plan(("gaming",)) if op.kind == "reg")
+
+
+def test_restore_reenables_hibernation(app):
+    assert app.optimize_power_settings()
+    assert app.power.hibernate is False
+    app.restore_system()
+    assert app.power.hibernate is True
+
+
+def test_restore_keeps_hibernation_left_by_config(app):
+    app.config["hibernate"] = True
+    app.power.hibernate = False  # выключена самим пользователем
+    assert app.optimize_power_settings()
+    app.restore_system()
+    assert app.power.hibernate is False